@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Protocol, Tuple, Union
+
+from model_def import (
+    BroadcastAction,
+    ConversationAction,
+    ReminderAction,
+    ReminderPayload,
+    ReminderPayloadParameters,
+)
+from trigger_runtime import TriggerEvent
+
+if TYPE_CHECKING:
+    from audit_log import AuditLog
+    from notification_throttle import NotificationThrottle
+
+
+Action = Union[ReminderAction, BroadcastAction, ConversationAction]
+
+
+@dataclass
+class FiredAction:
+    """
+    One action waiting for delivery. `enqueued_at` is a perf_counter() value.
+    """
+
+    home_id: str
+    trigger_id: str
+    action: Action
+    priority: int
+    enqueued_at: float
+    cancel: bool = False
+
+
+@dataclass
+class DeliveryBatch:
+    """
+    What a transport receives.
+
+    kind is "reminder", "reminder_cancel", "broadcast" or "conversation".
+    Broadcasts are batched per (location, topicName); everything else is
+    one message per batch, addressed by `key` (the client/home id).
+    """
+
+    kind: str
+    key: Tuple[str, ...]
+    priority: int
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    items: List[FiredAction] = field(default_factory=list, repr=False)
+
+
+class Transport(Protocol):
+    async def send(self, batch: DeliveryBatch) -> None: ...
+
+
+class InMemoryBroker:
+    """
+    Stand-in transport that keeps every delivered batch in memory, and lets
+    consumers await them per topic. Useful for tests and local runs.
+    """
+
+    def __init__(self) -> None:
+        self.delivered: List[DeliveryBatch] = []
+        self._subscribers: Dict[Tuple[str, ...], List[asyncio.Queue]] = {}
+
+    def subscribe(self, kind: str, *key: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault((kind, *key), []).append(queue)
+        return queue
+
+    async def send(self, batch: DeliveryBatch) -> None:
+        self.delivered.append(batch)
+        for queue in self._subscribers.get((batch.kind, *batch.key), []):
+            queue.put_nowait(batch)
+
+
+class FileBroker:
+    """
+    Stand-in transport that appends one JSON line per batch to a file.
+    Writes run in a worker thread so the event loop never blocks on disk.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def _write(self, line: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(line)
+
+    async def send(self, batch: DeliveryBatch) -> None:
+        line = json.dumps({
+            "kind": batch.kind,
+            "key": list(batch.key),
+            "priority": batch.priority,
+            "messages": batch.messages,
+        }) + "\n"
+        await asyncio.to_thread(self._write, line)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+class ActionDispatcher:
+    """
+    Delivers the actions of fired triggers, highest priority first.
+
+    submit()/submit_event() push onto a priority heap (ReminderAction.priority;
+    broadcast and conversation actions inherit the highest reminder priority of
+    the same trigger). The dispatch loop drains up to `max_batch` actions at a
+    time, groups broadcasts per (location, topicName), and sends the batches
+    concurrently, launching higher-priority batches first, with at most
+    `max_in_flight` sends outstanding.
+
+    With a NotificationThrottle, reminders pass through it first; held
+    reminders are released (merged) as the per-home buckets refill.
+
+    With an AuditLog, every delivered or failed action is recorded there.
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        max_batch: int = 256,
+        max_in_flight: int = 32,
+        latency_window: int = 10000,
+        throttle: Optional["NotificationThrottle"] = None,
+        audit: Optional["AuditLog"] = None,
+    ) -> None:
+        self.transport = transport
+        self.throttle = throttle
+        self.audit = audit
+        self.max_batch = max_batch
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._heap: List[Tuple[int, int, FiredAction]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self.delivered = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._heap)
+
+    def submit(self, item: FiredAction) -> None:
+        if self.throttle is not None:
+            released = self.throttle.offer(item, time.perf_counter())
+            if released is None:
+                # Wake the loop so it re-arms its timer for the throttle.
+                self._wakeup.set()
+                return
+            item = released
+        self._push(item)
+
+    def _push(self, item: FiredAction) -> None:
+        heapq.heappush(self._heap, (-item.priority, next(self._seq), item))
+        if len(self._heap) > self.max_queue_depth:
+            self.max_queue_depth = len(self._heap)
+        self._wakeup.set()
+
+    def submit_event(self, home_id: str, event: TriggerEvent) -> int:
+        """
+        Queue the actions of a runtime event. Fire events queue every action;
+        cancel events queue an end signal for reminders with cancel_signal set.
+        Returns the number of actions queued.
+        """
+        now = time.perf_counter()
+        reminder_priorities = [a.priority for a in event.actions if isinstance(a, ReminderAction)]
+        default_priority = max(reminder_priorities, default=0)
+        count = 0
+        for action in event.actions:
+            priority = action.priority if isinstance(action, ReminderAction) else default_priority
+            if event.kind == "cancel":
+                if not (isinstance(action, ReminderAction) and action.cancel_signal):
+                    continue
+                self.submit(FiredAction(home_id, event.trigger_id, action, priority, now, cancel=True))
+            else:
+                self.submit(FiredAction(home_id, event.trigger_id, action, priority, now))
+            count += 1
+        return count
+
+    def _take(self) -> List[FiredAction]:
+        items = []
+        while self._heap and len(items) < self.max_batch:
+            items.append(heapq.heappop(self._heap)[2])
+        return items
+
+    @staticmethod
+    def _group(items: List[FiredAction]) -> List[DeliveryBatch]:
+        batches: List[DeliveryBatch] = []
+        broadcasts: Dict[Tuple[str, str], DeliveryBatch] = {}
+        for item in items:
+            action = item.action
+            if isinstance(action, BroadcastAction):
+                key = (action.location, action.topicName)
+                batch = broadcasts.get(key)
+                if batch is None:
+                    batch = DeliveryBatch("broadcast", key, item.priority)
+                    broadcasts[key] = batch
+                    batches.append(batch)
+                batch.messages.append({
+                    "home_id": item.home_id,
+                    "trigger_id": item.trigger_id,
+                    "eventName": action.eventName,
+                    "payload": action.payload,
+                })
+                batch.items.append(item)
+            elif isinstance(action, ReminderAction):
+                client_id = action.device_id or item.home_id
+                payload = ReminderPayload(
+                    clientId=client_id,
+                    parameters=ReminderPayloadParameters(
+                        title=action.title,
+                        content=action.content,
+                        priority=action.priority,
+                    ),
+                )
+                batches.append(DeliveryBatch(
+                    "reminder_cancel" if item.cancel else "reminder",
+                    (client_id,),
+                    item.priority,
+                    [payload.model_dump()],
+                    [item],
+                ))
+            else:
+                batches.append(DeliveryBatch(
+                    "conversation",
+                    (item.home_id,),
+                    item.priority,
+                    [{"trigger_id": item.trigger_id, **action.model_dump()}],
+                    [item],
+                ))
+        # Items arrive in priority order, so batches already are; keep it stable.
+        batches.sort(key=lambda b: -b.priority)
+        return batches
+
+    def _audit(self, batch: DeliveryBatch, status: str) -> None:
+        if self.audit is None:
+            return
+        for item in batch.items:
+            self.audit.log("action", item.home_id, item.trigger_id, data={
+                "status": status,
+                "batch": batch.kind,
+                "action": item.action.model_dump(),
+            })
+
+    async def _send(self, batch: DeliveryBatch) -> None:
+        try:
+            await self.transport.send(batch)
+        except Exception as exc:
+            self.failed += len(batch.items)
+            print(f"[DISPATCH] {batch.kind} {batch.key} failed: {exc}")
+            self._audit(batch, "failed")
+        else:
+            done = time.perf_counter()
+            self.delivered += len(batch.items)
+            self._latencies.extend(done - item.enqueued_at for item in batch.items)
+            self._audit(batch, "delivered")
+        finally:
+            self._semaphore.release()
+
+    async def drain(self) -> int:
+        """
+        Deliver everything currently queued and wait for the sends to finish.
+        Returns the number of actions attempted.
+        """
+        return await self._drain(until_stopped=False)
+
+    async def _drain(self, until_stopped: bool) -> int:
+        # The run loop stops between batches once stop() is called; a batch
+        # taken off the heap is always sent in full.
+        attempted = 0
+        if self.throttle is not None:
+            for item in self.throttle.flush(time.perf_counter()):
+                self._push(item)
+        while self._heap and not (until_stopped and self._stopping):
+            items = self._take()
+            attempted += len(items)
+            sends = []
+            for batch in self._group(items):
+                await self._semaphore.acquire()
+                sends.append(asyncio.create_task(self._send(batch)))
+            await asyncio.gather(*sends)
+        return attempted
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            timeout = None
+            if self.throttle is not None:
+                now = time.perf_counter()
+                ready_at = self.throttle.next_ready_at(now)
+                if ready_at is not None:
+                    timeout = max(0.0, ready_at - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping:
+                await self._drain(until_stopped=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, flush: bool = True) -> None:
+        """
+        Stop the dispatch loop once its batch in progress is sent (never
+        cancelling it mid-batch), then, with `flush`, deliver what is left.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._stopping = False
+        if flush:
+            await self.drain()
+
+    def metrics(self) -> Dict[str, float]:
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "latency_p50_ms": _percentile(latencies, 0.50) * 1000,
+            "latency_p99_ms": _percentile(latencies, 0.99) * 1000,
+            "latency_max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        }
+
+
+if __name__ == "__main__":
+    import datetime
+    import random
+
+    async def _bench(n_events: int = 5000) -> None:
+        broker = InMemoryBroker()
+        dispatcher = ActionDispatcher(broker)
+        dispatcher.start()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for i in range(n_events):
+            priority = random.randint(1, 5)
+            dispatcher.submit_event(f"home_{i % 20}", TriggerEvent("fire", f"trigger_{i}", now, [
+                ReminderAction(title="fridge open", content="close the fridge", priority=priority),
+                BroadcastAction(location="kitchen", eventName="fridge_open", topicName="home/alerts", payload={}),
+            ]))
+        t0 = time.perf_counter()
+        await dispatcher.stop()
+        elapsed = time.perf_counter() - t0
+        print(f"[DISPATCH] {dispatcher.delivered} actions in {elapsed:.3f}s "
+              f"({len(broker.delivered)} batches)", dispatcher.metrics())
+
+    asyncio.run(_bench())
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import datetime
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sensor_catalog import DATA_DIR, SensorCatalog, SensorInfo, load_data_json
+from sensor_history import SensorHistory
+from time_windows import TimeWindowIndex
+
+
+# How much one event in the window counts towards its room.
+_MODALITY_WEIGHT = {"motion": 1.0, "contact": 2.0, "power": 0.0}
+# Weight of a room while one of its power sensors is drawing power.
+_POWER_ON_WEIGHT = 3.0
+# Cooking for a meal starts up to this long before the meal window.
+_COOKING_LEAD = datetime.timedelta(minutes=45)
+
+_MEALS = ("breakfast", "lunch", "dinner")
+
+
+class _SensorState:
+    __slots__ = ("info", "value", "changed_at")
+
+    def __init__(self, info: SensorInfo) -> None:
+        self.info = info
+        self.value: Any = None
+        self.changed_at: Optional[float] = None
+
+
+class ActivityDetector:
+    """
+    Incremental activity inference from raw motion, contact and power events.
+
+    update() is amortized O(1): every event goes into one time-ordered window
+    deque, per-room scores are running sums adjusted as events enter and
+    expire, and power sensors contribute while they are on. context() picks the
+    busiest room and maps it, with the meal and bedtime windows from
+    user_prefs.json (through a TimeWindowIndex), onto an activity name from
+    activities.json.
+
+    The context has the shape generated triggers expect in `activity_data`:
+    {"current", "previous", "room", "since", "scores"}.
+
+    When given a SensorHistory, every reading is also recorded there by path.
+    """
+
+    def __init__(
+        self,
+        catalog: SensorCatalog,
+        activities: Dict[str, Any],
+        user_prefs: Dict[str, Any],
+        window_seconds: float = 300.0,
+        power_threshold: float = 5.0,
+        history: Optional[SensorHistory] = None,
+    ) -> None:
+        self.catalog = catalog
+        self.history = history
+        self.window_seconds = window_seconds
+        self.power_threshold = power_threshold
+
+        self.activity_rooms: Dict[str, str] = dict(activities.get("activities", {}))
+        self.windows = TimeWindowIndex(user_prefs)
+        self.tz = self.windows.tz
+
+        self._sensors: Dict[str, _SensorState] = {}
+        for info in catalog:
+            state = _SensorState(info)
+            self._sensors[info.sensor_id] = state
+            self._sensors[info.path] = state
+
+        self._room_scores: Dict[str, float] = {room: 0.0 for room in catalog.rooms}
+        self._power_on: Dict[str, int] = {room: 0 for room in catalog.rooms}
+        self._window: Deque[Tuple[float, str, float]] = deque()
+        self._last_event_at: Optional[float] = None
+        self._last_front_door_at: Optional[float] = None
+
+        self._current: Optional[str] = None
+        self._previous: Optional[str] = None
+        self._since: Optional[datetime.datetime] = None
+
+    @classmethod
+    def from_data_dir(cls, data_dir: str = DATA_DIR, **kwargs: Any) -> "ActivityDetector":
+        return cls(
+            SensorCatalog.load(data_dir),
+            load_data_json("activities.json", data_dir),
+            load_data_json("user_prefs.json", data_dir),
+            **kwargs,
+        )
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        window = self._window
+        scores = self._room_scores
+        while window and window[0][0] < cutoff:
+            _, room, weight = window.popleft()
+            scores[room] -= weight
+
+    def update(self, sensor: str, value: Any, t: datetime.datetime) -> None:
+        """
+        Feed one sensor reading. `sensor` is a sensor id or a `/home/...` path.
+        Unknown sensors are ignored.
+        """
+        state = self._sensors.get(sensor)
+        if state is None:
+            return
+        now = t.timestamp()
+        info = state.info
+        if self.history is not None:
+            self.history.record(info.path, value, t)
+        previous = state.value
+        if previous != value:
+            state.value = value
+            state.changed_at = now
+        self._last_event_at = now
+
+        if info.sensor_id == "contact_front_door" and value == 1:
+            self._last_front_door_at = now
+
+        room = info.room
+        if room is None:
+            self._expire(now)
+            return
+
+        if info.modality == "power":
+            was_on = previous is not None and previous > self.power_threshold
+            is_on = value is not None and value > self.power_threshold
+            if is_on != was_on:
+                self._power_on[room] += 1 if is_on else -1
+        elif value == 1:
+            weight = _MODALITY_WEIGHT[info.modality]
+            self._window.append((now, room, weight))
+            self._room_scores[room] += weight
+        self._expire(now)
+
+    def _active_room(self) -> Optional[str]:
+        best_room = None
+        best_score = 0.0
+        for room, score in self._room_scores.items():
+            score += self._power_on[room] * _POWER_ON_WEIGHT
+            if score > best_score:
+                best_room, best_score = room, score
+        return best_room
+
+    def _meal_at(self, t: datetime.datetime, lead: datetime.timedelta) -> Optional[str]:
+        """
+        The meal whose window contains `t`, or starts within `lead` of it.
+        """
+        windows = self.windows
+        active = windows.windows_at(t)
+        for meal in _MEALS:
+            if meal in active:
+                return meal
+        if lead:
+            for meal in _MEALS:
+                if meal in windows.spans and windows.next_start(meal, t) - t <= lead:
+                    return meal
+        return None
+
+    def _classify(self, room: Optional[str], t: datetime.datetime) -> str:
+        if room is None:
+            left_recently = (
+                self._last_front_door_at is not None
+                and self._last_event_at is not None
+                and self._last_front_door_at >= self._last_event_at - self.window_seconds
+            )
+            return "Outside of Home" if left_recently else "Other"
+
+        if room == "kitchen":
+            meal = self._meal_at(t, _COOKING_LEAD)
+            if meal:
+                return f"Cooking {meal.capitalize()}"
+            return "Cooking" if self._power_on["kitchen"] else "Preparing a Snack"
+        if room == "dining_room":
+            meal = self._meal_at(t, datetime.timedelta(0))
+            return f"Eating {meal.capitalize()}" if meal else "Eating a Snack"
+        if room == "bedroom":
+            if "bedtime" in self.windows.windows_at(t):
+                return "Sleeping"
+            return "Napping"
+
+        for activity, activity_room in self.activity_rooms.items():
+            if activity_room == room:
+                return activity
+        return "Other"
+
+    def context(self, t: datetime.datetime) -> Dict[str, Any]:
+        """
+        Current activity context at time `t`.
+        """
+        self._expire(t.timestamp())
+        room = self._active_room()
+        activity = self._classify(room, t)
+        if activity != self._current:
+            self._previous = self._current
+            self._current = activity
+            self._since = t
+        return {
+            "current": self._current,
+            "previous": self._previous,
+            "room": room,
+            "since": self._since,
+            "scores": {r: s for r, s in self._room_scores.items() if s > 0},
+        }
+
+    def process(
+        self,
+        events: Iterable[Tuple[datetime.datetime, str, Any]],
+        tick_seconds: float = 1.0,
+    ) -> Iterator[Tuple[datetime.datetime, Dict[str, Any]]]:
+        """
+        Consume time-ordered (time, sensor, value) events and yield
+        (tick_time, context) once per tick of `tick_seconds` of event time.
+        """
+        step = datetime.timedelta(seconds=tick_seconds)
+        next_tick: Optional[datetime.datetime] = None
+        for t, sensor, value in events:
+            if next_tick is None:
+                next_tick = t
+            while t >= next_tick:
+                yield next_tick, self.context(next_tick)
+                next_tick += step
+            self.update(sensor, value, t)
+        if next_tick is not None:
+            yield next_tick, self.context(next_tick)
+
+
+def synthetic_day(
+    catalog: SensorCatalog,
+    day: datetime.date,
+    tz: datetime.tzinfo,
+    events_per_minute: int = 20,
+) -> List[Tuple[datetime.datetime, str, Any]]:
+    """
+    A rough day in the home: bedroom at night, kitchen and dining room around
+    meals, living room otherwise, with motion, cabinet and stove events.
+    """
+    import random
+
+    rng = random.Random(day.toordinal())
+    schedule = [
+        (0, "bedroom"), (7 * 60, "kitchen"), (8 * 60, "dining_room"), (9 * 60, "living_room"),
+        (11 * 60 + 30, "kitchen"), (12 * 60 + 15, "dining_room"), (13 * 60, "living_room"),
+        (17 * 60 + 45, "kitchen"), (18 * 60 + 45, "dining_room"), (19 * 60 + 30, "living_room"),
+        (22 * 60 + 30, "bedroom"),
+    ]
+    events: List[Tuple[datetime.datetime, str, Any]] = []
+    start = datetime.datetime.combine(day, datetime.time(0, 0), tzinfo=tz)
+    for minute in range(24 * 60):
+        room = [r for m, r in schedule if m <= minute][-1]
+        sensors = catalog.in_room(room)
+        t = start + datetime.timedelta(minutes=minute)
+        for i in range(events_per_minute):
+            sensor = rng.choice(sensors)
+            if sensor.modality == "power":
+                value: Any = rng.choice([0.0, 1200.0]) if room == "kitchen" else 0.0
+            else:
+                value = rng.choice([0, 1])
+            events.append((t + datetime.timedelta(seconds=i * 60 / events_per_minute), sensor.path, value))
+    return events
+
+
+if __name__ == "__main__":
+    import time
+
+    detector = ActivityDetector.from_data_dir()
+    day = synthetic_day(detector.catalog, datetime.date(2025, 11, 24), detector.tz)
+
+    t0 = time.perf_counter()
+    ticks = 0
+    seen: Dict[str, int] = {}
+    for _, ctx in detector.process(day, tick_seconds=1.0):
+        ticks += 1
+        seen[ctx["current"]] = seen.get(ctx["current"], 0) + 1
+    elapsed = time.perf_counter() - t0
+    print(f"[ACTIVITY] {len(day):,} events, {ticks:,} ticks in {elapsed:.2f}s "
+          f"({len(day)/elapsed:,.0f} events/s, {ticks/elapsed:,.0f} ticks/s)")
+    print("[ACTIVITY] seconds per activity:", seen)
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+
+class Overloaded(Exception):
+    """
+    Not admitted: the estimated (or actual) queue wait is past the deadline.
+    `retry_after` is a suggested delay in whole seconds.
+    """
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class AdmissionController:
+    """
+    Bounded admission in front of chat turns. At most `max_concurrent` turns
+    run at once; the rest wait in per-home FIFO queues served round-robin,
+    so one busy home cannot starve the others.
+
+    A request is turned away at once (Overloaded) when the queue is full or
+    its estimated wait is past `deadline_seconds`, and a queued request that
+    is still waiting at the deadline gives up the same way. Doing less work
+    on purpose keeps the latency of the admitted turns bounded by about
+    deadline + one turn, instead of every turn slowing down together.
+
+    The estimate is the number of grants ahead of the request under
+    round-robin (its home's queue, plus up to as many from each other home)
+    times the average turn time (EWMA) over `max_concurrent`. A home with a
+    long queue is therefore shed before a home with nothing waiting.
+
+    Single process; each worker admits its own share.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 64,
+        deadline_seconds: float = 15.0,
+        initial_service_seconds: float = 5.0,
+        window: int = 2048,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline_seconds = deadline_seconds
+        self.service_seconds = initial_service_seconds  # EWMA of admitted turn time
+        self._queues: "OrderedDict[str, Deque[asyncio.Future[None]]]" = OrderedDict()
+        self._queued = 0
+        self._in_flight = 0
+        self._waits: Deque[float] = deque(maxlen=window)
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def estimated_wait(self, home_id: str) -> float:
+        """
+        Seconds a new request from `home_id` would wait for a slot.
+        """
+        if self._in_flight < self.max_concurrent and not self._queued:
+            return 0.0
+        own = len(self._queues.get(home_id, ()))
+        ahead = own + sum(min(len(q), own + 1) for home, q in self._queues.items() if home != home_id)
+        return (ahead + 1) * self.service_seconds / self.max_concurrent
+
+    async def acquire(self, home_id: str) -> None:
+        """
+        Wait for a slot (pair with release()), or raise Overloaded.
+        """
+        if self._in_flight < self.max_concurrent and not self._queued:
+            self._in_flight += 1
+            self.admitted += 1
+            self._waits.append(0.0)
+            return
+        estimate = self.estimated_wait(home_id)
+        if self._queued >= self.max_queue or estimate > self.deadline_seconds:
+            self.rejected += 1
+            raise Overloaded(
+                f"Server busy: estimated wait {estimate:.1f}s",
+                self._retry_after(estimate),
+            )
+
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(home_id, deque()).append(future)
+        self._queued += 1
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.deadline_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                self.release(None)  # granted as we gave up: pass the slot on
+            else:
+                queue = self._queues.get(home_id)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[home_id]
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise Overloaded(
+                f"Server busy: waited {self.deadline_seconds:.1f}s",
+                self._retry_after(self.estimated_wait(home_id)),
+            ) from None
+        self.admitted += 1
+        self._waits.append(time.monotonic() - t0)
+
+    def release(self, service_seconds: Optional[float]) -> None:
+        """
+        Free a slot and hand it to the next home in the rotation.
+        `service_seconds`, how long the turn held the slot, feeds the
+        estimate.
+        """
+        if service_seconds is not None:
+            self.service_seconds += 0.1 * (service_seconds - self.service_seconds)
+        self._in_flight -= 1
+        while self._queues and self._in_flight < self.max_concurrent:
+            home_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(home_id)
+            else:
+                del self._queues[home_id]
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, home_id: str) -> AsyncIterator[None]:
+        await self.acquire(home_id)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    def _retry_after(self, estimate: float) -> int:
+        # Roughly when the queue will have drained below the deadline.
+        return max(1, math.ceil(estimate - self.deadline_seconds), math.ceil(self.service_seconds))
+
+    def metrics(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+            "homes_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "service_s": round(self.service_seconds, 3),
+            "estimated_wait_s": round(self.estimated_wait(""), 3),
+            "wait_p50_s": round(_percentile(waits, 0.50), 3),
+            "wait_p95_s": round(_percentile(waits, 0.95), 3),
+            "wait_p99_s": round(_percentile(waits, 0.99), 3),
+        }
+
+
+async def simulate_overload(
+    admission: Optional[AdmissionController],
+    offered_per_s: float = 40.0,
+    seconds: float = 10.0,
+    upstream_capacity: int = 8,
+    turn_seconds: float = 0.5,
+    heavy_home_share: float = 0.5,
+    seed: int = 7,
+) -> Dict[str, Any]:
+    """
+    Open-loop load against a simulated upstream: Poisson arrivals at
+    `offered_per_s`, each turn taking `turn_seconds` while at most
+    `upstream_capacity` run, and slowing down in proportion beyond that
+    (the LLM API's rate limits and queueing). Half of the traffic comes from
+    one heavy home, the rest from 200 light ones.
+    """
+    import random
+
+    rng = random.Random(seed)
+    running = 0
+    latencies: List[float] = []
+    outcomes: Dict[str, Dict[str, int]] = {"heavy": {"ok": 0, "shed": 0}, "light": {"ok": 0, "shed": 0}}
+
+    async def upstream() -> None:
+        nonlocal running
+        running += 1
+        try:
+            await asyncio.sleep(turn_seconds * max(1.0, running / upstream_capacity))
+        finally:
+            running -= 1
+
+    async def request(home_id: str, kind: str) -> None:
+        t0 = time.monotonic()
+        try:
+            if admission is None:
+                await upstream()
+            else:
+                async with admission.slot(home_id):
+                    await upstream()
+        except Overloaded:
+            outcomes[kind]["shed"] += 1
+            return
+        outcomes[kind]["ok"] += 1
+        latencies.append(time.monotonic() - t0)
+
+    tasks = []
+    t_end = time.monotonic() + seconds
+    while time.monotonic() < t_end:
+        await asyncio.sleep(rng.expovariate(offered_per_s))
+        if rng.random() < heavy_home_share:
+            tasks.append(asyncio.ensure_future(request("heavy-home", "heavy")))
+        else:
+            tasks.append(asyncio.ensure_future(request(f"home-{rng.randrange(200)}", "light")))
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    return {
+        "offered": len(tasks),
+        "served": len(latencies),
+        "p50_s": round(_percentile(latencies, 0.50), 2),
+        "p99_s": round(_percentile(latencies, 0.99), 2),
+        "max_s": round(latencies[-1], 2) if latencies else 0.0,
+        "heavy_home": outcomes["heavy"],
+        "light_homes": outcomes["light"],
+    }
+
+
+def http_load_test(url: str, offered_per_s: float = 20.0, seconds: float = 30.0, homes: int = 50) -> Dict[str, Any]:
+    """
+    The same open-loop load against a running api.py (`POST {url}/chat`):
+    latency percentiles of admitted turns, 429s, and the server's metrics.
+
+        python src/api.py  # in another terminal
+        python src/admission.py --url http://127.0.0.1:8000 --rate 20
+    """
+    import json
+    import random
+    import urllib.error
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    def send(i: int) -> Tuple[int, float, str]:
+        body = json.dumps({
+            "user_text": "remind me to close the fridge",
+            "session_id": f"load-test-{i}",
+            "home_id": f"home-{i % homes}",
+        }).encode()
+        request = urllib.request.Request(f"{url}/chat", body, {"Content-Type": "application/json"})
+        t0 = time.monotonic()
+        try:
+            with urllib.request.urlopen(request, timeout=300) as response:
+                response.read()
+                status, retry_after = response.status, ""
+        except urllib.error.HTTPError as e:
+            status, retry_after = e.code, e.headers.get("Retry-After", "")
+        return status, time.monotonic() - t0, retry_after
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=512) as pool:
+        t_end = time.monotonic() + seconds
+        i = 0
+        while time.monotonic() < t_end:
+            time.sleep(random.expovariate(offered_per_s))
+            futures.append(pool.submit(send, i))
+            i += 1
+        results = [f.result() for f in futures]
+
+    ok = sorted(t for status, t, _ in results if status == 200)
+    statuses: Dict[int, int] = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    with urllib.request.urlopen(f"{url}/admission/metrics") as response:
+        server = json.loads(response.read())
+    return {
+        "offered": len(results),
+        "statuses": statuses,
+        "p50_s": round(_percentile(ok, 0.50), 2),
+        "p99_s": round(_percentile(ok, 0.99), 2),
+        "retry_after_s": sorted({r for s, _, r in results if s == 429}),
+        "server": server,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Admission control under simulated overload.")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--turn-seconds", type=float, default=0.5)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--url", help="Load-test a running api.py instead of the simulation.")
+    parser.add_argument("--rate", type=float, default=20.0, help="Requests per second (--url).")
+    args = parser.parse_args()
+
+    if args.url:
+        print("[ADMISSION]", http_load_test(args.url, args.rate, args.seconds))
+        raise SystemExit
+
+    capacity_per_s = args.capacity / args.turn_seconds
+    for load in (0.5, 1.0, 2.0, 4.0):
+        offered = capacity_per_s * load
+        for name in ("none", "admission"):
+            admission = None
+            if name == "admission":
+                admission = AdmissionController(
+                    max_concurrent=args.capacity,
+                    max_queue=256,
+                    deadline_seconds=args.deadline,
+                    initial_service_seconds=args.turn_seconds,
+                )
+            result = asyncio.run(simulate_overload(
+                admission, offered, args.seconds, args.capacity, args.turn_seconds,
+            ))
+            print(f"[ADMISSION] load {load:.1f}x {name:9s}", result,
+                  admission.metrics() if admission else "")
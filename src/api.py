@@ -1,15 +1,22 @@
+import asyncio
 import importlib.util
 import os
+import sqlite3
 import sys
 from typing import Any, Dict, List, Optional
 
 import yaml
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from pydantic import BaseModel
 
+from admission import AdmissionController, Overloaded
 from agents import RunContextWrapper
 from code_generation import CodeGeneration
+from conversation_db import get_conversation_db
+from idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyInProgress, fingerprint
 from json_converter import generate_json
+from session_cache import SessionCache
+from state_backend import InProcessBackend, open_backend
 
 
 _CHAT_ASSISTANT_PATH = os.path.join(os.path.dirname(__file__), "chat-assistant.py")
@@ -32,6 +39,29 @@ Feasibility = chat_assistant.Feasibility
 app = FastAPI(title="Agentic Reminder Assistant API")
 assistant = ChatAssistant()
 
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", os.path.join(os.path.dirname(__file__), "conversations.db"))
+# memory:// for a single worker; sqlite:///path/state.db to share sessions and
+# generation jobs between `uvicorn --workers N` processes.
+state_backend = open_backend()
+sessions = SessionCache(
+    get_conversation_db(SESSION_DB_PATH),
+    max_sessions=int(os.environ.get("SESSION_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("SESSION_TTL_SECONDS", "1800")),
+    shared=None if isinstance(state_backend, InProcessBackend) else state_backend,
+)
+GENERATION_TTL_SECONDS = 24 * 3600
+# Bounded, per-home fair admission in front of chat turns (per worker).
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get("ADMISSION_MAX_CONCURRENT", "8")),
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "64")),
+    deadline_seconds=float(os.environ.get("ADMISSION_DEADLINE_SECONDS", "15")),
+)
+# Completed /chat results replayed to retries carrying the same Idempotency-Key.
+idempotency = IdempotencyCache(
+    state_backend,
+    ttl_seconds=float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600))),
+)
+
 
 class HistoryMessage(BaseModel):
     role: str
@@ -40,6 +70,11 @@ class HistoryMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     user_text: str
+    # Fairness key for admission control; defaults to the session.
+    home_id: Optional[str] = None
+    # Session mode: the server keeps history and state; send only user_text.
+    session_id: Optional[str] = None
+    # Stateless mode: the client sends everything back each turn.
     history: Optional[List[HistoryMessage]] = None
     state: Optional[ConversationState] = None
 
@@ -47,28 +82,99 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     assistant_reply: str
     state: ConversationState
-    history: List[HistoryMessage]
-    generated_yaml: Optional[str] = None
+    # Stateless mode only.
+    history: Optional[List[HistoryMessage]] = None
+    session_id: Optional[str] = None
+    generated_json: Optional[str] = None
 
 
 def _history_to_string(messages: List[HistoryMessage]) -> str:
     return "\n".join(f"{m.role}: {m.content}" for m in messages)
 
 
+def _new_state() -> ConversationState:
+    return ConversationState(
+        state=ConversationStateEnum.NEED_WHAT,
+        slots=Slots(),
+        feasibility=Feasibility(),
+    )
+
+
+def _state_dict(wrapper: RunContextWrapper[ConversationState]) -> Dict[str, Any]:
+    return wrapper.context if isinstance(wrapper.context, dict) else wrapper.context.model_dump(mode="json")
+
+
+async def _generate_trigger_json(wrapper: RunContextWrapper[ConversationState]) -> str:
+    """
+    Code + JSON generation for a finished conversation.
+    """
+    try:
+        # 1) Generate trigger/cancel code from the final state
+        code_obj = await CodeGeneration.generate_code(_state_dict(wrapper))
+        combined_code = (
+            (code_obj.get("generated_trigger_code") or "")
+            + "\n\n"
+            + (code_obj.get("generated_cancel_code") or "")
+        )
+
+        # 2) Use json_converter agent to build a TriggerMachine JSON string
+        return generate_json(combined_code)
+    except Exception as e:
+        return f"# code_generation_failed: {e}"
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest) -> ChatResponse:
+async def chat(
+    req: ChatRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+) -> ChatResponse:
     """
     Single-turn chat endpoint that:
-    - Takes user_text, prior history, and current ConversationState
+    - Takes user_text, and either a session_id (history and state are kept
+      server-side) or the prior history and current ConversationState
     - Calls the ChatAssistant.handle_turn agent
-    - Returns the assistant reply and updated state + history
+    - Returns the assistant reply and updated state (+ history in stateless mode)
+
+    With an `Idempotency-Key` header the turn runs at most once per key: a
+    retry gets the original response (marked `Idempotent-Replayed: true`),
+    waiting for it if the original is still running. Reusing a key for a
+    different request is a 422.
+
+    Turns go through admission control: when the estimated wait for a slot
+    is past ADMISSION_DEADLINE_SECONDS the answer is a 429 with Retry-After.
+    Retries joining an in-flight turn do not take a slot.
     """
+    try:
+        if idempotency_key is None:
+            return await _admitted_turn(req)
+
+        async def work() -> Dict[str, Any]:
+            return (await _admitted_turn(req)).model_dump(mode="json")
+
+        result, replayed = await idempotency.run(idempotency_key, fingerprint(req.model_dump_json()), work)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "5"})
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return ChatResponse.model_validate(result)
+
+
+async def _admitted_turn(req: ChatRequest) -> ChatResponse:
+    async with admission.slot(req.home_id or req.session_id or "anonymous"):
+        return await _chat_turn(req)
+
+
+async def _chat_turn(req: ChatRequest) -> ChatResponse:
+    if req.session_id is not None:
+        return await _chat_session(req)
+
     # Seed state if caller did not provide one
-    state = req.state or ConversationState(
-        state=ConversationStateEnum.NEED_WHAT,
-        slots=Slots(),
-        feasibility=Feasibility(),
-    )
+    state = req.state or _new_state()
     wrapper: RunContextWrapper[ConversationState] = RunContextWrapper(context=state)
 
     history: List[HistoryMessage] = req.history or []
@@ -82,26 +188,9 @@ async def chat(req: ChatRequest) -> ChatResponse:
     assistant_reply = result.get("assistant_reply", "")
     trigger_json_str: Optional[str] = None
 
-    # If the conversation has ended, trigger code + JSON → YAML generation once and attach result
+    # If the conversation has ended, trigger code + JSON generation once and attach result
     if "[ChatEnded]" in assistant_reply:
-        try:
-            state_dict = (
-                wrapper.context
-                if isinstance(wrapper.context, dict)
-                else wrapper.context.model_dump()
-            )
-            # 1) Generate trigger/cancel code from the final state
-            code_obj = await CodeGeneration.generate_code(state_dict)
-            combined_code = (
-                (code_obj.get("generated_trigger_code") or "")
-                + "\n\n"
-                + (code_obj.get("generated_cancel_code") or "")
-            )
-
-            # 2) Use json_converter agent to build a TriggerMachine JSON string
-            trigger_json_str = generate_json(combined_code)
-        except Exception as e:
-            trigger_json_str = f"# code_generation_failed: {e}"
+        trigger_json_str = await _generate_trigger_json(wrapper)
 
     # Append assistant reply to history for the caller
     new_history = history + [HistoryMessage(role="assistant", content=assistant_reply)]
@@ -114,14 +203,132 @@ async def chat(req: ChatRequest) -> ChatResponse:
     )
 
 
+async def _chat_session(req: ChatRequest) -> ChatResponse:
+    """
+    Session-mode turn: history and state come from the session cache, and
+    the request and response stay the same size however long the chat gets.
+    An unknown session_id starts a new session under that id.
+    """
+    entry = await sessions.acquire(req.session_id)
+    try:
+        state = ConversationState.model_validate(entry.state) if entry.state else _new_state()
+        wrapper: RunContextWrapper[ConversationState] = RunContextWrapper(context=state)
+        user_line = f"user: {req.user_text}"
+
+        result: Dict[str, Any] = await assistant.handle_turn(
+            user_text=req.user_text,
+            history=f"{entry.history}\n{user_line}" if entry.history else user_line,
+            wrapper=wrapper,
+        )
+        assistant_reply = result.get("assistant_reply", "")
+        # Only a completed turn is recorded, so a failed one can be retried as is.
+        sessions.append(entry, "user", req.user_text)
+        sessions.append(entry, "assistant", assistant_reply, _state_dict(wrapper))
+
+        ended = "[ChatEnded]" in assistant_reply
+        if ended:
+            sessions.end(entry)
+    finally:
+        await sessions.release(entry)
+
+    # Generation can outlast the lease, so it runs after the session is released.
+    trigger_json_str: Optional[str] = None
+    if ended:
+        # Recorded in the shared backend, so any worker can report it.
+        await asyncio.to_thread(
+            state_backend.put, "generation", req.session_id, {"status": "running"}, GENERATION_TTL_SECONDS
+        )
+        trigger_json_str = await _generate_trigger_json(wrapper)
+        await asyncio.to_thread(
+            state_backend.put,
+            "generation",
+            req.session_id,
+            {"status": "done", "generated_json": trigger_json_str},
+            GENERATION_TTL_SECONDS,
+        )
+
+    return ChatResponse(
+        assistant_reply=assistant_reply,
+        state=wrapper.context,
+        session_id=req.session_id,
+        generated_json=trigger_json_str,
+    )
+
+
+@app.get("/sessions/metrics")
+async def session_metrics() -> Dict[str, Any]:
+    return {"pid": os.getpid(), **sessions.metrics(), "idempotency": idempotency.metrics()}
+
+
+@app.get("/admission/metrics")
+async def admission_metrics() -> Dict[str, Any]:
+    """
+    Queue depth, in-flight turns, admitted/rejected counts and queue wait
+    percentiles for this worker.
+    """
+    return {"pid": os.getpid(), **admission.metrics()}
+
+
+@app.get("/conversations")
+async def list_conversations(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Stored conversations, newest first, keyset-paginated: pass `next_cursor`
+    from one page as `cursor` to get the next.
+    """
+    try:
+        return await asyncio.to_thread(sessions.backing.page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/conversations/search")
+async def search_conversations(
+    q: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    raw: bool = False,
+    total: bool = False,
+) -> Dict[str, Any]:
+    """
+    Full-text search over stored conversations, newest match first.
+    raw=true accepts FTS5 query syntax (phrases, OR, NEAR, column filters).
+    """
+    try:
+        return await asyncio.to_thread(sessions.backing.search, q, limit, cursor, raw, 16, total)
+    except (ValueError, sqlite3.OperationalError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search: {e}")
+
+
+@app.get("/conversations/stats")
+async def conversation_stats(since: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Turns per conversation and the distribution of final states.
+    """
+    return await asyncio.to_thread(sessions.backing.stats, since)
+
+
+@app.get("/sessions/{session_id}/generation")
+async def session_generation(session_id: str) -> Dict[str, Any]:
+    job = await asyncio.to_thread(state_backend.get, "generation", session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No generation job for this session")
+    return job
+
+
 if __name__ == "__main__":
     import uvicorn
 
+    # More than one worker needs STATE_BACKEND=sqlite:///... so they share sessions.
+    workers = int(os.environ.get("API_WORKERS", "1"))
     uvicorn.run(
         "api:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=workers == 1,
+        workers=workers,
     )
 
 
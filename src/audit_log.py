@@ -0,0 +1,529 @@
+from __future__ import annotations
+
+import datetime
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_AUDIT_DIR = os.path.join(os.path.dirname(__file__), "data", "audit")
+
+_STOP = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    opened_at REAL NOT NULL,
+    closed_at REAL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    id INTEGER PRIMARY KEY,
+    segment_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    min_ts REAL NOT NULL,
+    max_ts REAL NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_by_time ON blocks (max_ts, min_ts);
+CREATE TABLE IF NOT EXISTS block_triggers (
+    trigger_id TEXT NOT NULL,
+    block_id INTEGER NOT NULL,
+    min_ts REAL NOT NULL,
+    max_ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS block_triggers_by_trigger ON block_triggers (trigger_id, max_ts);
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _as_ts(value: Any) -> float:
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class AuditLog:
+    """
+    Append-only log of trigger fires, cancels and dispatched actions.
+
+    log() only enqueues; a background thread drains the queue and writes
+    everything pending as one block (group commit: one write, one flush and
+    one SQLite transaction per block, not per event). Blocks are JSON lines
+    appended to the active segment; the SQLite index records each block's
+    offset and time range, plus per-TriggerId time ranges, so a query reads
+    only the blocks that can contain matching records.
+
+    A segment is rotated once it exceeds `max_segment_bytes` or has been open
+    for `max_segment_seconds`. Rotated segments are compressed off the write
+    path, each block as its own gzip member, so blocks stay individually
+    addressable after compression. Segments a crashed process left open or
+    uncompressed are closed and compressed when the log is next opened.
+
+    A block that fails to write is counted in `failed` and the writer moves
+    on; flush() raises if any record logged before it failed. If the writer
+    itself stops, log() and flush() raise, as they do after close().
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_AUDIT_DIR,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        max_segment_seconds: float = 3600.0,
+        flush_interval: float = 0.05,
+        max_batch: int = 5000,
+        compress: bool = True,
+        fsync: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compress = compress
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.db")
+
+        self.written = 0
+        self.blocks = 0
+        self.failed = 0
+        self.last_error: Optional[BaseException] = None
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._swap_lock = threading.Lock()
+        self._compressors: List[threading.Thread] = []
+        self._closed = False
+        self._stopped = False  # the writer has exited; nothing queued will be written
+        self._writer_error: Optional[BaseException] = None
+        conn = _connect(self.index_path)
+        try:
+            conn.executescript(_SCHEMA)
+            self._recover(conn)
+        finally:
+            conn.close()
+        self._writer = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._writer.start()
+
+    # ------------------------------------------------------------------ writing
+
+    def log(
+        self,
+        kind: str,
+        home_id: str,
+        trigger_id: str,
+        time_: Any = None,
+        data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Queue one record; `time_` is a datetime or epoch seconds (default: now).
+        """
+        if self._stopped or self._closed:
+            self._raise_stopped()
+        ts = _as_ts(time_) if time_ is not None else time.time()
+        self._queue.put((ts, kind, home_id, trigger_id, data))
+
+    def log_event(self, home_id: str, event: Any) -> None:
+        """
+        Record a TriggerRuntime event (fire or cancel).
+        """
+        data = {"actions": [a.model_dump() for a in event.actions]} if event.actions else None
+        self.log(event.kind, home_id, event.trigger_id, event.time, data)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything logged so far is written and indexed; False
+        on timeout. Raises if any of it failed to write.
+        """
+        if self._stopped or self._closed:
+            self._raise_stopped()
+        failed = self.failed
+        done = threading.Event()
+        self._queue.put(done)
+        if self._stopped:
+            self._raise_stopped()  # stopped as we queued; the drain may have missed it
+        finished = done.wait(timeout)
+        if self._writer_error is not None:
+            self._raise_stopped()
+        if self.failed > failed:
+            raise RuntimeError(f"{self.failed - failed} audit records failed to write: {self.last_error}")
+        return finished
+
+    def _raise_stopped(self) -> None:
+        if self._writer_error is not None:
+            raise RuntimeError(f"Audit log writer stopped: {self._writer_error}") from self._writer_error
+        raise RuntimeError("Audit log is closed")
+
+    def _open_segment(self, conn: sqlite3.Connection) -> Tuple[int, str, Any, float]:
+        opened_at = time.time()
+        cur = conn.execute("INSERT INTO segments (path, opened_at) VALUES ('', ?)", (opened_at,))
+        segment_id = cur.lastrowid
+        path = os.path.join(self.directory, f"audit-{segment_id:08d}.jsonl")
+        conn.execute("UPDATE segments SET path = ? WHERE id = ?", (path, segment_id))
+        conn.commit()
+        return segment_id, path, open(path, "ab"), opened_at
+
+    def _run(self) -> None:
+        try:
+            self._write_loop()
+        except BaseException as exc:
+            self._writer_error = exc
+            print(f"[AUDIT] writer stopped: {exc!r}")
+        finally:
+            self._stopped = True
+            # Release flushes queued behind the stop (or the failure).
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write_loop(self) -> None:
+        conn = _connect(self.index_path)
+        try:
+            segment_id, path, f, opened_at = self._open_segment(conn)
+            offset = f.tell()
+            while True:
+                first = self._queue.get()
+                items = [first]
+                # Group commit: take whatever else is already waiting.
+                while len(items) < self.max_batch:
+                    try:
+                        items.append(self._queue.get(timeout=self.flush_interval if len(items) == 1 else 0))
+                    except queue.Empty:
+                        break
+
+                records = []
+                waiters = []
+                stop = False
+                for item in items:
+                    if item is _STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        records.append(item)
+
+                try:
+                    if records:
+                        try:
+                            offset = self._write_block(conn, segment_id, f, offset, records)
+                        except (OSError, sqlite3.Error, TypeError, ValueError) as exc:
+                            # The block is lost; keep offsets in step with whatever reached the file.
+                            conn.rollback()
+                            offset = f.tell()
+                            self.failed += len(records)
+                            self.last_error = exc
+                            print(f"[AUDIT] failed to write {len(records)} records: {exc}")
+
+                    if stop or offset >= self.max_segment_bytes or (
+                        offset and time.time() - opened_at >= self.max_segment_seconds
+                    ):
+                        f.close()
+                        self._close_segment(conn, segment_id, path, offset)
+                        if stop:
+                            return
+                        segment_id, path, f, opened_at = self._open_segment(conn)
+                        offset = 0
+                except BaseException as exc:
+                    self._writer_error = exc  # before the waiters wake, so their flush() raises
+                    raise
+                finally:
+                    for waiter in waiters:
+                        waiter.set()
+        finally:
+            conn.close()
+
+    def _close_segment(self, conn: sqlite3.Connection, segment_id: int, path: str, offset: int) -> None:
+        conn.execute("UPDATE segments SET closed_at = ? WHERE id = ?", (time.time(), segment_id))
+        conn.commit()
+        if not offset:
+            conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+            conn.commit()
+            os.remove(path)
+        elif self.compress:
+            self._start_compression(segment_id)
+
+    def _recover(self, conn: sqlite3.Connection) -> None:
+        """
+        Finish what a crashed process left behind: close its open segment,
+        compress every uncompressed one (dropping those without blocks), and
+        remove plain copies of segments already compressed.
+        """
+        rows = conn.execute(
+            "SELECT s.id, s.path, s.compressed, COUNT(b.id) FROM segments s "
+            "LEFT JOIN blocks b ON b.segment_id = s.id GROUP BY s.id ORDER BY s.id"
+        ).fetchall()
+        for segment_id, path, compressed, n_blocks in rows:
+            if compressed:
+                plain = path[: -len(".gz")]
+                if os.path.exists(plain):
+                    os.remove(plain)
+                continue
+            conn.execute(
+                "UPDATE segments SET closed_at = COALESCE(closed_at, ?) WHERE id = ?", (time.time(), segment_id)
+            )
+            conn.commit()
+            if not n_blocks:
+                conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+                conn.commit()
+                if path and os.path.exists(path):
+                    os.remove(path)
+            elif self.compress:
+                self._start_compression(segment_id)
+
+    def _write_block(
+        self,
+        conn: sqlite3.Connection,
+        segment_id: int,
+        f: Any,
+        offset: int,
+        records: List[Tuple[float, str, str, str, Optional[Dict[str, Any]]]],
+    ) -> int:
+        lines = []
+        triggers: Dict[str, List[float]] = {}
+        min_ts = max_ts = records[0][0]
+        for ts, kind, home_id, trigger_id, data in records:
+            record = {"ts": ts, "kind": kind, "home_id": home_id, "trigger_id": trigger_id}
+            if data is not None:
+                record["data"] = data
+            lines.append(json.dumps(record, default=str, separators=(",", ":")))
+            if ts < min_ts:
+                min_ts = ts
+            elif ts > max_ts:
+                max_ts = ts
+            span = triggers.get(trigger_id)
+            if span is None:
+                triggers[trigger_id] = [ts, ts]
+            elif ts < span[0]:
+                span[0] = ts
+            elif ts > span[1]:
+                span[1] = ts
+        payload = ("\n".join(lines) + "\n").encode()
+        f.write(payload)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+        cur = conn.execute(
+            "INSERT INTO blocks (segment_id, offset, length, min_ts, max_ts, count) VALUES (?, ?, ?, ?, ?, ?)",
+            (segment_id, offset, len(payload), min_ts, max_ts, len(records)),
+        )
+        block_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO block_triggers (trigger_id, block_id, min_ts, max_ts) VALUES (?, ?, ?, ?)",
+            [(trigger_id, block_id, lo, hi) for trigger_id, (lo, hi) in triggers.items()],
+        )
+        conn.commit()
+        self.written += len(records)
+        self.blocks += 1
+        return offset + len(payload)
+
+    # -------------------------------------------------------------- compression
+
+    def _start_compression(self, segment_id: int) -> None:
+        self._compressors = [t for t in self._compressors if t.is_alive()]
+        thread = threading.Thread(target=self._compress_segment, args=(segment_id,), daemon=True)
+        self._compressors.append(thread)
+        thread.start()
+
+    def _compress_segment(self, segment_id: int) -> None:
+        conn = _connect(self.index_path)
+        try:
+            (path,) = conn.execute("SELECT path FROM segments WHERE id = ?", (segment_id,)).fetchone()
+            blocks = conn.execute(
+                "SELECT id, offset, length FROM blocks WHERE segment_id = ? ORDER BY offset", (segment_id,)
+            ).fetchall()
+            gz_path = path + ".gz"
+            updates = []
+            with open(path, "rb") as src, open(gz_path + ".tmp", "wb") as dst:
+                for block_id, offset, length in blocks:
+                    src.seek(offset)
+                    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip member
+                    member = compressor.compress(src.read(length)) + compressor.flush()
+                    updates.append((dst.tell(), len(member), block_id))
+                    dst.write(member)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(gz_path + ".tmp", gz_path)
+            with self._swap_lock:
+                conn.executemany("UPDATE blocks SET offset = ?, length = ? WHERE id = ?", updates)
+                conn.execute("UPDATE segments SET path = ?, compressed = 1 WHERE id = ?", (gz_path, segment_id))
+                conn.commit()
+                os.remove(path)
+        except Exception as exc:
+            print(f"[AUDIT] compressing segment {segment_id} failed: {exc}")
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------ reading
+
+    def query(
+        self,
+        trigger_id: Optional[str] = None,
+        start: Any = None,
+        end: Any = None,
+        kind: Optional[str] = None,
+        home_id: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Records (oldest first) for a TriggerId and/or time range [start, end].
+        Only records already written are visible; call flush() first to
+        include everything logged so far.
+        """
+        lo = _as_ts(start) if start is not None else float("-inf")
+        hi = _as_ts(end) if end is not None else float("inf")
+        out: List[Dict[str, Any]] = []
+        for record in self._scan(trigger_id, lo, hi):
+            if kind is not None and record["kind"] != kind:
+                continue
+            if home_id is not None and record["home_id"] != home_id:
+                continue
+            out.append(record)
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def _scan(self, trigger_id: Optional[str], lo: float, hi: float) -> Iterator[Dict[str, Any]]:
+        with self._swap_lock:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            try:
+                if trigger_id is not None:
+                    rows = conn.execute(
+                        "SELECT s.path, s.compressed, b.offset, b.length FROM block_triggers t "
+                        "JOIN blocks b ON b.id = t.block_id JOIN segments s ON s.id = b.segment_id "
+                        "WHERE t.trigger_id = ? AND t.max_ts >= ? AND t.min_ts <= ? ORDER BY b.id",
+                        (trigger_id, lo, hi),
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT s.path, s.compressed, b.offset, b.length FROM blocks b "
+                        "JOIN segments s ON s.id = b.segment_id "
+                        "WHERE b.max_ts >= ? AND b.min_ts <= ? ORDER BY b.id",
+                        (lo, hi),
+                    ).fetchall()
+            finally:
+                conn.close()
+            # Read the blocks while holding the lock so a segment cannot be
+            # swapped for its compressed copy half-way through.
+            chunks = []
+            handles: Dict[str, Any] = {}
+            try:
+                for path, compressed, offset, length in rows:
+                    f = handles.get(path)
+                    if f is None:
+                        f = handles[path] = open(path, "rb")
+                    f.seek(offset)
+                    raw = f.read(length)
+                    chunks.append(zlib.decompress(raw, 31) if compressed else raw)
+            finally:
+                for f in handles.values():
+                    f.close()
+
+        # Cheap substring test before parsing: blocks hold many triggers.
+        needle = f'"trigger_id":{json.dumps(trigger_id)}'.encode() if trigger_id is not None else None
+        for chunk in chunks:
+            for line in chunk.splitlines():
+                if needle is not None and needle not in line:
+                    continue
+                record = json.loads(line)
+                ts = record["ts"]
+                if ts < lo or ts > hi:
+                    continue
+                if trigger_id is not None and record["trigger_id"] != trigger_id:
+                    continue
+                yield record
+
+    # ---------------------------------------------------------------- lifecycle
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        for thread in list(self._compressors):
+            thread.join()
+
+    def __enter__(self) -> "AuditLog":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def segment_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "audit-*.jsonl*")))
+
+
+def benchmark_audit_log(n_events: int = 200_000, n_triggers: int = 500) -> Dict[str, float]:
+    """
+    Logging throughput with group commit against a commit-per-event SQLite
+    insert (the save_conversation_to_db pattern), and indexed query latency.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="audit_bench_")
+    try:
+        start = time.time() - n_events
+        audit = AuditLog(directory, max_segment_bytes=8 * 1024 * 1024)
+        t0 = time.perf_counter()
+        for i in range(n_events):
+            audit.log("fire" if i % 3 else "cancel", "bench_home", f"trigger_{i % n_triggers}", start + i)
+        enqueue = time.perf_counter() - t0
+        audit.flush()
+        logged = time.perf_counter() - t0
+        audit.close()  # also waits for rotated segments to be compressed
+
+        audit = AuditLog(directory, max_segment_bytes=8 * 1024 * 1024)
+        t0 = time.perf_counter()
+        queries = 200
+        found = 0
+        for _ in range(queries):
+            lo = start + random.randrange(n_events)
+            found += len(audit.query(f"trigger_{random.randrange(n_triggers)}", lo, lo + 3600))
+        query_ms = (time.perf_counter() - t0) / queries * 1000
+        audit.close()
+
+        baseline_n = 2000
+        conn = sqlite3.connect(os.path.join(directory, "baseline.db"))
+        conn.execute("CREATE TABLE events (ts REAL, kind TEXT, home_id TEXT, trigger_id TEXT)")
+        t0 = time.perf_counter()
+        for i in range(baseline_n):
+            conn.execute("INSERT INTO events VALUES (?, ?, ?, ?)", (start + i, "fire", "bench_home", "t"))
+            conn.commit()
+        baseline = time.perf_counter() - t0
+        conn.close()
+
+        return {
+            "events": n_events,
+            "enqueue_per_s": n_events / enqueue,
+            "written_per_s": n_events / logged,
+            "commit_per_event_per_s": baseline_n / baseline,
+            "query_ms_per_trigger_hour": query_ms,
+            "avg_records_per_query": found / queries,
+            "segments": len(glob.glob(os.path.join(directory, "audit-*.jsonl.gz"))),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    print("[AUDIT]", benchmark_audit_log())
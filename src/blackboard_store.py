@@ -0,0 +1,432 @@
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+_MISSING: Any = object()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "data", "blackboards.db")
+
+logger = logging.getLogger(__name__)
+
+
+class Blackboard(dict):
+    """
+    Per-trigger scratch state handed to generated trigger/cancel code.
+
+    Generated code treats the blackboard as a plain dict (and often checks
+    `isinstance(blackboard, dict)`), so this subclasses dict. The two keys
+    nearly every state machine uses, 'state' and 'time', are kept in slots;
+    a blackboard that only touches those never allocates a hash table.
+    Any other key falls through to the underlying dict.
+
+    Writes set a changed flag so snapshots only persist what changed.
+    In-place mutation of a stored value (e.g. appending to a list) is not seen.
+    """
+
+    __slots__ = ("_state", "_time", "_changed")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._state = _MISSING
+        self._time = _MISSING
+        self._changed = False
+
+    def _touch(self) -> None:
+        self._changed = True
+
+    def __getitem__(self, key: Any) -> Any:
+        if key == "state":
+            if self._state is _MISSING:
+                raise KeyError(key)
+            return self._state
+        if key == "time":
+            if self._time is _MISSING:
+                raise KeyError(key)
+            return self._time
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if key == "state":
+            self._state = value
+        elif key == "time":
+            self._time = value
+        else:
+            dict.__setitem__(self, key, value)
+        self._touch()
+
+    def __delitem__(self, key: Any) -> None:
+        if key == "state":
+            if self._state is _MISSING:
+                raise KeyError(key)
+            self._state = _MISSING
+        elif key == "time":
+            if self._time is _MISSING:
+                raise KeyError(key)
+            self._time = _MISSING
+        else:
+            dict.__delitem__(self, key)
+        self._touch()
+
+    def __contains__(self, key: Any) -> bool:
+        if key == "state":
+            return self._state is not _MISSING
+        if key == "time":
+            return self._time is not _MISSING
+        return dict.__contains__(self, key)
+
+    def __len__(self) -> int:
+        return (
+            dict.__len__(self)
+            + (self._state is not _MISSING)
+            + (self._time is not _MISSING)
+        )
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._state is not _MISSING:
+            yield "state"
+        if self._time is not _MISSING:
+            yield "time"
+        yield from dict.__iter__(self)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.to_dict() == (other.to_dict() if isinstance(other, Blackboard) else other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"Blackboard({self.to_dict()!r})"
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key == "state":
+            return default if self._state is _MISSING else self._state
+        if key == "time":
+            return default if self._time is _MISSING else self._time
+        return dict.get(self, key, default)
+
+    def pop(self, key: Any, default: Any = _MISSING) -> Any:
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default is _MISSING:
+            raise KeyError(key)
+        return default
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):  # type: ignore[override]
+        return list(iter(self))
+
+    def values(self):  # type: ignore[override]
+        return [self[k] for k in self]
+
+    def items(self):  # type: ignore[override]
+        return [(k, self[k]) for k in self]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:  # type: ignore[override]
+        for arg in args:
+            for key, value in (arg.items() if hasattr(arg, "items") else arg):
+                self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def clear(self) -> None:
+        self._state = _MISSING
+        self._time = _MISSING
+        dict.clear(self)
+        self._touch()
+
+    def copy(self) -> Dict[str, Any]:  # type: ignore[override]
+        return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def extras(self) -> Dict[str, Any]:
+        """
+        Keys that are not stored in slots.
+        """
+        return dict(dict.items(self))
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$td": value.total_seconds()}
+    if isinstance(value, datetime.date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Blackboard value of type {type(value).__name__} is not persistable")
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.datetime.fromisoformat(obj["$dt"])
+        if "$td" in obj:
+            return datetime.timedelta(seconds=obj["$td"])
+        if "$date" in obj:
+            return datetime.date.fromisoformat(obj["$date"])
+    return obj
+
+
+def _dumps(value: Any) -> Optional[str]:
+    if value is _MISSING:
+        return None
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+def _loads(text: Optional[str]) -> Any:
+    if text is None:
+        return _MISSING
+    return json.loads(text, object_hook=_json_object_hook)
+
+
+class BlackboardStore:
+    """
+    Holds the blackboards of every trigger in a home and persists them to SQLite.
+
+    - get(trigger_id) returns the live Blackboard (created on first use).
+    - snapshot() writes only blackboards changed since the last snapshot. A
+      board that cannot be serialized stays changed (retried next time) and
+      is listed in `unpersistable` with the error.
+    - restore() reloads every blackboard for this home, e.g. on startup, so a
+      trigger in the middle of a delay picks up where it left off. Boards
+      already handed out by get() are refilled in place.
+    - start_autosnapshot(interval) snapshots periodically on a daemon thread.
+    """
+
+    def __init__(self, db_path: Optional[str] = DEFAULT_DB_PATH, home_id: str = "default") -> None:
+        self.db_path = db_path
+        self.home_id = home_id
+        self._boards: Dict[str, Blackboard] = {}
+        self._removed: Set[str] = set()
+        self.unpersistable: Dict[str, str] = {}  # trigger_id -> why its board was not written
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._boards)
+
+    def __contains__(self, trigger_id: str) -> bool:
+        return trigger_id in self._boards
+
+    def get(self, trigger_id: str) -> Blackboard:
+        board = self._boards.get(trigger_id)
+        if board is None:
+            board = Blackboard()
+            self._boards[trigger_id] = board
+            self._removed.discard(trigger_id)
+        return board
+
+    def discard(self, trigger_id: str) -> None:
+        if self._boards.pop(trigger_id, None) is not None:
+            self._removed.add(trigger_id)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.db_path is None:
+                raise RuntimeError("BlackboardStore has no db_path; persistence is disabled.")
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blackboards (
+                    home_id TEXT NOT NULL,
+                    trigger_id TEXT NOT NULL,
+                    state TEXT,
+                    time TEXT,
+                    extra TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (home_id, trigger_id)
+                )
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def snapshot(self) -> int:
+        """
+        Persist blackboards changed since the last snapshot. Returns rows written.
+        """
+        if self.db_path is None:
+            return 0
+        with self._lock:
+            # Clear the changed flag *before* reading values: a write that races
+            # with this snapshot re-marks the board and lands in the next one.
+            changed: List[Tuple[str, Blackboard]] = []
+            for trigger_id, board in list(self._boards.items()):
+                if board._changed:
+                    board._changed = False
+                    changed.append((trigger_id, board))
+            removed = list(self._removed)
+            self._removed.difference_update(removed)
+
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            rows: List[Tuple[str, str, Optional[str], Optional[str], Optional[str], str]] = []
+            for trigger_id, board in changed:
+                try:
+                    extra = board.extras()
+                    rows.append((
+                        self.home_id,
+                        trigger_id,
+                        _dumps(board._state),
+                        _dumps(board._time),
+                        _dumps(extra) if extra else None,
+                        now,
+                    ))
+                except TypeError as exc:
+                    board._changed = True  # retried on the next snapshot
+                    if self.unpersistable.get(trigger_id) != str(exc):
+                        logger.warning("Blackboard of %s not persisted: %s", trigger_id, exc)
+                    self.unpersistable[trigger_id] = str(exc)
+                else:
+                    self.unpersistable.pop(trigger_id, None)
+
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO blackboards "
+                        "(home_id, trigger_id, state, time, extra, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    conn.executemany(
+                        "DELETE FROM blackboards WHERE home_id = ? AND trigger_id = ?",
+                        [(self.home_id, t) for t in removed],
+                    )
+            except sqlite3.Error:
+                # Nothing was written: keep it all pending for the next snapshot.
+                for _, board in changed:
+                    board._changed = True
+                self._removed.update(t for t in removed if t not in self._boards)
+                raise
+            return len(rows)
+
+    def restore(self) -> int:
+        """
+        Load every persisted blackboard for this home. Returns the number restored.
+        """
+        if self.db_path is None or not os.path.exists(self.db_path):
+            return 0
+        with self._lock:
+            conn = self._connect()
+            cur = conn.execute(
+                "SELECT trigger_id, state, time, extra FROM blackboards WHERE home_id = ?",
+                (self.home_id,),
+            )
+            count = 0
+            for trigger_id, state, time_, extra in cur:
+                # Refill a board already handed out (e.g. to a TriggerRuntime
+                # slot) in place, so its holder sees the restored state and
+                # its later writes still reach snapshots.
+                board = self._boards.get(trigger_id)
+                if board is None:
+                    board = self._boards[trigger_id] = Blackboard()
+                dict.clear(board)
+                board._state = _loads(state)
+                board._time = _loads(time_)
+                if extra is not None:
+                    dict.update(board, _loads(extra))
+                board._changed = False
+                self._removed.discard(trigger_id)
+                count += 1
+            return count
+
+    def start_autosnapshot(self, interval: float = 5.0) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def _loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.snapshot()
+                except Exception:  # pragma: no cover - keep the thread alive
+                    logger.exception("Blackboard snapshot failed")
+
+        self._thread = threading.Thread(target=_loop, name="blackboard-snapshot", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stop the autosnapshot thread, flush pending changes and close the database.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self.db_path is not None:
+            self.snapshot()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def measure_memory_per_trigger(n_triggers: int = 10000) -> Dict[str, float]:
+    """
+    Bytes allocated per trigger for a typical state-machine blackboard
+    ({'state': int, 'time': datetime}) as a plain dict vs a slotted Blackboard.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def _measure(factory: Any) -> float:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        boards = []
+        for _ in range(n_triggers):
+            b = factory()
+            b["state"] = 1
+            b["time"] = now
+            boards.append(b)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del boards
+        return (after - before) / n_triggers
+
+    return {
+        "dict_bytes_per_trigger": _measure(dict),
+        "blackboard_bytes_per_trigger": _measure(Blackboard),
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    print("[BLACKBOARD] memory:", measure_memory_per_trigger())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        store = BlackboardStore(path, home_id="bench")
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for i in range(10000):
+            board = store.get(f"trigger_{i}")
+            board["state"] = 1
+            board["time"] = now
+        t0 = time.perf_counter()
+        written = store.snapshot()
+        print(f"[BLACKBOARD] snapshot {written} rows in {(time.perf_counter()-t0):.3f}s")
+        store.close()
+
+        t0 = time.perf_counter()
+        restored = BlackboardStore(path, home_id="bench").restore()
+        print(f"[BLACKBOARD] restore {restored} rows in {(time.perf_counter()-t0):.3f}s")
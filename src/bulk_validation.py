@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from pydantic import TypeAdapter, ValidationError
+
+from model_def import HomeTriggerList, TriggerMachine
+
+
+RawItem = Union[Dict[str, Any], str, bytes]
+
+
+@lru_cache(maxsize=None)
+def get_type_adapter(tp: Any) -> TypeAdapter:
+    """
+    Build each TypeAdapter once per process; constructing one compiles a
+    validator and is far more expensive than a validation call.
+    """
+    return TypeAdapter(tp)
+
+
+@dataclass
+class ItemError:
+    """
+    Validation failure for one item. `index` is the item's position in the
+    input (or the trigger's position inside a home file); None means the
+    failure is not tied to a single item.
+    """
+
+    index: Optional[int]
+    source: str
+    errors: List[Dict[str, Any]]
+
+
+@dataclass
+class BulkResult:
+    valid: List[Any] = field(default_factory=list)
+    errors: List[ItemError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+@dataclass
+class HomeFileResult:
+    path: str
+    home: Optional[HomeTriggerList]
+    errors: List[ItemError] = field(default_factory=list)
+    trigger_count: int = 0
+
+
+def _error_list(exc: ValidationError) -> List[Dict[str, Any]]:
+    # Drop 'input'/'ctx'/'url' so results stay small and picklable across processes.
+    return [
+        {"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]}
+        for e in exc.errors(include_url=False)
+    ]
+
+
+def _validate_one(adapter: TypeAdapter, item: RawItem) -> Any:
+    if isinstance(item, (str, bytes)):
+        return adapter.validate_json(item)
+    return adapter.validate_python(item)
+
+
+def validate_trigger_machines(items: Sequence[RawItem], source: str = "") -> BulkResult:
+    """
+    Validate many TriggerMachines (dicts or JSON strings) and collect every
+    failure instead of stopping at the first. Items that validate are returned
+    in input order.
+
+    When every item is a dict the whole list is validated in one call first;
+    only if that fails does it fall back to per-item validation.
+    """
+    result = BulkResult()
+    if not items:
+        return result
+
+    if all(isinstance(item, dict) for item in items):
+        try:
+            result.valid = get_type_adapter(List[TriggerMachine]).validate_python(items)
+            return result
+        except ValidationError:
+            pass
+
+    adapter = get_type_adapter(TriggerMachine)
+    for i, item in enumerate(items):
+        try:
+            result.valid.append(_validate_one(adapter, item))
+        except ValidationError as exc:
+            result.errors.append(ItemError(i, source, _error_list(exc)))
+    return result
+
+
+def validate_home_bytes(data: Union[str, bytes], source: str = "", keep_model: bool = True) -> HomeFileResult:
+    """
+    Validate one HomeTriggerList document. On failure, errors are grouped per
+    TriggerMachine so a single bad trigger is reported by its index.
+    """
+    try:
+        home = get_type_adapter(HomeTriggerList).validate_json(data)
+        return HomeFileResult(source, home if keep_model else None, trigger_count=len(home.TriggerMachines))
+    except ValidationError as exc:
+        grouped: Dict[Optional[int], List[Dict[str, Any]]] = {}
+        for err in _error_list(exc):
+            loc = err["loc"]
+            index = loc[1] if len(loc) > 1 and loc[0] == "TriggerMachines" and isinstance(loc[1], int) else None
+            grouped.setdefault(index, []).append(err)
+        return HomeFileResult(
+            source,
+            None,
+            [ItemError(index, source, errs) for index, errs in grouped.items()],
+        )
+
+
+def _validate_home_file(path: str, keep_model: bool = True) -> HomeFileResult:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as exc:
+        return HomeFileResult(path, None, [ItemError(None, path, [{"loc": [], "msg": str(exc), "type": "os_error"}])])
+    return validate_home_bytes(data, source=path, keep_model=keep_model)
+
+
+def validate_home_files(
+    paths: Iterable[str],
+    max_workers: Optional[int] = None,
+    chunksize: int = 4,
+    keep_models: bool = True,
+) -> List[HomeFileResult]:
+    """
+    Validate many HomeTriggerList JSON files across a process pool.
+    Each worker keeps its own cached TypeAdapters. Results are in input order.
+    Pass max_workers=1 to validate in-process.
+
+    With keep_models=False only errors and trigger counts come back, which
+    avoids pickling every validated model back to the parent process.
+    """
+    paths = list(paths)
+    worker = partial(_validate_home_file, keep_model=keep_models)
+    if max_workers == 1 or len(paths) <= 1:
+        return [worker(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(worker, paths, chunksize=chunksize))
+
+
+def benchmark_validation(n_triggers: int = 2000, n_homes: int = 16, repeat: int = 3) -> Dict[str, float]:
+    """
+    Throughput of model_def validation, in objects per second.
+    """
+    import tempfile
+    import time
+
+    from trigger_pack import make_synthetic_home
+
+    home = make_synthetic_home(n_triggers)
+    dicts = [m.model_dump(mode="json") for m in home.TriggerMachines]
+
+    def _rate(fn: Any, count: int) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return count / best
+
+    results = {
+        "model_validate_per_object": _rate(lambda: [TriggerMachine.model_validate(d) for d in dicts], n_triggers),
+        "uncached_type_adapter_per_object": _rate(
+            lambda: [TypeAdapter(TriggerMachine).validate_python(d) for d in dicts[:200]], 200
+        ),
+        "bulk_list_adapter": _rate(lambda: validate_trigger_machines(dicts), n_triggers),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        home_json = make_synthetic_home(n_triggers).model_dump_json()
+        for i in range(n_homes):
+            path = os.path.join(tmp, f"home_{i}.json")
+            with open(path, "w") as f:
+                f.write(home_json)
+            paths.append(path)
+        homes_triggers = n_homes * n_triggers
+        results["home_files_serial"] = _rate(lambda: validate_home_files(paths, max_workers=1), homes_triggers)
+        results["home_files_process_pool"] = _rate(lambda: validate_home_files(paths), homes_triggers)
+        results["home_files_process_pool_errors_only"] = _rate(
+            lambda: validate_home_files(paths, keep_models=False), homes_triggers
+        )
+    return results
+
+
+if __name__ == "__main__":
+    for name, rate in benchmark_validation().items():
+        print(f"[VALIDATION] {name}: {rate:,.0f} triggers/s")
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import difflib
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sensor_catalog import DATA_DIR, SensorCatalog, SensorInfo, load_data_json
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_PATH_RE = re.compile(r"/home(?:/[A-Za-z0-9_]+)+")
+_STOP_WORDS = {"when", "the", "a", "an", "you", "your", "is", "are", "at", "in", "of", "to", "my", "me", "i", "after", "before", "once"}
+_FOLD = {
+    "refrigerator": "fridge", "cabinets": "cabinet", "cupboard": "cabinet", "doors": "door",
+    "meds": "medicine", "oven": "stove", "burner": "stove", "burners": "stove",
+    "cooker": "stove", "light": "lamp", "bath": "bathroom", "restroom": "bathroom",
+    "lounge": "living", "entrance": "front",
+    "finished": "finishes", "done": "finishes", "stops": "finishes", "opened": "opens", "closed": "closes",
+}
+
+# Verb phrases in event text -> (modality, edge). Edges: "rising" (0 -> 1,
+# or power crossing its threshold upwards) and "falling".
+_VERBS: List[Tuple[Tuple[str, ...], str, str]] = [
+    (("turns", "on"), "power", "rising"),
+    (("turns", "off"), "power", "falling"),
+    (("finishes",), "power", "falling"),
+    (("opens",), "contact", "rising"),
+    (("closes",), "contact", "falling"),
+    (("enter",), "motion", "rising"),
+    (("arrive",), "contact", "rising"),
+    (("wake",), "motion", "rising"),
+]
+_VERB_TOKENS = {w for phrase, _, _ in _VERBS for w in phrase} | {"up", "home"}
+# Events that are not about a device in the text.
+_SPECIAL_EVENTS = {
+    "arrive": {"sensors": ("contact_front_door", "motion_hallway_entry"), "activity": "Outside of Home"},
+    "wake": {"sensors": ("motion_bedroom",), "activity": "Sleeping"},
+}
+
+
+def _tokens(text: str) -> List[str]:
+    out = []
+    for word in _WORD_RE.findall(text.lower().replace("_", " ")):
+        word = _FOLD.get(word, word)
+        if word not in _STOP_WORDS:
+            out.append(word)
+    return out
+
+
+@dataclass(frozen=True)
+class EventCapability:
+    """
+    A detectable event and the sensors that detect it.
+
+    `edge` says what to look for on `modality`: "rising" (opens / turns on /
+    motion starts) or "falling" (closes / turns off / finishes). `activity`
+    is set for events defined by leaving an activity (waking up leaves
+    "Sleeping", arriving leaves "Outside of Home").
+    """
+
+    text: str
+    modality: str
+    edge: str
+    sensors: Tuple[SensorInfo, ...]
+    room: Optional[str] = None
+    activity: Optional[str] = None
+
+    @property
+    def paths(self) -> List[str]:
+        return [s.path for s in self.sensors]
+
+
+@dataclass
+class Match:
+    kind: str  # "event", "activity", "room" or "sensor"
+    name: str
+    score: float
+    sensors: List[SensorInfo] = field(default_factory=list)
+
+
+class CapabilityGraph:
+    """
+    Typed links between detectable events, activities, rooms, sensor ids,
+    modalities and concrete `/home/...` paths, built once from the data files.
+
+    Edges: event -> sensors (+ modality, edge, room, activity), activity ->
+    room, room -> sensors, and every sensor's id, path, location and aliases.
+    Exact lookups are dictionary hits; match() handles free text by scoring
+    names that share tokens with the query (an inverted index over name
+    tokens), with difflib fixing misspelled tokens against the vocabulary.
+    """
+
+    def __init__(
+        self,
+        catalog: SensorCatalog,
+        activities: Dict[str, Any],
+        detectable_events: List[str],
+    ) -> None:
+        self.catalog = catalog
+        self.activity_rooms: Dict[str, str] = dict(activities.get("activities", {}))
+        self.room_sensors: Dict[str, List[SensorInfo]] = {room: catalog.in_room(room) for room in catalog.rooms}
+        self.room_activities: Dict[str, List[str]] = {}
+        for activity, room in self.activity_rooms.items():
+            self.room_activities.setdefault(room, []).append(activity)
+
+        self.events: Dict[str, EventCapability] = {}
+        for text in detectable_events:
+            capability = self._resolve_event(text)
+            if capability is not None:
+                self.events[text] = capability
+        self._events_lower = {text.lower(): capability for text, capability in self.events.items()}
+
+        # name -> (kind, sensors); names are event texts, activities, rooms,
+        # sensor ids, paths, locations and aliases.
+        self._names: Dict[str, Tuple[str, List[SensorInfo]]] = {}
+        for text, capability in self.events.items():
+            self._names[text.lower()] = ("event", list(capability.sensors))
+        for activity, room in self.activity_rooms.items():
+            self._names[activity.lower()] = ("activity", self.room_sensors.get(room, []))
+        for room, sensors in self.room_sensors.items():
+            self._names[room.replace("_", " ")] = ("room", sensors)
+        for sensor in catalog:
+            for name in (sensor.sensor_id, sensor.path, sensor.location.replace("_", " "), *sensor.aliases):
+                self._names.setdefault(name.lower(), ("sensor", [sensor]))
+
+        self._name_tokens: Dict[str, Set[str]] = {name: set(_tokens(name)) for name in self._names}
+        self._by_token: Dict[str, Set[str]] = {}
+        for name, toks in self._name_tokens.items():
+            for tok in toks:
+                self._by_token.setdefault(tok, set()).add(name)
+        self._vocabulary = sorted(self._by_token)
+
+    @classmethod
+    def load(cls, data_dir: str = DATA_DIR) -> "CapabilityGraph":
+        return cls(
+            SensorCatalog.load(data_dir),
+            load_data_json("activities.json", data_dir),
+            load_data_json("detectable_events.json", data_dir),
+        )
+
+    # ---------------------------------------------------------------- building
+
+    def _resolve_event(self, text: str) -> Optional[EventCapability]:
+        words = _tokens(text)
+        verb = None
+        for phrase, modality, edge in _VERBS:
+            for i in range(len(words) - len(phrase) + 1):
+                if tuple(words[i:i + len(phrase)]) == phrase:
+                    verb = (phrase, modality, edge, i)
+                    break
+            if verb:
+                break
+        if verb is None:
+            return None
+        phrase, modality, edge, at = verb
+        target = [w for j, w in enumerate(words) if not (at <= j < at + len(phrase))]
+
+        special = _SPECIAL_EVENTS.get(phrase[0])
+        if special is not None:
+            sensors = tuple(self.catalog.by_id[s] for s in special["sensors"] if s in self.catalog.by_id)
+            return EventCapability(text, modality, edge, sensors, sensors[0].room if sensors else None,
+                                   special["activity"])
+
+        if modality == "motion":
+            room = self._best_room(target)
+            sensors = tuple(s for s in self.room_sensors.get(room, []) if s.modality == "motion") if room else ()
+            return EventCapability(text, modality, edge, sensors, room)
+
+        # Device events: sensors of the verb's modality whose location or
+        # aliases share the most tokens with the target ("fridge" ->
+        # kitchen_fridge_door). Sensors whose aliases describe the event
+        # ("microwave finished") are linked too, whatever their modality.
+        lowered = text.lower()
+        by_alias = [s for s in self.catalog if any(a.lower() in lowered or _alias_hit(a, words) for a in s.aliases)]
+        candidates: List[Tuple[int, SensorInfo]] = []
+        for sensor in self.catalog:
+            if sensor.modality != modality:
+                continue
+            overlap = len(set(target) & set(_tokens(sensor.location)))
+            if overlap:
+                candidates.append((overlap, sensor))
+        best = max((c[0] for c in candidates), default=0)
+        sensors = tuple(s for score, s in candidates if score == best)
+        extra = tuple(s for s in by_alias if s not in sensors)
+        if not sensors and not extra:
+            return None
+        room = sensors[0].room if sensors else extra[0].room
+        return EventCapability(text, modality, edge, sensors + extra, room)
+
+    def _best_room(self, words: List[str]) -> Optional[str]:
+        best, best_score = None, 0
+        for room in self.room_sensors:
+            score = len(set(words) & set(_tokens(room)))
+            if score > best_score:
+                best, best_score = room, score
+        return best
+
+    # ----------------------------------------------------------------- lookups
+
+    def sensor(self, key: str) -> Optional[SensorInfo]:
+        """
+        Exact lookup by sensor id or `/home/...` path.
+        """
+        return self.catalog.resolve(key)
+
+    def event(self, text: str) -> Optional[EventCapability]:
+        capability = self.events.get(text)
+        if capability is not None:
+            return capability
+        best = self.match(text, kinds=("event",), limit=1)
+        return self._events_lower.get(best[0].name) if best else None
+
+    def room_of_activity(self, activity: str) -> Optional[str]:
+        return self.activity_rooms.get(activity)
+
+    def sensors_in_room(self, room: str, modality: Optional[str] = None) -> List[SensorInfo]:
+        return [s for s in self.room_sensors.get(room, []) if modality is None or s.modality == modality]
+
+    def activities_in_room(self, room: str) -> List[str]:
+        return list(self.room_activities.get(room, []))
+
+    def _fix_token(self, token: str) -> Optional[str]:
+        if token in self._by_token:
+            return token
+        close = difflib.get_close_matches(token, self._vocabulary, n=1, cutoff=0.8)
+        return close[0] if close else None
+
+    def match(
+        self,
+        text: str,
+        kinds: Optional[Iterable[str]] = None,
+        limit: int = 5,
+        min_score: float = 0.3,
+    ) -> List[Match]:
+        """
+        Names (events, activities, rooms, sensors) that best match free text,
+        scored by Dice overlap of their tokens with the query's. Names that
+        share only a verb ("opens") with a query that names a thing are not
+        candidates.
+        """
+        wanted = set(kinds) if kinds else None
+        exact = self._names.get(text.lower().strip())
+        if exact is not None and (wanted is None or exact[0] in wanted):
+            return [Match(exact[0], text.lower().strip(), 1.0, list(exact[1]))]
+
+        words = _tokens(text)
+        query: Set[str] = set()
+        for token in words:
+            fixed = self._fix_token(token)
+            if fixed is not None:
+                query.add(fixed)
+        nouns = query - _VERB_TOKENS
+        if not query or (not nouns and set(words) - _VERB_TOKENS):
+            # Nothing known, or it names only things the home has no sensor for.
+            return []
+        # When the query names a thing, a match must share it: "when the
+        # garage opens" shares only its verb with "when the fridge opens".
+        candidates: Set[str] = set()
+        for token in nouns or query:
+            candidates |= self._by_token.get(token, set())
+
+        matches = []
+        for name in candidates:
+            kind, sensors = self._names[name]
+            if wanted is not None and kind not in wanted:
+                continue
+            toks = self._name_tokens[name]
+            score = 2 * len(query & toks) / (len(query) + len(toks))
+            if score >= min_score:
+                matches.append(Match(kind, name, round(score, 3), list(sensors)))
+        matches.sort(key=lambda m: (-m.score, m.kind != "event", m.name))
+        return matches[:limit]
+
+    def paths_for(self, text: str) -> List[str]:
+        """
+        Concrete paths most likely meant by `text` (an event, activity, room,
+        device name, alias, sensor id or path).
+        """
+        sensor = self.sensor(text)
+        if sensor is not None:
+            return [sensor.path]
+        capability = self.events.get(text)
+        if capability is not None:
+            return capability.paths
+        matches = self.match(text, limit=1)
+        return [s.path for s in matches[0].sensors] if matches else []
+
+    def is_detectable(self, text: str, min_score: float = 0.6) -> bool:
+        """
+        Whether `text` names something the home's sensors can observe.
+        """
+        return bool(self.match(text, min_score=min_score, limit=1))
+
+    def unknown_paths(self, source: str) -> List[str]:
+        """
+        `/home/...` paths used in generated code that no sensor has.
+        """
+        return sorted({p for p in _PATH_RE.findall(source) if p not in self.catalog.by_path})
+
+    def resolve_request(self, texts: Iterable[str], limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        Compact sensor resolutions for the phrases of a reminder request, in
+        the shape passed to code generation.
+        """
+        out = []
+        for text in texts:
+            if not text:
+                continue
+            seen: Set[Tuple[str, ...]] = set()
+            for m in self.match(text, limit=limit + 2):
+                key = tuple(sorted(s.path for s in m.sensors))
+                if key in seen or len(seen) >= limit:
+                    continue
+                seen.add(key)
+                entry: Dict[str, Any] = {
+                    "phrase": text,
+                    "matched": m.name,
+                    "kind": m.kind,
+                    "paths": {s.path: s.modality for s in m.sensors},
+                }
+                capability = self._events_lower.get(m.name) if m.kind == "event" else None
+                if capability is not None:
+                    entry["edge"] = capability.edge
+                    if capability.activity:
+                        entry["leaves_activity"] = capability.activity
+                out.append(entry)
+        return out
+
+
+def _alias_hit(alias: str, words: List[str]) -> bool:
+    alias_tokens = set(_tokens(alias))
+    return bool(alias_tokens) and alias_tokens <= set(words)
+
+
+@lru_cache(maxsize=1)
+def default_graph() -> CapabilityGraph:
+    """
+    The graph for src/data, built once per process.
+    """
+    return CapabilityGraph.load()
+
+
+if __name__ == "__main__":
+    import time
+
+    t0 = time.perf_counter()
+    graph = CapabilityGraph.load()
+    print(f"[CAPABILITY] built in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    for text, capability in graph.events.items():
+        print(f"  {text!r}: {capability.modality}/{capability.edge} -> {capability.paths}"
+              + (f" (leaves {capability.activity})" if capability.activity else ""))
+
+    queries = ["when the microwave finishes", "refrigerator door", "micowave", "kitchen", "Cooking Dinner",
+               "medicine cabinet", "stove burner left", "contact_front_door"]
+    for q in queries:
+        print(f"  {q!r} -> {graph.paths_for(q)}")
+    n = 20000
+    t0 = time.perf_counter()
+    for i in range(n):
+        graph.paths_for(queries[i % len(queries)])
+    print(f"[CAPABILITY] {n:,} lookups, {(time.perf_counter() - t0) / n * 1e6:.1f} us each")
@@ -2,11 +2,10 @@ import os
 import time
 import json
 import weave
-import sqlite3
-from datetime import datetime, timezone
-import uuid
+from datetime import datetime
 from agents import set_trace_processors
 from code_generation import CodeGeneration
+from conversation_db import get_conversation_db
 from weave.integrations.openai_agents.openai_agents import WeaveTracingProcessor
 
 from re import L
@@ -126,40 +125,22 @@ class ChatAssistant:
 
     def init_db(self) -> None:
         """
-        Ensure the SQLite database and 'conversations' table exist.
+        Open (once per process) the shared conversation store for DB_PATH;
+        the 'conversations' table is created if missing.
         """
-        conn = sqlite3.connect(self.DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS conversations (
-                id TEXT PRIMARY KEY,
-                ended_at TEXT NOT NULL,
-                conversation_str TEXT NOT NULL
-            )
-            """
-        )
-        conn.commit()
-        conn.close()
+        self.db = get_conversation_db(self.DB_PATH)
 
 
-    def save_conversation_to_db(self, conversation_str: str) -> None:
+    def save_conversation_to_db(self, conversation_str: str, conversation_id: Optional[str] = None) -> str:
         """
-        Append a full conversation transcript to the SQLite database.
+        Append a full conversation transcript to the SQLite database. The write
+        is queued to the store's background writer; returns the row id (the
+        session id when given, which links the transcript to its session).
         """
         print(f"[DB] Saving conversation of length {len(conversation_str)} to {self.DB_PATH}")
-        conn = sqlite3.connect(self.DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO conversations (id, ended_at, conversation_str) VALUES (?, ?, ?)",
-            (
-                str(uuid.uuid4()),
-                datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                conversation_str
-            ),
-        )
-        conn.commit()
-        conn.close()
+        if getattr(self, "db", None) is None:
+            self.init_db()
+        return self.db.save(conversation_str, conversation_id)
     
     @function_tool
     async def intent_extraction_agent(wrapper: RunContextWrapper[ConversationState], conversation: str):
@@ -332,7 +313,7 @@ class ChatAssistant:
         }
 
 
-    async def run_chat(self):
+    async def run_chat(self, session_id: Optional[str] = None):
         class ConversationStore:
             """
             Simple in-memory store of conversation turns. Maintains chronological
@@ -353,14 +334,23 @@ class ChatAssistant:
         # Ensure DB/table exists before starting the chat loop
         self.init_db()
 
-        # Seed initial conversation state and wrapper
+        # Seed initial conversation state and wrapper, or pick up a stored session
         state = ConversationState(
             state=ConversationStateEnum.NEED_WHAT,
             slots=Slots(),
             feasibility=Feasibility(),
         )
-        wrapper = RunContextWrapper[ConversationState](context=state)
         store = ConversationStore()
+        resumed = self.db.resume(session_id) if session_id else None
+        if resumed is not None:
+            if resumed.state is not None:
+                state = ConversationState.model_validate(resumed.state)
+            for turn in self.db.turns(session_id):
+                store._messages.append({"role": turn["role"], "content": turn["content"]})
+            print(f"[DB] Resumed session {session_id} at turn {resumed.turn_count} ({state.state.value})")
+        else:
+            session_id = self.db.start_session(session_id)
+        wrapper = RunContextWrapper[ConversationState](context=state)
 
         print("Type your message. Use /quit to exit.")
         while True:
@@ -371,6 +361,7 @@ class ChatAssistant:
 
                 # Record user message and pass full history as context
                 store.append_user(user_text)
+                self.db.append_turn(session_id, "user", user_text)
                 
                 conversation_str = "\n".join(f"{m['role']}: {m['content']}" for m in store._messages)
 
@@ -380,6 +371,8 @@ class ChatAssistant:
                 print(f"Assistant: {assistant_reply}")
 
                 store.append_assistant(assistant_reply)
+                state_dump = wrapper.context if isinstance(wrapper.context, dict) else wrapper.context.model_dump(mode="json")
+                self.db.append_turn(session_id, "assistant", assistant_reply, state_dump)
                 print("[DEBUG] Finished Appending Assistant Reply")
 
                 # When the chat signals completion, persist conversation and trigger code generation
@@ -388,7 +381,8 @@ class ChatAssistant:
                     final_message = f"\nassistant: {assistant_reply}"
                     final_str = conversation_str + final_message
                     print(f"[DB] Final conversation length before save: {len(final_str)}")
-                    self.save_conversation_to_db(conversation_str=final_str)
+                    self.save_conversation_to_db(conversation_str=final_str, conversation_id=session_id)
+                    self.db.end_session(session_id)
 
                     # Kick off code generation based on the final state
                     try:
@@ -1,9 +1,11 @@
+import asyncio
 import json
 from openai import OpenAI
 from typing import Any
 from dotenv import load_dotenv
 
 
+from capability_graph import default_graph
 from prompts import CODE_GENERATION_PROMPT
 
 load_dotenv()
@@ -49,11 +51,22 @@ class CodeGeneration:
         """
         client = OpenAI()
 
-        resp = client.responses.create(
+        # Resolve the sensors the request talks about up front, so the model
+        # gets concrete paths instead of guessing them from the raw JSON files.
+        graph = default_graph()
+        payload = dict(state)
+        # Callers pass a ConversationState dump (slots nested) or the slots themselves.
+        slots = state.get("slots") or state
+        payload["resolved_sensors"] = graph.resolve_request([slots.get("what"), *(slots.get("constraints") or [])])
+
+        # The client is synchronous; run it in a worker thread so one user's
+        # code generation does not stall the event loop for everyone else.
+        resp = await asyncio.to_thread(
+            client.responses.create,
             model="gpt-5.1",
             instructions=CODE_GENERATION_PROMPT,
             reasoning={"effort": "medium"},
-            input=json.dumps(state),
+            input=json.dumps(payload),
         )
 
         raw_text = _extract_output_text(resp)
@@ -61,12 +74,16 @@ class CodeGeneration:
             raise RuntimeError("Code generation returned empty output_text")
 
         # The prompt requires a single JSON object; parse and return it.
-        return json.loads(raw_text)
+        result = json.loads(raw_text)
+        unknown = graph.unknown_paths(
+            (result.get("generated_trigger_code") or "") + "\n" + (result.get("generated_cancel_code") or "")
+        )
+        if unknown:
+            print(f"[CODEGEN] generated code reads unknown sensor paths: {unknown}")
+        return result
 
 
 if __name__ == "__main__":
-    import asyncio
-
     # Example dummy state; replace with whatever your code-gen prompt expects
     example_state = {
 
@@ -0,0 +1,1401 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import base64
+import csv
+import datetime
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+_STOP = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    ended_at TEXT NOT NULL,
+    conversation_str TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    home_id TEXT,
+    started_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    ended_at TEXT,
+    turn_count INTEGER NOT NULL DEFAULT 0,
+    state_seq INTEGER,
+    latest_state TEXT,
+    source TEXT NOT NULL DEFAULT 'live',
+    state_name TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_by_ended_at ON sessions (ended_at);
+CREATE INDEX IF NOT EXISTS sessions_by_updated_at ON sessions (updated_at);
+CREATE INDEX IF NOT EXISTS conversations_by_ended_at ON conversations (ended_at, id);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state_snapshots (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversations_archive (
+    id TEXT PRIMARY KEY,
+    ended_at TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    dict_id INTEGER,
+    chars INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_archive_by_ended_at ON conversations_archive (ended_at, id);
+CREATE TABLE IF NOT EXISTS archive_dicts (
+    id INTEGER PRIMARY KEY,
+    codec TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# Full-text index over conversations.conversation_str. External content: the
+# index stores only tokens and reads text back from `conversations`, kept in
+# sync by triggers (which is why saves upsert rather than INSERT OR REPLACE:
+# a REPLACE deletes without firing delete triggers).
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE conversations_fts USING fts5(
+    conversation_str,
+    content = 'conversations',
+    content_rowid = 'rowid',
+    tokenize = 'porter unicode61'
+);
+CREATE TRIGGER conversations_fts_insert AFTER INSERT ON conversations BEGIN
+    INSERT INTO conversations_fts (rowid, conversation_str) VALUES (new.rowid, new.conversation_str);
+END;
+CREATE TRIGGER conversations_fts_delete AFTER DELETE ON conversations BEGIN
+    INSERT INTO conversations_fts (conversations_fts, rowid, conversation_str)
+    VALUES ('delete', old.rowid, old.conversation_str);
+END;
+CREATE TRIGGER conversations_fts_update AFTER UPDATE OF conversation_str ON conversations BEGIN
+    INSERT INTO conversations_fts (conversations_fts, rowid, conversation_str)
+    VALUES ('delete', old.rowid, old.conversation_str);
+    INSERT INTO conversations_fts (rowid, conversation_str) VALUES (new.rowid, new.conversation_str);
+END;
+INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild');
+"""
+
+# Ended sessions rolled up per (day, final state, turn count), maintained by
+# triggers, so the analytics read a few thousand rows however many sessions
+# there are. Open sessions do not touch it until they end.
+_STATS_SCHEMA = """
+CREATE TABLE session_stats (
+    day TEXT NOT NULL,
+    state_name TEXT NOT NULL,
+    turn_count INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (day, state_name, turn_count)
+) WITHOUT ROWID;
+CREATE TRIGGER session_stats_insert AFTER INSERT ON sessions WHEN new.ended_at IS NOT NULL BEGIN
+    INSERT INTO session_stats (day, state_name, turn_count, n)
+    VALUES (substr(new.ended_at, 1, 10), COALESCE(new.state_name, 'UNKNOWN'), new.turn_count, 1)
+    ON CONFLICT (day, state_name, turn_count) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER session_stats_update AFTER UPDATE OF ended_at, state_name, turn_count ON sessions
+WHEN old.ended_at IS NOT NULL OR new.ended_at IS NOT NULL BEGIN
+    UPDATE session_stats SET n = n - 1
+    WHERE old.ended_at IS NOT NULL AND day = substr(old.ended_at, 1, 10)
+      AND state_name = COALESCE(old.state_name, 'UNKNOWN') AND turn_count = old.turn_count;
+    INSERT INTO session_stats (day, state_name, turn_count, n)
+    SELECT substr(new.ended_at, 1, 10), COALESCE(new.state_name, 'UNKNOWN'), new.turn_count, 1
+    WHERE new.ended_at IS NOT NULL
+    ON CONFLICT (day, state_name, turn_count) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER session_stats_delete AFTER DELETE ON sessions WHEN old.ended_at IS NOT NULL BEGIN
+    UPDATE session_stats SET n = n - 1
+    WHERE day = substr(old.ended_at, 1, 10)
+      AND state_name = COALESCE(old.state_name, 'UNKNOWN') AND turn_count = old.turn_count;
+END;
+INSERT INTO session_stats (day, state_name, turn_count, n)
+SELECT substr(ended_at, 1, 10), COALESCE(state_name, 'UNKNOWN'), turn_count, COUNT(*)
+FROM sessions WHERE ended_at IS NOT NULL GROUP BY 1, 2, 3;
+"""
+
+# Constant SQL strings, so sqlite3's per-connection statement cache keeps them
+# prepared for the lifetime of the connection.
+_INSERT = (
+    "INSERT INTO conversations (id, ended_at, conversation_str) VALUES (?, ?, ?) "
+    "ON CONFLICT (id) DO UPDATE SET ended_at = excluded.ended_at, conversation_str = excluded.conversation_str"
+)
+_SELECT_ONE = "SELECT id, ended_at, conversation_str FROM conversations WHERE id = ?"
+_SELECT_RECENT = "SELECT id, ended_at, conversation_str FROM conversations ORDER BY ended_at DESC LIMIT ?"
+# Keyset pages: (ended_at, id) descending, continuing strictly after the
+# last row of the previous page, so page N costs the same as page 1.
+_PAGE_COLUMNS = (
+    "SELECT c.rowid, c.id, c.ended_at, substr(c.conversation_str, 1, ?), length(c.conversation_str), "
+    "s.turn_count, s.state_name FROM conversations c LEFT JOIN sessions s ON s.id = c.id "
+)
+# Archived rows are merged in by the same keyset; their preview (NULL here)
+# is filled in after decompression.
+_PAGE_ARCHIVED_COLUMNS = (
+    "SELECT NULL, a.id, a.ended_at, NULL, a.chars, s.turn_count, s.state_name "
+    "FROM conversations_archive a LEFT JOIN sessions s ON s.id = a.id "
+)
+_PAGE_FIRST = (
+    _PAGE_COLUMNS + "UNION ALL " + _PAGE_ARCHIVED_COLUMNS + "ORDER BY 3 DESC, 2 DESC LIMIT ?"
+)
+_PAGE_AFTER = (
+    _PAGE_COLUMNS + "WHERE (c.ended_at, c.id) < (?, ?) UNION ALL "
+    + _PAGE_ARCHIVED_COLUMNS + "WHERE (a.ended_at, a.id) < (?, ?) ORDER BY 3 DESC, 2 DESC LIMIT ?"
+)
+# Search pages run newest-first by rowid, which FTS5 can walk directly.
+_SEARCH = (
+    "SELECT f.rowid, c.id, c.ended_at, snippet(conversations_fts, 0, '[', ']', '...', ?), "
+    "length(c.conversation_str), s.turn_count, s.state_name "
+    "FROM conversations_fts f JOIN conversations c ON c.rowid = f.rowid LEFT JOIN sessions s ON s.id = c.id "
+    "WHERE conversations_fts MATCH ? AND f.rowid < ? ORDER BY f.rowid DESC LIMIT ?"
+)
+_SEARCH_COUNT = "SELECT COUNT(*) FROM conversations_fts WHERE conversations_fts MATCH ?"
+_TURN_HISTOGRAM = (
+    "SELECT turn_count, SUM(n) FROM session_stats WHERE day >= ? GROUP BY turn_count HAVING SUM(n) > 0 "
+    "ORDER BY turn_count"
+)
+_STATE_COUNTS = (
+    "SELECT state_name, SUM(n) FROM session_stats WHERE day >= ? GROUP BY state_name HAVING SUM(n) > 0 "
+    "ORDER BY 2 DESC"
+)
+_OPEN_STATE_COUNTS = (
+    "SELECT COALESCE(state_name, 'UNKNOWN'), COUNT(*) FROM sessions WHERE ended_at IS NULL GROUP BY 1 ORDER BY 2 DESC"
+)
+_COUNT = "SELECT (SELECT COUNT(*) FROM conversations) + (SELECT COUNT(*) FROM conversations_archive)"
+_SELECT_ARCHIVED = "SELECT id, ended_at, codec, dict_id, body FROM conversations_archive WHERE id = ?"
+_SELECT_ARCHIVED_RECENT = (
+    "SELECT id, ended_at, codec, dict_id, body FROM conversations_archive ORDER BY ended_at DESC LIMIT ?"
+)
+_SELECT_ARCHIVABLE = (
+    "SELECT id, ended_at, conversation_str FROM conversations WHERE ended_at < ? ORDER BY ended_at, id LIMIT ?"
+)
+_INSERT_ARCHIVED = (
+    "INSERT OR REPLACE INTO conversations_archive (id, ended_at, codec, dict_id, chars, body) VALUES (?, ?, ?, ?, ?, ?)"
+)
+_DELETE_HOT = "DELETE FROM conversations WHERE id = ?"
+_DELETE_ARCHIVED = "DELETE FROM conversations_archive WHERE id = ?"
+_SELECT_DICT = "SELECT codec, data FROM archive_dicts WHERE id = ?"
+_TIER_SIZES = (
+    "SELECT 'hot', COUNT(*), COALESCE(SUM(length(conversation_str)), 0), "
+    "COALESCE(SUM(length(CAST(conversation_str AS BLOB))), 0) FROM conversations "
+    "UNION ALL SELECT 'archive', COUNT(*), COALESCE(SUM(chars), 0), COALESCE(SUM(length(body)), 0) "
+    "FROM conversations_archive"
+)
+_INSERT_LEGACY = "INSERT OR IGNORE INTO conversations (id, ended_at, conversation_str) VALUES (?, ?, ?)"
+
+_INSERT_SESSION = (
+    "INSERT OR IGNORE INTO sessions (id, home_id, started_at, updated_at, source) VALUES (?, ?, ?, ?, ?)"
+)
+_NEXT_SEQ = "SELECT turn_count FROM sessions WHERE id = ?"
+_INSERT_TURN = "INSERT OR IGNORE INTO turns (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)"
+_INSERT_SNAPSHOT = "INSERT OR REPLACE INTO state_snapshots (session_id, seq, state, created_at) VALUES (?, ?, ?, ?)"
+_BUMP_SESSION = "UPDATE sessions SET turn_count = ?, updated_at = ? WHERE id = ?"
+_BUMP_SESSION_STATE = (
+    "UPDATE sessions SET turn_count = ?, updated_at = ?, state_seq = ?, latest_state = ?, state_name = ? WHERE id = ?"
+)
+_END_SESSION = "UPDATE sessions SET ended_at = ?, updated_at = ? WHERE id = ?"
+_SELECT_SESSION = (
+    "SELECT id, home_id, started_at, updated_at, ended_at, turn_count, state_seq, latest_state, source "
+    "FROM sessions WHERE id = ?"
+)
+_SELECT_TURNS = (
+    "SELECT seq, role, content, created_at FROM turns WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?"
+)
+_SELECT_OPEN = (
+    "SELECT id FROM sessions WHERE ended_at IS NULL AND updated_at < ? ORDER BY updated_at LIMIT ?"
+)
+
+
+def _state_columns(state: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    if state is None:
+        return None, None
+    name = state.get("state")
+    return json.dumps(state, default=str), str(getattr(name, "value", name)) if name is not None else None
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def connect(path: str, readonly: bool = False, cache_kib: int = 16 * 1024, mmap_bytes: int = 64 * 1024 * 1024) -> sqlite3.Connection:
+    """
+    A connection tuned for the chat workload: WAL (readers never block the
+    writer), synchronous=NORMAL (durable at checkpoints, no fsync per commit),
+    a larger page cache, in-memory temp tables and memory-mapped reads.
+    """
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+    conn.execute("PRAGMA busy_timeout=30000")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+@dataclass
+class SessionState:
+    """
+    What resume() returns. `state` is the latest ConversationState snapshot
+    (a dict), or None if no turn carried one.
+    """
+
+    session_id: str
+    home_id: Optional[str]
+    started_at: str
+    updated_at: str
+    ended_at: Optional[str]
+    turn_count: int
+    state_seq: Optional[int]
+    state: Optional[Dict[str, Any]]
+    source: str
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """
+    Create missing tables and indexes, and bring older files up to date:
+    sessions.state_name (the ConversationState enum value of the latest
+    snapshot), the session_stats rollup and the full-text index, both built
+    from existing rows the first time.
+    """
+    conn.executescript(_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+    if "state_name" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN state_name TEXT")
+        conn.execute("UPDATE sessions SET state_name = json_extract(latest_state, '$.state') WHERE latest_state IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS sessions_by_state ON sessions (ended_at, state_name)")
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_stats'"
+    ).fetchone()
+    if not has_stats:
+        conn.executescript(_STATS_SCHEMA)
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+    ).fetchone()
+    if not has_fts:
+        conn.executescript(_FTS_SCHEMA)
+    conn.commit()
+
+
+class ConversationDB:
+    """
+    Long-lived persistence for conversations: finished transcripts
+    (`conversations`) and per-turn session storage (`sessions`, `turns`,
+    `state_snapshots`).
+
+    One writer thread owns the write connection. save() only enqueues and
+    returns the new row id; the writer drains everything pending into a single
+    executemany() and commit (group commit), so many saves cost one WAL append.
+    Reads go through a small pool of read-only connections, which under WAL
+    never wait for the writer.
+
+    save_async() is for coroutines that need the row on disk before they go
+    on: it resolves once the batch containing it has committed, without
+    blocking the event loop.
+
+    Sessions are written one turn at a time, so an abandoned chat keeps every
+    turn up to the last one. Each session row carries its turn count and the
+    latest state snapshot, updated in the same transaction as the turn, which
+    makes resume() a single-row read.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        pool_size: int = 4,
+        flush_interval: float = 0.02,
+        max_batch: int = 1000,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._write_conn = connect(path)
+        ensure_schema(self._write_conn)
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(max(1, pool_size)):
+            self._readers.put(connect(path, readonly=True))
+
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.submitted = 0  # ops queued so far; ops are processed in this order
+        self.processed = 0  # ops committed or failed so far
+        self._submit_lock = threading.Lock()
+        self._codecs: Dict[Tuple[str, Optional[int]], _ArchiveCodec] = {}
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._closed = False
+        self._stopped = False  # the writer has exited; nothing queued will be written
+        self._writer_error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._run, name="conversation-db-writer", daemon=True)
+        self._writer.start()
+
+    # ------------------------------------------------------------------ writing
+
+    def _check_writable(self) -> None:
+        if self._writer_error is not None:
+            raise RuntimeError(f"ConversationDB writer stopped: {self._writer_error}") from self._writer_error
+        if self._closed or self._stopped:
+            raise RuntimeError("ConversationDB is closed")
+
+    def _submit(self, op: str, params: Tuple[Any, ...], waiter: Any = None) -> None:
+        self._check_writable()
+        with self._submit_lock:
+            self.submitted += 1
+            self._queue.put((op, params, waiter))
+
+    async def _submit_and_wait(self, op: str, params: Tuple[Any, ...]) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._submit(op, params, (loop, future))
+        await future
+
+    def save(self, conversation_str: str, conversation_id: Optional[str] = None, ended_at: Optional[str] = None) -> str:
+        """
+        Queue one transcript for writing and return its id.
+        """
+        conversation_id = conversation_id or str(uuid.uuid4())
+        self._submit("conversation", (conversation_id, ended_at or _now_iso(), conversation_str))
+        return conversation_id
+
+    async def save_async(self, conversation_str: str, conversation_id: Optional[str] = None, ended_at: Optional[str] = None) -> str:
+        """
+        Like save(), but resolves once the row is committed.
+        """
+        conversation_id = conversation_id or str(uuid.uuid4())
+        await self._submit_and_wait("conversation", (conversation_id, ended_at or _now_iso(), conversation_str))
+        return conversation_id
+
+    def start_session(self, session_id: Optional[str] = None, home_id: Optional[str] = None) -> str:
+        """
+        Queue a new session (a no-op if `session_id` already exists) and return its id.
+        """
+        session_id = session_id or str(uuid.uuid4())
+        now = _now_iso()
+        self._submit("session", (session_id, home_id, now, now, "live"))
+        return session_id
+
+    def append_turn(self, session_id: str, role: str, content: str, state: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Queue one turn of `session_id`. With `state` (a ConversationState dump),
+        the snapshot is stored with the turn and becomes the session's latest
+        state in the same transaction.
+        """
+        self._submit("turn", (session_id, role, content, _now_iso(), *_state_columns(state)))
+
+    async def append_turn_async(self, session_id: str, role: str, content: str, state: Optional[Dict[str, Any]] = None) -> None:
+        await self._submit_and_wait("turn", (session_id, role, content, _now_iso(), *_state_columns(state)))
+
+    def end_session(self, session_id: str, ended_at: Optional[str] = None) -> None:
+        ended_at = ended_at or _now_iso()
+        self._submit("end", (ended_at, ended_at, session_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until everything queued so far is committed; False on timeout.
+        Raises RuntimeError once the DB is closed or its writer has died.
+        """
+        self._check_writable()
+        done = threading.Event()
+        self._queue.put(done)
+        if self._stopped:
+            self._check_writable()  # stopped as we queued; the drain may have missed it
+        finished = done.wait(timeout)
+        if self._writer_error is not None:
+            self._check_writable()
+        return finished
+
+    def _run(self) -> None:
+        try:
+            self._write_loop()
+        except BaseException as exc:
+            self._writer_error = exc
+            print(f"[DB] writer stopped: {exc!r}")
+        finally:
+            self._stopped = True
+            # Release whoever waits on items the writer will never take.
+            error = RuntimeError("ConversationDB is closed")
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is not _STOP and item[2] is not None:
+                    loop, future = item[2]
+                    loop.call_soon_threadsafe(_resolve, future, error)
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            ops: List[Tuple[str, Tuple[Any, ...]]] = []
+            waiters: List[Any] = []
+            events: List[threading.Event] = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    events.append(item)
+                    break  # a flush() commits what is pending right away
+                op, params, waiter = item
+                ops.append((op, params))
+                if waiter is not None:
+                    waiters.append(waiter)
+                if len(ops) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            error: Optional[BaseException] = None
+            try:
+                error = self._commit(ops)
+            except Exception as exc:
+                # Not an SQLite error: fail this batch, keep the writer alive
+                # for the next one.
+                if self._write_conn.in_transaction:
+                    self._write_conn.rollback()
+                self.failed += len(ops)
+                print(f"[DB] Failed to write {len(ops)} records: {exc}")
+                error = exc
+            except BaseException as exc:
+                self._writer_error = error = exc  # before the waiters wake, so flush() raises
+                raise
+            finally:
+                self.processed += len(ops)
+                for loop, future in waiters:
+                    loop.call_soon_threadsafe(_resolve, future, error)
+                for event in events:
+                    event.set()
+            if stop:
+                return
+
+    def _commit(self, ops: List[Tuple[str, Tuple[Any, ...]]]) -> Optional[BaseException]:
+        if not ops:
+            return None
+        conn = self._write_conn
+        try:
+            # IMMEDIATE takes the write lock up front, so writers in other
+            # processes sharing the file wait (busy_timeout) instead of
+            # failing to upgrade a read transaction.
+            conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                # Turn sequence numbers are allocated here, inside the write
+                # transaction, so they are dense and ordered per session.
+                seqs: Dict[str, int] = {}
+                conversations = []
+                for op, params in ops:
+                    if op == "conversation":
+                        conversations.append(params)
+                    elif op == "session":
+                        conn.execute(_INSERT_SESSION, params)
+                    elif op == "turn":
+                        session_id, role, content, created_at, state_json, state_name = params
+                        seq = seqs.get(session_id)
+                        if seq is None:
+                            row = conn.execute(_NEXT_SEQ, (session_id,)).fetchone()
+                            if row is None:  # turn for a session nobody started
+                                conn.execute(_INSERT_SESSION, (session_id, None, created_at, created_at, "live"))
+                                row = (0,)
+                            seq = row[0]
+                        conn.execute(_INSERT_TURN, (session_id, seq, role, content, created_at))
+                        if state_json is None:
+                            conn.execute(_BUMP_SESSION, (seq + 1, created_at, session_id))
+                        else:
+                            conn.execute(_INSERT_SNAPSHOT, (session_id, seq, state_json, created_at))
+                            conn.execute(_BUMP_SESSION_STATE, (seq + 1, created_at, seq, state_json, state_name, session_id))
+                        seqs[session_id] = seq + 1
+                    elif op == "end":
+                        conn.execute(_END_SESSION, params)
+                if conversations:
+                    conn.executemany(_INSERT, conversations)
+                    # A saved id lives in the hot tier only, even if it was archived.
+                    conn.executemany(_DELETE_ARCHIVED, [(params[0],) for params in conversations])
+        except sqlite3.Error as exc:
+            self.failed += len(ops)
+            print(f"[DB] Failed to write {len(ops)} records: {exc}")
+            return exc
+        self.written += len(ops)
+        self.batches += 1
+        return None
+
+    # ------------------------------------------------------------------ reading
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a read-only connection from the pool.
+        """
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, str]]:
+        """
+        One conversation by id, from the hot table or, failing that, the
+        archive (decompressed).
+        """
+        with self.reader() as conn:
+            row = conn.execute(_SELECT_ONE, (conversation_id,)).fetchone()
+            if row is None:
+                archived = conn.execute(_SELECT_ARCHIVED, (conversation_id,)).fetchone()
+                if archived is not None:
+                    row = (archived[0], archived[1], self._unarchive(conn, *archived[2:]))
+        return _as_dict(row) if row else None
+
+    def recent(self, limit: int = 20) -> List[Dict[str, str]]:
+        with self.reader() as conn:
+            rows = conn.execute(_SELECT_RECENT, (limit,)).fetchall()
+            if len(rows) < limit:  # archive() only moves the oldest rows, so the rest come from there
+                rows += [
+                    (a[0], a[1], self._unarchive(conn, *a[2:]))
+                    for a in conn.execute(_SELECT_ARCHIVED_RECENT, (limit - len(rows),))
+                ]
+        return [_as_dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self.reader() as conn:
+            return conn.execute(_COUNT).fetchone()[0]
+
+    def page(self, limit: int = 50, cursor: Optional[str] = None, preview_chars: int = 200) -> Dict[str, Any]:
+        """
+        One page of conversations, newest first, with a transcript preview
+        instead of the full text. Pass the returned `next_cursor` back to get
+        the following page (None on the last page).
+        """
+        with self.reader() as conn:
+            if cursor:
+                ended_at, conversation_id = _decode_cursor(cursor)
+                rows = conn.execute(
+                    _PAGE_AFTER, (preview_chars, ended_at, conversation_id, ended_at, conversation_id, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(_PAGE_FIRST, (preview_chars, limit)).fetchall()
+            items = [_page_item(row, "preview") for row in rows]
+            for item, row in zip(items, rows):
+                if row[0] is None:  # archived
+                    archived = conn.execute(_SELECT_ARCHIVED, (row[1],)).fetchone()
+                    item["preview"] = self._unarchive(conn, *archived[2:])[:preview_chars]
+        next_cursor = _encode_cursor(rows[-1][2], rows[-1][1]) if len(rows) == limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def search(
+        self,
+        query: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        raw: bool = False,
+        snippet_tokens: int = 16,
+        with_total: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Full-text search, newest match first, keyset-paginated like page().
+        Plain text matches conversations containing every word (stemmed,
+        `word*` for prefixes); raw=True passes FTS5 query syntax through.
+        """
+        match = query if raw else fts_query(query)
+        if not match:
+            return {"items": [], "next_cursor": None}
+        before = int(cursor) if cursor else 2**63 - 1
+        with self.reader() as conn:
+            rows = conn.execute(_SEARCH, (snippet_tokens, match, before, limit)).fetchall()
+            total = conn.execute(_SEARCH_COUNT, (match,)).fetchone()[0] if with_total else None
+        result: Dict[str, Any] = {
+            "items": [_page_item(row, "snippet") for row in rows],
+            "next_cursor": str(rows[-1][0]) if len(rows) == limit else None,
+        }
+        if total is not None:
+            result["total"] = total
+        return result
+
+    def stats(self, since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Turns per conversation and the distribution of final states, over
+        sessions ended on or after the day of `since` (ISO date or time;
+        default all), read from the session_stats rollup. Open sessions are
+        reported separately by their latest state: these are the abandoned
+        chats.
+        """
+        since = (since or "")[:10]
+        with self.reader() as conn:
+            histogram = conn.execute(_TURN_HISTOGRAM, (since,)).fetchall()
+            ended = conn.execute(_STATE_COUNTS, (since,)).fetchall()
+            still_open = conn.execute(_OPEN_STATE_COUNTS).fetchall()
+        sessions = sum(n for _, n in histogram)
+        turns = sum(t * n for t, n in histogram)
+
+        def quantile(q: float) -> int:
+            seen = 0
+            for turn_count, n in histogram:
+                seen += n
+                if seen >= q * sessions:
+                    return turn_count
+            return 0
+
+        return {
+            "sessions": sessions,
+            "turns_per_conversation": {
+                "mean": turns / sessions if sessions else 0.0,
+                "p50": quantile(0.5),
+                "p90": quantile(0.9),
+                "max": histogram[-1][0] if histogram else 0,
+                "histogram": {t: n for t, n in histogram},
+            },
+            "final_states": dict(ended),
+            "open_sessions": dict(still_open),
+        }
+
+    def resume(self, session_id: str) -> Optional[SessionState]:
+        """
+        The session row with its latest state snapshot: one primary-key
+        lookup, however long the session is.
+        """
+        with self.reader() as conn:
+            row = conn.execute(_SELECT_SESSION, (session_id,)).fetchone()
+        if row is None:
+            return None
+        return SessionState(
+            session_id=row[0],
+            home_id=row[1],
+            started_at=row[2],
+            updated_at=row[3],
+            ended_at=row[4],
+            turn_count=row[5],
+            state_seq=row[6],
+            state=json.loads(row[7]) if row[7] else None,
+            source=row[8],
+        )
+
+    def turns(self, session_id: str, from_seq: int = 0, limit: int = -1) -> List[Dict[str, Any]]:
+        """
+        Turns of `session_id` from `from_seq` on, in order (a range scan of
+        the (session_id, seq) primary key).
+        """
+        with self.reader() as conn:
+            rows = conn.execute(_SELECT_TURNS, (session_id, from_seq, limit)).fetchall()
+        return [{"seq": r[0], "role": r[1], "content": r[2], "created_at": r[3]} for r in rows]
+
+    def stale_sessions(self, idle_seconds: float = 3600.0, limit: int = 100) -> List[str]:
+        """
+        Ids of sessions that never ended and have had no turn for `idle_seconds`.
+        """
+        cutoff = (
+            datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=idle_seconds)
+        ).isoformat().replace("+00:00", "Z")
+        with self.reader() as conn:
+            return [row[0] for row in conn.execute(_SELECT_OPEN, (cutoff, limit))]
+
+    # ------------------------------------------------------------------ retention
+
+    def _unarchive(self, conn: sqlite3.Connection, codec: str, dict_id: Optional[int], body: bytes) -> str:
+        return unarchive(conn, codec, dict_id, body, self._codecs)
+
+    def archive(
+        self,
+        older_than_days: float = 90.0,
+        codec: str = "zlib",
+        level: Optional[int] = None,
+        batch_size: int = 500,
+        dictionary: bool = True,
+        dictionary_samples: int = 2000,
+        vacuum: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Retention job: move conversations that ended more than
+        `older_than_days` ago from `conversations` into
+        `conversations_archive`, compressed with zlib or zstd (optional
+        dependency), and return what it did.
+
+        The archive row keeps id, ended_at and the length alongside the
+        compressed body, so get(), recent(), page() and count() read both
+        tiers transparently. Archived transcripts leave the full-text index
+        (search covers the hot tier only); sessions, turns and stats are not
+        touched.
+
+        A dictionary trained on the oldest rows is stored in archive_dicts
+        and shared by this run's rows (its size counts in `stored_bytes`). Rows move `batch_size` at a time, each
+        batch in its own short write transaction, so live saves interleave
+        and an interrupted run simply resumes. Freed pages are reused by new
+        rows; vacuum=True also shrinks the file.
+        """
+        archive_codec = _ArchiveCodec(codec, level)
+        cutoff = (
+            datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)
+        ).isoformat().replace("+00:00", "Z")
+        self.flush()
+        conn = connect(self.path)
+        report: Dict[str, Any] = {"cutoff": cutoff, "codec": codec, "rows": 0, "chars": 0, "raw_bytes": 0, "stored_bytes": 0}
+        t0 = time.perf_counter()
+        try:
+            file_before = _file_bytes(conn)
+            dict_id = None
+            if dictionary:
+                samples = [
+                    row[2].encode("utf-8")
+                    for row in conn.execute(_SELECT_ARCHIVABLE, (cutoff, dictionary_samples))
+                ]
+                zdict = train_dictionary(codec, samples)
+                if zdict is not None:
+                    with conn:
+                        dict_id = conn.execute(
+                            "INSERT INTO archive_dicts (codec, created_at, data) VALUES (?, ?, ?)",
+                            (codec, _now_iso(), zdict),
+                        ).lastrowid
+                    report["stored_bytes"] += len(zdict)
+                    archive_codec = _ArchiveCodec(codec, level, zdict)
+                    self._codecs[(codec, dict_id)] = archive_codec
+            report["dict_id"] = dict_id
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                with conn:
+                    rows = conn.execute(_SELECT_ARCHIVABLE, (cutoff, batch_size)).fetchall()
+                    archived = []
+                    for conversation_id, ended_at, text in rows:
+                        body = archive_codec.compress(text)
+                        archived.append((conversation_id, ended_at, codec, dict_id, len(text), body))
+                        report["chars"] += len(text)
+                        report["raw_bytes"] += len(text.encode("utf-8"))
+                        report["stored_bytes"] += len(body)
+                    conn.executemany(_INSERT_ARCHIVED, archived)
+                    conn.executemany(_DELETE_HOT, [(row[0],) for row in rows])
+                report["rows"] += len(rows)
+                if len(rows) < batch_size:
+                    break
+            if vacuum:
+                # Deleted rows leave tombstones in the FTS index until its
+                # segments are merged.
+                with conn:
+                    conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('optimize')")
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            report["file_bytes_before"] = file_before
+            report["file_bytes_after"] = _file_bytes(conn)
+        finally:
+            conn.close()
+        report["ratio"] = report["raw_bytes"] / report["stored_bytes"] if report["stored_bytes"] else 0.0
+        report["seconds"] = time.perf_counter() - t0
+        return report
+
+    def storage(self) -> Dict[str, Dict[str, int]]:
+        """
+        Rows, characters and stored bytes per tier ("hot", "archive").
+        """
+        with self.reader() as conn:
+            return {
+                tier: {"rows": rows, "chars": chars, "stored_bytes": stored}
+                for tier, rows, chars, stored in conn.execute(_TIER_SIZES)
+            }
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def close(self) -> None:
+        """
+        Write everything pending, then close every connection.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._write_conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self) -> "ConversationDB":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def _file_bytes(conn: sqlite3.Connection) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * pages
+
+
+def _resolve(future: "asyncio.Future[None]", error: Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+def _as_dict(row: Tuple[str, str, str]) -> Dict[str, str]:
+    return {"id": row[0], "ended_at": row[1], "conversation_str": row[2]}
+
+
+def _page_item(row: Tuple[Any, ...], text_key: str) -> Dict[str, Any]:
+    return {
+        "id": row[1],
+        "ended_at": row[2],
+        text_key: row[3],
+        "chars": row[4],
+        "turn_count": row[5],
+        "final_state": row[6],
+    }
+
+
+def _encode_cursor(ended_at: str, conversation_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([ended_at, conversation_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        ended_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+    return str(ended_at), str(conversation_id)
+
+
+def fts_query(text: str) -> str:
+    """
+    Free text -> an FTS5 query matching every word: each word is quoted (so
+    FTS5 operators and punctuation in user input are inert), and a trailing
+    `*` is kept as a prefix match.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+ARCHIVE_CODECS = ("zlib", "zstd")
+_DICT_BYTES = 32 * 1024  # zlib's whole window; also a good zstd dictionary size for short texts
+_DEFAULT_LEVELS = {"zlib": 9, "zstd": 12}
+
+
+def _zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise RuntimeError("The zstd archive codec requires zstandard (pip install zstandard).") from exc
+    return zstandard
+
+
+def train_dictionary(codec: str, samples: List[bytes]) -> Optional[bytes]:
+    """
+    A shared compression dictionary for `samples`. Transcripts are short and
+    repeat the same assistant phrasing, which per-row compression alone
+    cannot exploit; with a dictionary each row only pays for what is new.
+
+    zstd trains one properly. For zlib it is a preset dictionary of the
+    lines that recur across samples, most frequent last (deflate finds
+    matches near the end of the window most cheaply), topped up with raw
+    sample text. None if the samples are too small to pay for a dictionary.
+    """
+    if sum(len(sample) for sample in samples) < 4 * _DICT_BYTES:
+        return None
+    if codec == "zstd":
+        zstandard = _zstandard()
+        try:
+            return zstandard.train_dictionary(_DICT_BYTES, samples).as_bytes()
+        except zstandard.ZstdError:
+            return None
+    counts: Dict[bytes, int] = {}
+    for sample in samples:
+        for line in sample.splitlines(keepends=True):
+            counts[line] = counts.get(line, 0) + 1
+    common = sorted((n, line) for line, n in counts.items() if n > 1)
+    data = b"".join(line for _, line in common)[-_DICT_BYTES:]
+    if len(data) < _DICT_BYTES:
+        data = b"".join(samples)[-(_DICT_BYTES - len(data)):] + data
+    return data
+
+
+class _ArchiveCodec:
+    """
+    Compresses and decompresses archived transcripts for one (codec,
+    dictionary) pair. zlib output is raw deflate, without the 6-byte header
+    and checksum per row.
+    """
+
+    __slots__ = ("codec", "level", "zdict")
+
+    def __init__(self, codec: str, level: Optional[int] = None, zdict: Optional[bytes] = None) -> None:
+        if codec not in ARCHIVE_CODECS:
+            raise ValueError(f"Unknown archive codec {codec!r}; expected one of {ARCHIVE_CODECS}")
+        if codec == "zstd":
+            _zstandard()
+        self.codec = codec
+        self.level = _DEFAULT_LEVELS[codec] if level is None else level
+        self.zdict = zdict
+
+    def compress(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        if self.codec == "zstd":
+            zstandard = _zstandard()
+            dict_data = zstandard.ZstdCompressionDict(self.zdict) if self.zdict else None
+            return zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(data)
+        if self.zdict:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.zdict)
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, body: bytes) -> str:
+        if self.codec == "zstd":
+            zstandard = _zstandard()
+            dict_data = zstandard.ZstdCompressionDict(self.zdict) if self.zdict else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body).decode("utf-8")
+        if self.zdict:
+            decompressor = zlib.decompressobj(-15, zdict=self.zdict)
+        else:
+            decompressor = zlib.decompressobj(-15)
+        return (decompressor.decompress(body) + decompressor.flush()).decode("utf-8")
+
+
+def unarchive(
+    conn: sqlite3.Connection,
+    codec: str,
+    dict_id: Optional[int],
+    body: bytes,
+    cache: Dict[Tuple[str, Optional[int]], _ArchiveCodec],
+) -> str:
+    """
+    The transcript of one conversations_archive row. `cache` keeps the
+    codec (and its dictionary, read from archive_dicts once) per
+    (codec, dict_id).
+    """
+    key = (codec, dict_id)
+    archive_codec = cache.get(key)
+    if archive_codec is None:
+        zdict = conn.execute(_SELECT_DICT, (dict_id,)).fetchone()[1] if dict_id is not None else None
+        archive_codec = cache[key] = _ArchiveCodec(codec, zdict=zdict)
+    return archive_codec.decompress(body)
+
+
+_ROLE_PREFIXES = ("user: ", "assistant: ")
+
+
+def split_transcript(conversation_str: str) -> List[Tuple[str, str]]:
+    """
+    "user: ...\nassistant: ..." -> [(role, content), ...]. Lines without a
+    role prefix continue the previous turn (multi-line replies).
+    """
+    turns: List[Tuple[str, str]] = []
+    for line in conversation_str.split("\n"):
+        for prefix in _ROLE_PREFIXES:
+            if line.startswith(prefix):
+                turns.append((prefix[:-2], line[len(prefix):]))
+                break
+        else:
+            if turns:
+                role, content = turns[-1]
+                turns[-1] = (role, content + "\n" + line)
+            elif line.strip():
+                turns.append(("unknown", line))
+    return turns
+
+
+def iter_legacy_conversations(sqlite_path: Optional[str] = None, csv_path: Optional[str] = None) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Stream (id, ended_at, conversation_str, source) from an old
+    conversations.db and/or conversations.csv export, one row at a time.
+    """
+    if sqlite_path and os.path.exists(sqlite_path):
+        conn = sqlite3.connect(sqlite_path)
+        try:
+            has_table = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+            ).fetchone()
+            if has_table:
+                for row in conn.execute("SELECT id, ended_at, conversation_str FROM conversations"):
+                    yield row[0], row[1], row[2], "legacy_db"
+        finally:
+            conn.close()
+    if csv_path and os.path.exists(csv_path):
+        csv.field_size_limit(min(2**31 - 1, 1 << 40))
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield row["id"], row["ended_at"], row["conversation_str"], "legacy_csv"
+
+
+def migrate_legacy(
+    db_path: str,
+    rows: Iterable[Tuple[str, str, str, str]],
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """
+    Copy legacy transcripts into the session schema of `db_path`: each
+    becomes an ended session with its turns split out (no state snapshots;
+    the old format never stored any). The conversations row is kept as well.
+
+    Streaming and idempotent: rows are committed `batch_size` at a time, and
+    a session that already exists is skipped, so an interrupted migration can
+    simply be run again.
+    """
+    conn = connect(db_path)
+    ensure_schema(conn)
+    stats = {"read": 0, "migrated": 0, "skipped": 0, "turns": 0}
+    pending = 0
+    try:
+        conn.execute("BEGIN")
+        for conversation_id, ended_at, conversation_str, source in rows:
+            stats["read"] += 1
+            ended_at = ended_at or _now_iso()
+            conn.execute(_INSERT_LEGACY, (conversation_id, ended_at, conversation_str))
+            cur = conn.execute(_INSERT_SESSION, (conversation_id, None, ended_at, ended_at, source))
+            if cur.rowcount == 0:
+                stats["skipped"] += 1
+            else:
+                turns = split_transcript(conversation_str)
+                conn.executemany(_INSERT_TURN, [
+                    (conversation_id, seq, role, content, ended_at) for seq, (role, content) in enumerate(turns)
+                ])
+                conn.execute(_BUMP_SESSION, (len(turns), ended_at, conversation_id))
+                conn.execute(_END_SESSION, (ended_at, ended_at, conversation_id))
+                stats["migrated"] += 1
+                stats["turns"] += len(turns)
+            pending += 1
+            if pending >= batch_size:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                pending = 0
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return stats
+
+
+_instances: Dict[str, ConversationDB] = {}
+_instances_lock = threading.Lock()
+
+
+def get_conversation_db(path: str) -> ConversationDB:
+    """
+    The shared ConversationDB for `path`, opened on first use and closed
+    (with pending writes flushed) at interpreter exit.
+    """
+    key = os.path.abspath(path)
+    with _instances_lock:
+        db = _instances.get(key)
+        if db is None or db._closed:
+            db = ConversationDB(key)
+            _instances[key] = db
+        return db
+
+
+@atexit.register
+def _close_all() -> None:
+    with _instances_lock:
+        for db in _instances.values():
+            db.close()
+        _instances.clear()
+
+
+def benchmark_conversation_db(n_saves: int = 5000, transcript_chars: int = 2000, baseline_n: int = 500) -> Dict[str, float]:
+    """
+    Write throughput of the pooled group-commit writer against the previous
+    pattern (connect, insert, commit, close for every save), with an async
+    variant where each coroutine waits for its own commit; then per-turn
+    appends with state snapshots, and resume() latency.
+    """
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="conversation_db_bench_")
+    transcript = ("user: remind me to close the fridge\nassistant: sure\n" * (transcript_chars // 50 + 1))[:transcript_chars]
+    try:
+        baseline_path = os.path.join(directory, "baseline.db")
+        conn = sqlite3.connect(baseline_path)
+        conn.executescript(_SCHEMA)
+        conn.close()
+        t0 = time.perf_counter()
+        for _ in range(baseline_n):
+            conn = sqlite3.connect(baseline_path)
+            conn.execute(_INSERT, (str(uuid.uuid4()), _now_iso(), transcript))
+            conn.commit()
+            conn.close()
+        baseline = time.perf_counter() - t0
+
+        db = ConversationDB(os.path.join(directory, "pooled.db"))
+        t0 = time.perf_counter()
+        for _ in range(n_saves):
+            db.save(transcript)
+        enqueue = time.perf_counter() - t0
+        db.flush()
+        pooled = time.perf_counter() - t0
+        batches = db.batches
+
+        async def _concurrent() -> float:
+            t0 = time.perf_counter()
+            await asyncio.gather(*(db.save_async(transcript) for _ in range(n_saves)))
+            return time.perf_counter() - t0
+
+        awaited = asyncio.run(_concurrent())
+        assert db.count() == 2 * n_saves
+
+        state = {"state": "NEED_WHEN", "slots": {"what": "close the fridge", "constraints": []}, "feasibility": {}}
+        sessions = [db.start_session() for _ in range(100)]
+        t0 = time.perf_counter()
+        for i in range(n_saves):
+            db.append_turn(sessions[i % len(sessions)], "user" if i % 2 == 0 else "assistant", "remind me", state)
+        db.flush()
+        turns = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for i in range(1000):
+            db.resume(sessions[i % len(sessions)])
+        resume_us = (time.perf_counter() - t0) / 1000 * 1e6
+        db.close()
+
+        return {
+            "saves": n_saves,
+            "connect_per_save_per_s": baseline_n / baseline,
+            "enqueue_per_s": n_saves / enqueue,
+            "committed_per_s": n_saves / pooled,
+            "awaited_commit_per_s": n_saves / awaited,
+            "avg_batch": n_saves / max(1, batches),
+            "turn_appends_per_s": n_saves / turns,
+            "resume_us": resume_us,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_search(n_rows: int = 300_000, batch: int = 20_000) -> Dict[str, float]:
+    """
+    Query latency with `n_rows` conversations and sessions: first and deep
+    keyset pages, full-text search (common and rare terms), and the stats
+    aggregates.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="conversation_search_bench_")
+    path = os.path.join(directory, "search.db")
+    words = ["fridge", "stove", "pills", "laundry", "trash", "door", "breakfast", "dinner", "garage", "window"]
+    states = ["DONE", "NEEDS_FIX", "READY_TO_SCHEDULE", "NEED_WHEN"]
+    try:
+        conn = connect(path)
+        ensure_schema(conn)
+        t0 = time.perf_counter()
+        base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        for start in range(0, n_rows, batch):
+            conversations, sessions = [], []
+            for i in range(start, min(n_rows, start + batch)):
+                ended_at = (base + datetime.timedelta(seconds=i * 30)).isoformat().replace("+00:00", "Z")
+                topic = random.choice(words)
+                text = (
+                    f"user: remind me about the {topic} {i}\nassistant: When should I remind you?\n"
+                    f"user: after {random.choice(words)}\nassistant: Done. [ChatEnded]"
+                )
+                conversations.append((f"c{i}", ended_at, text))
+                turns = random.choice((2, 4, 4, 6, 8))
+                sessions.append((f"c{i}", ended_at, ended_at, ended_at, turns, random.choice(states)))
+            with conn:
+                conn.executemany(_INSERT, conversations)
+                conn.executemany(
+                    "INSERT INTO sessions (id, started_at, updated_at, ended_at, turn_count, state_name) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    sessions,
+                )
+        load_s = time.perf_counter() - t0
+        conn.execute("ANALYZE")
+        conn.close()
+
+        db = ConversationDB(path)
+
+        def timed(fn: Callable[[], Any], repeat: int = 20) -> float:
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            return (time.perf_counter() - t0) / repeat * 1000
+
+        first = db.page(limit=50)
+        cursor = first["next_cursor"]
+        for _ in range(200):  # walk 10k rows deep
+            cursor = db.page(limit=50, cursor=cursor)["next_cursor"]
+        results = {
+            "rows": n_rows,
+            "load_s": round(load_s, 1),
+            "page_first_ms": timed(lambda: db.page(limit=50)),
+            "page_10k_deep_ms": timed(lambda: db.page(limit=50, cursor=cursor)),
+            "search_common_ms": timed(lambda: db.search("fridge", limit=50)),
+            "search_common_next_page_ms": timed(
+                lambda: db.search("fridge", limit=50, cursor=db.search("fridge", limit=50)["next_cursor"])
+            ) - timed(lambda: db.search("fridge", limit=50)),
+            "search_two_terms_ms": timed(lambda: db.search("fridge dinner", limit=50)),
+            "search_prefix_ms": timed(lambda: db.search("garag*", limit=50)),
+            "search_rare_ms": timed(lambda: db.search("breakfast stove window", limit=50)),
+            "stats_ms": timed(db.stats),
+            "stats_last_30_days_ms": timed(lambda: db.stats(since="2025-10-01")),
+        }
+        db.close()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_archive(n_rows: int = 50_000, codecs: Tuple[str, ...] = ARCHIVE_CODECS) -> Dict[str, Any]:
+    """
+    Archive the older half of `n_rows` realistic transcripts with each codec
+    (with and without a dictionary) and report the storage reduction and
+    get() latency for hot versus archived rows.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    things = ["close the fridge", "take my pills", "water the plants", "take out the trash", "lock the door",
+              "turn off the stove", "start the laundry", "feed the cat", "open the window", "charge my phone"]
+    times = ["tomorrow at 6 pm", "every weekday at 8", "when I leave the kitchen", "after dinner",
+             "if the door is open for two minutes", "every Sunday morning", "in an hour"]
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for i in range(n_rows):
+        # the first half ended a year ago, the second half this week
+        ended = base + datetime.timedelta(seconds=i) if i < n_rows // 2 else now - datetime.timedelta(seconds=i)
+        thing, when = random.choice(things), random.choice(times)
+        text = (
+            f"user: hello\nassistant: Hello! What would you like me to remind you about?\n"
+            f"user: remind me to {thing}\nassistant: Sure. When should I remind you to {thing}?\n"
+            f"user: {when}\nassistant: I'll remind you to {thing} {when}. Does that work? "
+            f"(reference {random.getrandbits(48):x})\nuser: yes\nassistant: Done! [ChatEnded]"
+        )
+        rows.append((f"c{i:08d}", ended.isoformat().replace("+00:00", "Z"), text))
+
+    variants = [(codec, use_dict) for codec in codecs for use_dict in (False, True)]
+    directory = tempfile.mkdtemp(prefix="conversation_archive_bench_")
+    results: Dict[str, Any] = {"rows": n_rows}
+    try:
+        for codec, use_dict in variants:
+            name = f"{codec}{'_dict' if use_dict else ''}"
+            path = os.path.join(directory, f"{name}.db")
+            conn = connect(path)
+            ensure_schema(conn)
+            with conn:
+                conn.executemany(_INSERT, rows)
+            conn.close()
+            db = ConversationDB(path)
+            try:
+                report = db.archive(older_than_days=30, codec=codec, dictionary=use_dict, vacuum=True)
+            except RuntimeError as exc:  # zstandard not installed
+                results[name] = str(exc)
+                db.close()
+                continue
+
+            def get_us(ids: List[str]) -> float:
+                t0 = time.perf_counter()
+                for conversation_id in ids:
+                    db.get(conversation_id)
+                return (time.perf_counter() - t0) / len(ids) * 1e6
+
+            archived_ids = [rows[random.randrange(n_rows // 2)][0] for _ in range(2000)]
+            hot_ids = [rows[random.randrange(n_rows // 2, n_rows)][0] for _ in range(2000)]
+            assert db.get(archived_ids[0])["conversation_str"] == rows[int(archived_ids[0][1:])][2]
+            results[name] = {
+                "archived_rows": report["rows"],
+                "raw_mb": round(report["raw_bytes"] / 1e6, 2),
+                "stored_mb": round(report["stored_bytes"] / 1e6, 2),
+                "ratio": round(report["ratio"], 2),
+                "file_mb_before": round(report["file_bytes_before"] / 1e6, 2),
+                "file_mb_after": round(report["file_bytes_after"] / 1e6, 2),
+                "archive_s": round(report["seconds"], 2),
+                "get_hot_us": round(get_us(hot_ids), 1),
+                "get_archived_us": round(get_us(archived_ids), 1),
+            }
+            # A page that starts in the hot tier and continues into the archive.
+            cursor = _encode_cursor(rows[n_rows - 25][1], rows[n_rows - 25][0])
+            t0 = time.perf_counter()
+            for _ in range(100):
+                page = db.page(limit=50, cursor=cursor)
+            results[name]["page_across_tiers_ms"] = round((time.perf_counter() - t0) * 10, 3)
+            assert page["items"][-1]["preview"].startswith("user: hello")
+            db.close()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Conversation store tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("bench", help="Write-throughput benchmark.")
+    search_bench = sub.add_parser("bench-search", help="Pagination, search and stats latency at scale.")
+    search_bench.add_argument("--rows", type=int, default=300_000)
+    migrate = sub.add_parser("migrate", help="Stream legacy transcripts into the session schema.")
+    migrate.add_argument("db", help="Target database (created if missing).")
+    migrate.add_argument("--from-db", help="Legacy conversations.db to read (may be the target itself).")
+    migrate.add_argument("--from-csv", help="Legacy conversations.csv export to read.")
+    migrate.add_argument("--batch-size", type=int, default=500)
+    archive = sub.add_parser("archive", help="Move old conversations into the compressed archive tier.")
+    archive.add_argument("db")
+    archive.add_argument("--days", type=float, default=90.0, help="Archive conversations older than this.")
+    archive.add_argument("--codec", choices=ARCHIVE_CODECS, default="zlib")
+    archive.add_argument("--level", type=int)
+    archive.add_argument("--no-dictionary", action="store_true")
+    archive.add_argument("--vacuum", action="store_true", help="Also shrink the file.")
+    archive_bench = sub.add_parser("bench-archive", help="Storage reduction and read latency per tier.")
+    archive_bench.add_argument("--rows", type=int, default=50_000)
+    resume = sub.add_parser("resume", help="Print a session's latest state.")
+    resume.add_argument("db")
+    resume.add_argument("session_id")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print("[DB]", benchmark_conversation_db())
+    elif args.command == "bench-search":
+        print("[DB]", benchmark_search(args.rows))
+    elif args.command == "migrate":
+        t0 = time.perf_counter()
+        stats = migrate_legacy(args.db, iter_legacy_conversations(args.from_db, args.from_csv), args.batch_size)
+        print(f"[DB] Migrated in {time.perf_counter() - t0:.2f}s:", stats)
+    elif args.command == "archive":
+        with ConversationDB(args.db) as db:
+            print("[DB]", db.archive(args.days, args.codec, args.level, dictionary=not args.no_dictionary, vacuum=args.vacuum))
+            print("[DB]", db.storage())
+    elif args.command == "bench-archive":
+        for name, value in benchmark_archive(args.rows).items():
+            print(f"[DB] {name}: {value}")
+    else:
+        with ConversationDB(args.db) as db:
+            print("[DB]", db.resume(args.session_id))
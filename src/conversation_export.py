@@ -0,0 +1,450 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from conversation_db import connect, ensure_schema, migrate_legacy, unarchive
+
+
+COLUMNS = ("id", "ended_at", "conversation_str")
+
+Row = Tuple[str, str, str]
+Chunk = List[Row]
+Watermark = Tuple[str, str]  # (ended_at, id) of the last row exported
+
+_SELECT_AFTER = (
+    "SELECT id, ended_at, conversation_str FROM conversations "
+    "WHERE (ended_at, id) > (?, ?) ORDER BY ended_at, id LIMIT ?"
+)
+# Both tiers, merged by the same keyset; archived rows carry their codec.
+_SELECT_BOTH_AFTER = (
+    "SELECT id, ended_at, conversation_str, NULL, NULL, NULL FROM conversations WHERE (ended_at, id) > (?, ?) "
+    "UNION ALL SELECT id, ended_at, NULL, codec, dict_id, body FROM conversations_archive "
+    "WHERE (ended_at, id) > (?, ?) ORDER BY 2, 1 LIMIT ?"
+)
+
+
+def detect_format(path: str) -> Tuple[str, Optional[str]]:
+    """
+    path -> (format, compression): "x.db" -> ("sqlite", None),
+    "x.jsonl.gz" -> ("jsonl", "gzip"), "x.csv.zst" -> ("csv", "zstd").
+    """
+    base, compression = path, None
+    if base.endswith(".gz"):
+        base, compression = base[:-3], "gzip"
+    elif base.endswith(".zst"):
+        base, compression = base[:-4], "zstd"
+    ext = os.path.splitext(base)[1].lower()
+    formats = {".db": "sqlite", ".sqlite": "sqlite", ".sqlite3": "sqlite", ".csv": "csv",
+               ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+    if ext not in formats:
+        raise ValueError(f"Unknown conversation file format: {path}")
+    fmt = formats[ext]
+    if compression and fmt in ("sqlite", "parquet"):
+        raise ValueError(f"{fmt} files cannot be wrapped in {compression}; use parquet's own compression")
+    return fmt, compression
+
+
+# ---------------------------------------------------------------------- readers
+
+
+def _after(row: Row, since: Optional[Watermark]) -> bool:
+    return since is None or (row[1], row[0]) > since
+
+
+def read_sqlite(path: str, since: Optional[Watermark] = None, chunk_size: int = 5000) -> Iterator[Chunk]:
+    """
+    Chunks of conversations in (ended_at, id) order after `since`, read by
+    keyset over the conversations_by_ended_at index: each chunk is one
+    index range scan, however far into the table it is. Archived
+    conversations are merged in, decompressed.
+    """
+    conn = connect(path, readonly=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "conversations" not in tables:
+            raise ValueError(f"{path} has no conversations table")
+        codecs: Dict[Any, Any] = {}
+        last = since or ("", "")
+        while True:
+            if "conversations_archive" in tables:
+                rows = conn.execute(_SELECT_BOTH_AFTER, (*last, *last, chunk_size)).fetchall()
+                chunk = [
+                    (r[0], r[1], r[2] if r[2] is not None else unarchive(conn, r[3], r[4], r[5], codecs))
+                    for r in rows
+                ]
+            else:
+                chunk = conn.execute(_SELECT_AFTER, (last[0], last[1], chunk_size)).fetchall()
+            if not chunk:
+                return
+            yield chunk
+            last = (chunk[-1][1], chunk[-1][0])
+    finally:
+        conn.close()
+
+
+def _open_text(path: str, compression: Optional[str]) -> io.TextIOBase:
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")  # also reads multi-member files
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as exc:
+            raise RuntimeError("Reading .zst files requires zstandard (pip install zstandard).") from exc
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True), encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def _chunked(rows: Iterator[Row], since: Optional[Watermark], chunk_size: int) -> Iterator[Chunk]:
+    chunk: Chunk = []
+    for row in rows:
+        if _after(row, since):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_csv(path: str, since: Optional[Watermark] = None, chunk_size: int = 5000, compression: Optional[str] = None) -> Iterator[Chunk]:
+    csv.field_size_limit(2**31 - 1)
+    with _open_text(path, compression) as f:
+        rows = ((r["id"], r["ended_at"], r["conversation_str"]) for r in csv.DictReader(f))
+        yield from _chunked(rows, since, chunk_size)
+
+
+def read_jsonl(path: str, since: Optional[Watermark] = None, chunk_size: int = 5000, compression: Optional[str] = None) -> Iterator[Chunk]:
+    with _open_text(path, compression) as f:
+        rows = (
+            (r["id"], r["ended_at"], r["conversation_str"])
+            for r in (json.loads(line) for line in f if line.strip())
+        )
+        yield from _chunked(rows, since, chunk_size)
+
+
+def read_parquet(path: str, since: Optional[Watermark] = None, chunk_size: int = 5000) -> Iterator[Chunk]:
+    """
+    Stream a Parquet file batch by batch (requires pyarrow).
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Reading Parquet conversation exports requires pyarrow (pip install pyarrow).") from exc
+
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=list(COLUMNS)):
+        columns = batch.to_pydict()
+        chunk = [
+            row for row in zip(columns["id"], columns["ended_at"], columns["conversation_str"]) if _after(row, since)
+        ]
+        if chunk:
+            yield chunk
+
+
+def read_conversations(path: str, since: Optional[Watermark] = None, chunk_size: int = 5000) -> Iterator[Chunk]:
+    fmt, compression = detect_format(path)
+    if fmt == "sqlite":
+        return read_sqlite(path, since, chunk_size)
+    if fmt == "parquet":
+        return read_parquet(path, since, chunk_size)
+    reader = read_csv if fmt == "csv" else read_jsonl
+    return reader(path, since, chunk_size, compression)
+
+
+# ---------------------------------------------------------------------- writers
+
+
+def _encode_csv(chunk: Chunk, header: bool) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(chunk)
+    return buf.getvalue().encode("utf-8")
+
+
+def _encode_jsonl(chunk: Chunk, header: bool) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in chunk
+    ).encode("utf-8")
+
+
+def _gzip_member(data: bytes, level: int) -> bytes:
+    # zlib releases the GIL while compressing, so members compress in parallel.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compressor(compression: Optional[str], level: int) -> Optional[Callable[[bytes], bytes]]:
+    if compression == "gzip":
+        return lambda data: _gzip_member(data, level)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as exc:
+            raise RuntimeError("Writing .zst files requires zstandard (pip install zstandard).") from exc
+        return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    return None
+
+
+class _TextSink:
+    """
+    Writes encoded chunks to a CSV/JSONL file, optionally compressed. Each
+    chunk is compressed on its own (an independent gzip member or zstd
+    frame; concatenations of those are valid files) on a thread pool, and
+    written back in order. At most 2 x `workers` chunks are in flight, so
+    memory stays bounded whatever the input size.
+    """
+
+    def __init__(self, path: str, fmt: str, compression: Optional[str], workers: int, level: int, append: bool) -> None:
+        self.encode = _encode_csv if fmt == "csv" else _encode_jsonl
+        self.compress = _compressor(compression, level)
+        self.header = fmt == "csv" and not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, "ab" if append else "wb")
+        self.pool = ThreadPoolExecutor(max_workers=workers) if self.compress and workers > 1 else None
+        self.max_in_flight = 2 * workers
+        self.pending: Deque[Future] = deque()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, chunk: Chunk) -> None:
+        data = self.encode(chunk, self.header)
+        self.header = False
+        self.bytes_in += len(data)
+        if self.compress is None:
+            self._emit(data)
+        elif self.pool is None:
+            self._emit(self.compress(data))
+        else:
+            self.pending.append(self.pool.submit(self.compress, data))
+            while len(self.pending) >= self.max_in_flight:
+                self._emit(self.pending.popleft().result())
+
+    def _emit(self, data: bytes) -> None:
+        self.file.write(data)
+        self.bytes_out += len(data)
+
+    def close(self) -> None:
+        while self.pending:
+            self._emit(self.pending.popleft().result())
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.file.close()
+
+
+class _ParquetSink:
+    """
+    One row group per chunk through pyarrow's ParquetWriter (which uses its
+    own threads for column compression).
+    """
+
+    def __init__(self, path: str, compression: str, level: Optional[int]) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Writing Parquet conversation exports requires pyarrow (pip install pyarrow).") from exc
+        self.pa = pa
+        self.schema = pa.schema([(name, pa.string()) for name in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression, compression_level=level)
+        self.bytes_in = 0
+        self.path = path
+
+    def write(self, chunk: Chunk) -> None:
+        columns = list(zip(*chunk))
+        self.bytes_in += sum(len(text) for text in columns[2])
+        self.writer.write_table(self.pa.Table.from_arrays([self.pa.array(c, self.pa.string()) for c in columns], schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+        self.bytes_out = os.path.getsize(self.path)
+
+
+class _SqliteSink:
+    """
+    Imports into a conversations database through migrate_legacy(), so
+    imported transcripts also get sessions and turns, stay searchable, and
+    re-imports skip rows already present.
+    """
+
+    def __init__(self, path: str, source: str) -> None:
+        conn = connect(path)
+        ensure_schema(conn)
+        conn.close()
+        self.path = path
+        self.source = source
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stats: Dict[str, int] = {}
+
+    def write(self, chunk: Chunk) -> None:
+        self.bytes_in += sum(len(row[2]) for row in chunk)
+        stats = migrate_legacy(self.path, ((*row, self.source) for row in chunk), batch_size=len(chunk))
+        for key, value in stats.items():
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def close(self) -> None:
+        self.bytes_out = os.path.getsize(self.path)
+
+
+# ---------------------------------------------------------------------- transfer
+
+
+def load_watermark(path: Optional[str]) -> Optional[Watermark]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    return data["ended_at"], data["id"]
+
+
+def save_watermark(path: str, watermark: Watermark) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"ended_at": watermark[0], "id": watermark[1]}, f)
+    os.replace(tmp, path)  # a crash never leaves a half-written watermark
+
+
+def transfer(
+    source: str,
+    destination: str,
+    since: Optional[Watermark] = None,
+    watermark_file: Optional[str] = None,
+    chunk_size: int = 5000,
+    workers: int = 4,
+    level: Optional[int] = None,
+    append: bool = False,
+    parquet_compression: str = "zstd",
+) -> Dict[str, Any]:
+    """
+    Stream conversations from `source` to `destination`, formats taken from
+    the file names (.db/.sqlite, .csv, .jsonl, .parquet; .gz or .zst on
+    CSV/JSONL). Memory use is bounded by `chunk_size` and `workers`, not by
+    the data.
+
+    Incremental runs: only rows with (ended_at, id) after `since`, or after
+    the watermark stored in `watermark_file`, are copied; the watermark file
+    is advanced once the destination is closed. For a nightly export, give
+    each night its own destination file (or append=True for CSV/JSONL).
+    """
+    src_fmt, _ = detect_format(source)
+    dst_fmt, compression = detect_format(destination)
+    since = since or load_watermark(watermark_file)
+    t0 = time.perf_counter()
+    chunks = read_conversations(source, since, chunk_size)
+    # Opening the sink truncates the destination, so the source must open first.
+    first = next(chunks, None)
+    if dst_fmt == "sqlite":
+        sink: Any = _SqliteSink(destination, f"import_{src_fmt}")
+    elif dst_fmt == "parquet":
+        sink = _ParquetSink(destination, parquet_compression, level)
+    else:
+        default_level = 6 if compression == "gzip" else 3
+        sink = _TextSink(destination, dst_fmt, compression, workers, level if level is not None else default_level, append)
+
+    rows = 0
+    last: Optional[Watermark] = None
+    try:
+        for chunk in itertools.chain([first] if first else [], chunks):
+            sink.write(chunk)
+            rows += len(chunk)
+            tail = max((row[1], row[0]) for row in chunk)
+            last = tail if last is None or tail > last else last
+    finally:
+        sink.close()
+    if watermark_file and last is not None:
+        save_watermark(watermark_file, last)
+
+    elapsed = time.perf_counter() - t0
+    result: Dict[str, Any] = {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed) if elapsed > 0 else 0,
+        "bytes_in": sink.bytes_in,
+        "bytes_out": sink.bytes_out,
+        "watermark": list(last) if last else (list(since) if since else None),
+    }
+    if isinstance(sink, _SqliteSink):
+        result["import"] = sink.stats
+    return result
+
+
+def benchmark_export(n_rows: int = 200_000, workers: Tuple[int, ...] = (1, 2, 4)) -> Dict[str, Any]:
+    """
+    SQLite -> gzip'd JSONL throughput by compression worker count, then an
+    incremental run that should copy only the rows added since.
+    """
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="conversation_export_bench_")
+    try:
+        db_path = os.path.join(directory, "conversations.db")
+        conn = connect(db_path)
+        ensure_schema(conn)
+        text = "user: remind me to close the fridge\nassistant: When should I remind you?\n" * 8
+        with conn:
+            conn.executemany(
+                "INSERT INTO conversations (id, ended_at, conversation_str) VALUES (?, ?, ?)",
+                ((f"c{i:08d}", f"2025-01-01T00:00:00.{i:06d}Z", f"{text}{i}") for i in range(n_rows)),
+            )
+        conn.close()
+
+        results: Dict[str, Any] = {"rows": n_rows, "cpus": os.cpu_count()}
+        for n in workers:
+            out = os.path.join(directory, f"export_{n}.jsonl.gz")
+            results[f"jsonl_gz_workers_{n}"] = transfer(db_path, out, workers=n)
+        watermark = os.path.join(directory, "nightly.watermark")
+        transfer(db_path, os.path.join(directory, "night1.jsonl.gz"), watermark_file=watermark)
+        conn = connect(db_path)
+        with conn:
+            conn.executemany(
+                "INSERT INTO conversations (id, ended_at, conversation_str) VALUES (?, ?, ?)",
+                ((f"d{i:08d}", f"2025-01-02T00:00:00.{i:06d}Z", text) for i in range(1000)),
+            )
+        conn.close()
+        results["incremental"] = transfer(db_path, os.path.join(directory, "night2.jsonl.gz"), watermark_file=watermark)
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream conversations between SQLite, CSV, JSONL and Parquet.")
+    parser.add_argument("source", nargs="?", help="e.g. src/conversations.db, conversations.csv, dump.jsonl.gz")
+    parser.add_argument("destination", nargs="?")
+    parser.add_argument("--since", help="Only rows that ended after this ISO time.")
+    parser.add_argument("--watermark-file", help="Read and advance an (ended_at, id) watermark for incremental runs.")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="Compression threads.")
+    parser.add_argument("--level", type=int, help="Compression level.")
+    parser.add_argument("--append", action="store_true", help="Append to an existing CSV/JSONL destination.")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, value in benchmark_export().items():
+            print(f"[EXPORT] {name}: {value}")
+    elif not (args.source and args.destination):
+        parser.error("source and destination are required")
+    else:
+        since = (args.since, "") if args.since else None
+        try:
+            print("[EXPORT]", transfer(
+                args.source, args.destination, since, args.watermark_file,
+                args.chunk_size, args.workers, args.level, args.append,
+            ))
+        except (ValueError, RuntimeError) as exc:
+            parser.error(str(exc))
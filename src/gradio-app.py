@@ -3,6 +3,7 @@ import importlib.util
 import json
 import os
 import sys
+import uuid
 from typing import Dict, List
 
 import gradio as gr
@@ -10,6 +11,8 @@ import gradio as gr
 from agents.run_context import RunContextWrapper
 from events import EventRecord, event_bus
 from code_generation import CodeGeneration
+from conversation_db import get_conversation_db
+from session_cache import SessionCache
 
 
 _CHAT_ASSISTANT_PATH = os.path.join(os.path.dirname(__file__), "chat-assistant.py")
@@ -35,11 +38,28 @@ def _new_conversation_state() -> ConversationState:
     )
 
 
-# Single shared conversation state for this app instance.
-_initial_state = _new_conversation_state()
-_wrapper = RunContextWrapper[ConversationState](context=_initial_state)
 _assistant = ChatAssistant()
 
+# Conversation state lives server-side per browser session: gr.State only
+# carries the session id, and the LRU/TTL cache caps how many idle sessions
+# stay in memory (evicted ones reload from the conversation store).
+GRADIO_DB_PATH = os.environ.get("GRADIO_DB_PATH", os.path.join(os.path.dirname(__file__), "conversations.db"))
+_sessions = SessionCache(
+    get_conversation_db(GRADIO_DB_PATH),
+    max_sessions=int(os.environ.get("GRADIO_MAX_SESSIONS", "256")),
+    ttl_seconds=float(os.environ.get("GRADIO_SESSION_TTL_SECONDS", "1800")),
+)
+
+# Queue limits: chat turns and code generation run in separate pools, so
+# long code generations cannot take every slot from chat turns.
+CHAT_CONCURRENCY = int(os.environ.get("GRADIO_CHAT_CONCURRENCY", "16"))
+CODEGEN_CONCURRENCY = int(os.environ.get("GRADIO_CODEGEN_CONCURRENCY", "4"))
+QUEUE_MAX_SIZE = int(os.environ.get("GRADIO_QUEUE_MAX_SIZE", "256"))
+
+
+def _new_session_id() -> str:
+    return str(uuid.uuid4())
+
 
 CUSTOM_CSS = """
 /* Layout tweaks */
@@ -349,24 +369,37 @@ def user_submit(user_message: str, history: List[Dict[str, str]]) -> tuple[str,
     return "", new_history
 
 
+def _state_dict(wrapper: RunContextWrapper[ConversationState]) -> Dict:
+    return wrapper.context if isinstance(wrapper.context, dict) else wrapper.context.model_dump(mode="json")
+
+
 async def bot_respond(
     history: List[Dict[str, str]],
-    wrapper: RunContextWrapper[ConversationState],
+    session_id: str,
 ) -> tuple[List[Dict[str, str]], str, str, str, bool]:
     if not history:
         # No history yet: nothing to reason about, no code generated.
-        return history, "", "", ""
+        return history, "", "", "", False
 
     last_user = next((m["content"] for m in reversed(history) if m["role"] == "user"), "")
     conversation_str = _history_to_string(history)
 
+    # Holding the session entry serializes this session's turns only; other
+    # sessions proceed concurrently.
+    entry = await _sessions.acquire(session_id)
     try:
+        state = ConversationState.model_validate(entry.state) if entry.state else _new_conversation_state()
+        wrapper = RunContextWrapper[ConversationState](context=state)
         result = await _assistant.handle_turn(last_user, conversation_str, wrapper)
+        reply = result.get("assistant_reply", "")
+        # Only a completed turn is recorded, so a failed one can be retried as is.
+        _sessions.append(entry, "user", last_user)
+        _sessions.append(entry, "assistant", reply, _state_dict(wrapper))
+        if "[ChatEnded]" in reply:
+            _sessions.end(entry)
     finally:
-        # When reasoning trace is disabled, there is nothing to clean up here.
-        pass
+        await _sessions.release(entry)
 
-    reply = result.get("assistant_reply", "")
     new_history = history + [{"role": "assistant", "content": reply}]
 
     # Reasoning/event trace disabled for testing; leave panel empty.
@@ -384,14 +417,14 @@ async def bot_respond(
 
 
 def clear_chat(
-    wrapper: RunContextWrapper[ConversationState],
-) -> tuple[List[Dict[str, str]], str, str, str, bool, RunContextWrapper[ConversationState]]:
-    wrapper.context = _new_conversation_state()
-    return [], build_reasoning_html([]), "", "", False, wrapper
+    session_id: str,
+) -> tuple[List[Dict[str, str]], str, str, str, bool, str]:
+    # A reset starts a new session; the old one ages out of the cache.
+    return [], build_reasoning_html([]), "", "", False, _new_session_id()
 
 
 async def run_codegen(
-    wrapper: RunContextWrapper[ConversationState],
+    session_id: str,
     should_codegen: bool,
 ) -> tuple[str, str, bool]:
     """
@@ -403,12 +436,13 @@ async def run_codegen(
         return "", "", False
 
     status_text = "Generating code for this reminder..."
+    # Copy the final state out and let go of the session before the long call.
+    entry = await _sessions.acquire(session_id)
+    try:
+        state_dict = dict(entry.state or _new_conversation_state().model_dump(mode="json"))
+    finally:
+        await _sessions.release(entry)
     try:
-        state_dict = (
-            wrapper.context
-            if isinstance(wrapper.context, dict)
-            else wrapper.context.model_dump()
-        )
         code_obj = await CodeGeneration.generate_code(state_dict)
         generated_code_str = json.dumps(code_obj, indent=2)
     except Exception as e:
@@ -431,7 +465,7 @@ def build_app() -> gr.Blocks:
             elem_id="agent-subtitle",
         )
 
-        wrapper_state = gr.State(_wrapper)
+        session_state = gr.State(_new_session_id)  # called per browser session
         codegen_flag = gr.State(False)
 
         with gr.Row():
@@ -474,30 +508,33 @@ def build_app() -> gr.Blocks:
                     send_btn = gr.Button("Send", variant="primary")
                     clear_btn = gr.Button("Reset conversation")
 
-        # Wire up interactions: user -> history, then bot -> reply + reasoning
-        user_box.submit(user_submit, [user_box, chatbot], [user_box, chatbot]).then(
-            bot_respond,
-            [chatbot, wrapper_state],
-            [chatbot, reasoning_html, code_box, status_box, codegen_flag],
-        ).then(
-            run_codegen,
-            [wrapper_state, codegen_flag],
-            [code_box, status_box, codegen_flag],
-        )
-        send_btn.click(user_submit, [user_box, chatbot], [user_box, chatbot]).then(
-            bot_respond,
-            [chatbot, wrapper_state],
-            [chatbot, reasoning_html, code_box, status_box, codegen_flag],
-        ).then(
-            run_codegen,
-            [wrapper_state, codegen_flag],
-            [code_box, status_box, codegen_flag],
-        )
+        # Wire up interactions: user -> history, then bot -> reply + reasoning.
+        # Chat turns share one concurrency pool and code generation another.
+        for trigger, prefix in ((user_box.submit, ""), (send_btn.click, "send_")):
+            trigger(
+                user_submit, [user_box, chatbot], [user_box, chatbot],
+                api_name=f"{prefix}user_submit", concurrency_limit=None,
+            ).then(
+                bot_respond,
+                [chatbot, session_state],
+                [chatbot, reasoning_html, code_box, status_box, codegen_flag],
+                api_name=f"{prefix}bot_respond",
+                concurrency_id="chat",
+                concurrency_limit=CHAT_CONCURRENCY,
+            ).then(
+                run_codegen,
+                [session_state, codegen_flag],
+                [code_box, status_box, codegen_flag],
+                api_name=f"{prefix}run_codegen",
+                concurrency_id="codegen",
+                concurrency_limit=CODEGEN_CONCURRENCY,
+            )
 
         clear_btn.click(
             clear_chat,
-            [wrapper_state],
-            [chatbot, reasoning_html, code_box, status_box, codegen_flag, wrapper_state],
+            [session_state],
+            [chatbot, reasoning_html, code_box, status_box, codegen_flag, session_state],
+            concurrency_limit=None,
         )
 
     return demo
@@ -505,4 +542,4 @@ def build_app() -> gr.Blocks:
 
 if __name__ == "__main__":
     app = build_app()
-    app.queue().launch(share=True)
\ No newline at end of file
+    app.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=CHAT_CONCURRENCY).launch(share=True)
\ No newline at end of file
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from gradio_client import Client
+
+
+DEFAULT_SCRIPT = [
+    "remind me to close the fridge",
+    "whenever it has been open for two minutes",
+    "yes, that works",
+]
+_TAG = re.compile(r"LT\d{4}")
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_session(url: str, index: int, script: List[str]) -> Dict[str, Any]:
+    """
+    One user: send each message of `script`, then run codegen if the chat ended.
+    """
+    client = Client(url, verbose=False)
+    history: List[Any] = []
+    latencies: List[Tuple[str, float]] = []
+    errors: List[str] = []
+    # The tag goes into the reminder itself, so it lands in the "what" slot of
+    # this session's server-side state and comes back in replies and code.
+    tag = f"LT{index:04d}"
+    server_text: List[str] = []
+    for turn, text in enumerate(script):
+        message = f"{text} (reminder name {tag})" if turn == 0 else text
+        try:
+            _, history = client.predict(message, history, api_name="/user_submit")
+            t0 = time.perf_counter()
+            outputs = client.predict(history, api_name="/bot_respond")
+            latencies.append(("bot_respond", time.perf_counter() - t0))
+            history = outputs[0]
+            server_text.append(str(history[-1]))
+            if "[ChatEnded]" in str(history[-1]):
+                t0 = time.perf_counter()
+                code, _, _ = client.predict(api_name="/run_codegen")
+                latencies.append(("run_codegen", time.perf_counter() - t0))
+                server_text.append(str(code))
+                break
+        except Exception as exc:
+            errors.append(f"turn {turn}: {exc}")
+            break
+    # The history is client-held, so only what the server generated counts:
+    # another session's tag there means its state reached this session.
+    tags = set(_TAG.findall("\n".join(server_text)))
+    return {"latencies": latencies, "errors": errors, "checked": tag in tags, "leaked": bool(tags - {tag})}
+
+
+def load_test(url: str, sessions: int, script: List[str]) -> Dict[str, Any]:
+    """
+    Concurrent-session load test for gradio-app.py.
+
+    Starts `sessions` simulated users against a running app, each with its
+    own gradio_client.Client (and so its own browser session and server-side
+    conversation state), and plays the same short conversation in all of them
+    at once. Reports per-call latency percentiles, throughput and errors, and
+    checks that no session's replies or generated code mention another
+    session's reminder.
+
+        python src/gradio-app.py  # in another terminal
+        python src/gradio_load_test.py --url http://127.0.0.1:7860 --sessions 32
+    """
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda i: run_session(url, i, script), range(sessions)))
+    elapsed = time.perf_counter() - t0
+
+    report: Dict[str, Any] = {
+        "sessions": sessions,
+        "elapsed_s": round(elapsed, 2),
+        "errors": sum(len(r["errors"]) for r in results),
+        "leaked_sessions": sum(r["leaked"] for r in results),
+        # Sessions whose own tag came back; the leak check says nothing about the rest.
+        "checked_sessions": sum(r["checked"] for r in results),
+    }
+    for name in ("bot_respond", "run_codegen"):
+        values = sorted(t for r in results for n, t in r["latencies"] if n == name)
+        if values:
+            report[name] = {
+                "calls": len(values),
+                "per_s": round(len(values) / elapsed, 2),
+                "p50_s": round(_percentile(values, 0.50), 3),
+                "p95_s": round(_percentile(values, 0.95), 3),
+                "max_s": round(values[-1], 3),
+            }
+    first_errors = [e for r in results for e in r["errors"]][:5]
+    if first_errors:
+        report["first_errors"] = first_errors
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for gradio-app.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:7860")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--message", action="append", help="Conversation script (repeatable).")
+    args = parser.parse_args()
+    print("[LOADTEST]", load_test(args.url, args.sessions, args.message or DEFAULT_SCRIPT))
@@ -77,7 +77,7 @@ class ConstructionInfo(BaseModel):
 
 
 class ReminderAction(BaseModel):
-    type: Literal['reminder'] = "reminder",
+    type: Literal['reminder'] = "reminder"
     title: str  # title of the reminder
     content: str  # content of the reminder
     priority: int  # priority level of the reminder
@@ -87,7 +87,7 @@ class ReminderAction(BaseModel):
 
 
 class BroadcastAction(BaseModel):
-    type: Literal['broadcast'] = "broadcast",
+    type: Literal['broadcast'] = "broadcast"
     location: str  # location where the broadcast should be sent
     eventName: str  # name of the event to broadcast
     topicName: str  # topic to broadcast to.
@@ -95,7 +95,7 @@ class BroadcastAction(BaseModel):
 
 
 class ConversationAction(BaseModel):
-    type: Literal['ca'] = "ca",
+    type: Literal['ca'] = "ca"
     message: str  # message to be sent in the conversation
     explanation: str  # explanation of the message
 
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from action_dispatch import FiredAction
+from model_def import HomeTriggerList, ReminderAction
+
+
+@dataclass
+class ThrottleCounters:
+    received: int = 0
+    passed: int = 0  # delivered immediately, untouched
+    merged: int = 0  # reminders folded into a combined reminder
+    suppressed: int = 0  # dropped as duplicates of a pending reminder
+    combined_sent: int = 0  # combined reminders released by flush()
+
+
+class _TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, rate: float, now: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def try_take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def ready_at(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1.0 or self.rate <= 0:
+            return now
+        return now + (1.0 - self.tokens) / self.rate
+
+
+@dataclass
+class _Pending:
+    # priority -> reminders at that priority, in arrival order
+    by_priority: Dict[int, List[FiredAction]] = field(default_factory=dict)
+    keys: Set[Tuple[str, ...]] = field(default_factory=set)
+    count: int = 0
+    top_priority: int = -1
+
+
+class NotificationThrottle:
+    """
+    Per-home rate limit for reminders, so several triggers firing together
+    (fridge, freezer and pantry all left open) reach the elder as one reminder.
+
+    Each home has a token bucket refilled at one token per
+    `time_between_triggers` seconds (burst `burst`). A reminder that finds a
+    token is passed through unchanged. Otherwise it is held; reminders held for
+    the same home and target device are merged and released by flush() as one
+    combined reminder, highest priority first, once the bucket refills. A
+    reminder identical to one already pending (same trigger, or same title and
+    content) is dropped.
+
+    offer() is O(1); flush() is linear in the reminders it releases.
+    Broadcasts, conversation actions, cancel signals and reminders carrying a
+    cancel_signal (which must stay individually cancellable) are not throttled.
+    """
+
+    def __init__(self, default_interval: float = 0.0, burst: int = 1) -> None:
+        self.default_interval = default_interval
+        self.burst = burst
+        self._intervals: Dict[str, float] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        # (home_id, device_id) -> reminders held for that target
+        self._pending: Dict[Tuple[str, Optional[str]], _Pending] = {}
+        self.counters = ThrottleCounters()
+
+    def configure_home(self, home: HomeTriggerList) -> None:
+        self.set_interval(home.home_id, float(home.time_between_triggers))
+
+    def set_interval(self, home_id: str, seconds: float) -> None:
+        self._intervals[home_id] = seconds
+        self._buckets.pop(home_id, None)
+
+    def _bucket(self, home_id: str, now: float) -> _TokenBucket:
+        bucket = self._buckets.get(home_id)
+        if bucket is None:
+            interval = self._intervals.get(home_id, self.default_interval)
+            rate = 1.0 / interval if interval > 0 else float("inf")
+            bucket = _TokenBucket(float(self.burst), rate, now)
+            self._buckets[home_id] = bucket
+        return bucket
+
+    @property
+    def pending_count(self) -> int:
+        return sum(p.count for p in self._pending.values())
+
+    def offer(self, item: FiredAction, now: float) -> Optional[FiredAction]:
+        """
+        Returns the item if it may be delivered now, or None if it was held or dropped.
+        """
+        if item.cancel or not isinstance(item.action, ReminderAction) or item.action.cancel_signal:
+            return item
+
+        self.counters.received += 1
+        home_id = item.home_id
+        action = item.action
+        target = (home_id, action.device_id)
+        pending = self._pending.get(target)
+        if pending is None and self._bucket(home_id, now).try_take(now):
+            self.counters.passed += 1
+            return item
+
+        if pending is None:
+            pending = _Pending()
+            self._pending[target] = pending
+        trigger_key = ("trigger", item.trigger_id)
+        content_key = ("content", action.title.strip().lower(), action.content.strip().lower())
+        if trigger_key in pending.keys or content_key in pending.keys:
+            self.counters.suppressed += 1
+            return None
+        pending.keys.add(trigger_key)
+        pending.keys.add(content_key)
+        pending.by_priority.setdefault(item.priority, []).append(item)
+        pending.count += 1
+        if item.priority > pending.top_priority:
+            pending.top_priority = item.priority
+        return None
+
+    def next_ready_at(self, now: float) -> Optional[float]:
+        """
+        Earliest time at which flush() would release something, or None.
+        """
+        times = [self._bucket(home_id, now).ready_at(now) for home_id, _ in self._pending]
+        return min(times) if times else None
+
+    def flush(self, now: float) -> List[FiredAction]:
+        """
+        Release one combined reminder per target device, for every home whose
+        bucket has refilled.
+        """
+        released: List[FiredAction] = []
+        for target in list(self._pending):
+            home_id = target[0]
+            if not self._bucket(home_id, now).try_take(now):
+                continue
+            pending = self._pending.pop(target)
+            items = [i for p in sorted(pending.by_priority, reverse=True) for i in pending.by_priority[p]]
+            if len(items) == 1:
+                released.append(items[0])
+                continue
+            self.counters.merged += len(items)
+            self.counters.combined_sent += 1
+            released.append(_combine(home_id, items))
+        return released
+
+
+def _combine(home_id: str, items: List[FiredAction]) -> FiredAction:
+    # All items share the home and device_id (pending is keyed by both).
+    top = items[0]
+    top_action: ReminderAction = top.action  # type: ignore[assignment]
+    contents = []
+    for item in items:
+        content = item.action.content.strip()
+        if content and content not in contents:
+            contents.append(content)
+    combined = ReminderAction(
+        title=f"{top_action.title} (+{len(items) - 1} more)",
+        content="; ".join(contents),
+        priority=top.priority,
+        device_id=top_action.device_id,
+    )
+    return FiredAction(
+        home_id=home_id,
+        trigger_id=",".join(i.trigger_id for i in items),
+        action=combined,
+        priority=top.priority,
+        enqueued_at=min(i.enqueued_at for i in items),
+    )
@@ -468,6 +468,9 @@ Hard bans (for BOTH):
 
 # Sensor data contracts
 - You will receive in this prompt: task_payload (JSON describing the reminder and its cancel condition).
+- task_payload may include resolved_sensors: phrases from the request already matched to concrete sensor
+  paths ({"phrase", "matched", "kind", "paths": {<path>: <modality>}, "edge"?}). Use those paths verbatim;
+  "edge" is "rising" (opens / turns on / motion starts) or "falling" (closes / turns off / finishes).
 - Runtime provides to the functions:
   * time: tz-aware datetime.datetime (now)
   * sensor_data: dict with nested dicts keyed by modality:
@@ -476,6 +479,17 @@ Hard bans (for BOTH):
       - sensor_data['motion'][<path>]  → int (0/1 or False/True, -1 = unknown)
   * activity_data: dict describing current activity context (may be None or {} if not used)
   * blackboard: dict (use ONLY if explicit state-machine logic is required like for delays; otherwise ignore)
+  * history: global object (no import needed) with the recent change history of every sensor path:
+      - history.duration_in_state(<path>, time) → datetime.timedelta the sensor has held its current value
+      - history.last_change_time(<path>) → datetime.datetime of the last change, or None
+      - history.value_at(<path>, t) → the value at datetime t, or None if unknown
+    Prefer history over blackboard timestamps for "open for more than N seconds" style checks.
+  * windows: global object (no import needed) with the user's named time windows from user_prefs
+    (breakfast, lunch, dinner, bedtime, morning, afternoon, evening, night, work_hours), timezone-aware:
+      - windows.contains(<name>, time) → bool, e.g. windows.contains('bedtime', time)
+      - windows.windows_at(time) → tuple of window names containing time
+      - windows.next_start(<name>, time) → datetime.datetime of the next start of that window
+    Use windows instead of comparing clock strings for "during dinner" / "at bedtime" / "after work" reminders.
 
 
 # Trigger function rules
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from activity_inference import ActivityDetector, synthetic_day
+from model_def import HomeTriggerList
+from sensor_catalog import SensorCatalog
+from trigger_pack import TriggerPack
+from trigger_runtime import TriggerRuntime
+
+
+SensorEvent = Tuple[datetime.datetime, str, str, Any]  # (time, path, modality, value)
+
+
+def _parse_time(value: Any) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        t = value
+    elif isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
+    else:
+        text = str(value).strip()
+        try:
+            return datetime.datetime.fromtimestamp(float(text), tz=datetime.timezone.utc)
+        except ValueError:
+            t = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return t if t.tzinfo else t.replace(tzinfo=datetime.timezone.utc)
+
+
+def _parse_value(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() else number
+    return value
+
+
+def iter_csv_events(path: str) -> Iterator[SensorEvent]:
+    """
+    Stream events from a CSV with `path`, `modality`, `value` and `time` columns.
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield _parse_time(row["time"]), row["path"], row["modality"], _parse_value(row["value"])
+
+
+def iter_parquet_events(path: str, batch_size: int = 65536) -> Iterator[SensorEvent]:
+    """
+    Stream events from a Parquet file batch by batch (requires pyarrow).
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Reading Parquet event logs requires pyarrow (pip install pyarrow).") from exc
+
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=["path", "modality", "value", "time"]):
+        columns = batch.to_pydict()
+        for p, m, v, t in zip(columns["path"], columns["modality"], columns["value"], columns["time"]):
+            yield _parse_time(t), p, m, _parse_value(v)
+
+
+def iter_events(path: str) -> Iterator[SensorEvent]:
+    if path.endswith(".parquet"):
+        return iter_parquet_events(path)
+    return iter_csv_events(path)
+
+
+def load_home(path: str) -> HomeTriggerList:
+    """
+    Load a HomeTriggerList from JSON or from a trigger pack (.htlp).
+    """
+    if path.endswith(".htlp"):
+        with TriggerPack.open(path) as pack:
+            return pack.to_home_trigger_list()
+    with open(path, "rb") as f:
+        return HomeTriggerList.model_validate_json(f.read())
+
+
+@dataclass
+class ReplayReport:
+    home_id: str
+    log_path: str
+    events: int = 0
+    ticks: int = 0
+    elapsed_seconds: float = 0.0
+    simulated_seconds: float = 0.0
+    fires_per_trigger: Dict[str, int] = field(default_factory=dict)
+    cancels_per_trigger: Dict[str, int] = field(default_factory=dict)
+    errors_per_trigger: Dict[str, int] = field(default_factory=dict)
+    actions: int = 0
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def speedup(self) -> float:
+        """
+        Simulated time per wall-clock second.
+        """
+        return self.simulated_seconds / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["events_per_second"] = self.events_per_second
+        out["speedup"] = self.speedup
+        return out
+
+
+class ReplaySimulator:
+    """
+    Feeds a time-ordered sensor event log through a home's triggers on a
+    simulated clock.
+
+    The clock advances in `tick_seconds` steps of event time; at every tick the
+    runtime sees the latest value of every sensor (`sensor_data`) and, unless
+    disabled, the ActivityDetector's context (`activity_data`). Sensors known
+    to the catalog are visible both by path and by sensor id. Every fire,
+    cancel and action is counted, and optionally written as JSON lines.
+    """
+
+    def __init__(
+        self,
+        home: HomeTriggerList,
+        tick_seconds: float = 1.0,
+        catalog: Optional[SensorCatalog] = None,
+        detect_activities: bool = True,
+        record_file: Optional[TextIO] = None,
+    ) -> None:
+        self.home = home
+        self.tick = datetime.timedelta(seconds=tick_seconds)
+        self.catalog = catalog or SensorCatalog.load()
+        self.detector = ActivityDetector.from_data_dir() if detect_activities else None
+        self.runtime = TriggerRuntime(home)
+        self.record_file = record_file
+        self.sensor_data: Dict[str, Dict[str, Any]] = {"contact": {}, "motion": {}, "power": {}}
+
+    def _apply(self, path: str, modality: str, value: Any, t: datetime.datetime) -> None:
+        readings = self.sensor_data.setdefault(modality, {})
+        readings[path] = value
+        sensor = self.catalog.resolve(path)
+        if sensor is not None:
+            readings[sensor.path] = value
+            readings[sensor.sensor_id] = value
+        if self.detector is not None:
+            self.detector.update(path, value, t)
+
+    def _tick(self, now: datetime.datetime, report: ReplayReport) -> None:
+        activity = self.detector.context(now) if self.detector is not None else {}
+        for event in self.runtime.tick(now, self.sensor_data, activity):
+            counts = report.fires_per_trigger if event.kind == "fire" else report.cancels_per_trigger
+            counts[event.trigger_id] = counts.get(event.trigger_id, 0) + 1
+            report.actions += len(event.actions)
+            if self.record_file is not None:
+                self.record_file.write(json.dumps({
+                    "home_id": self.home.home_id,
+                    "kind": event.kind,
+                    "trigger_id": event.trigger_id,
+                    "time": event.time.isoformat(),
+                    "actions": [a.model_dump() for a in event.actions],
+                }) + "\n")
+        report.ticks += 1
+
+    def run(self, events: Iterator[SensorEvent], log_path: str = "") -> ReplayReport:
+        report = ReplayReport(home_id=self.home.home_id, log_path=log_path)
+        t0 = time.perf_counter()
+        first: Optional[datetime.datetime] = None
+        next_tick: Optional[datetime.datetime] = None
+        for t, path, modality, value in events:
+            if next_tick is None:
+                first = next_tick = t
+            while t >= next_tick:
+                self._tick(next_tick, report)
+                next_tick += self.tick
+            self._apply(path, modality, value, t)
+            report.events += 1
+        if next_tick is not None:
+            self._tick(next_tick, report)
+            report.simulated_seconds = (next_tick - first).total_seconds()
+
+        report.elapsed_seconds = time.perf_counter() - t0
+        report.errors_per_trigger = {
+            trigger_id: slot.errors
+            for trigger_id, slot in self.runtime._slots.items()
+            if slot.errors
+        }
+        return report
+
+
+def replay_home(
+    home_path: str,
+    log_path: str,
+    tick_seconds: float = 1.0,
+    record_path: Optional[str] = None,
+) -> ReplayReport:
+    home = load_home(home_path)
+    record_file = open(record_path, "w") if record_path else None
+    try:
+        simulator = ReplaySimulator(home, tick_seconds=tick_seconds, record_file=record_file)
+        return simulator.run(iter_events(log_path), log_path=log_path)
+    finally:
+        if record_file is not None:
+            record_file.close()
+
+
+def _replay_job(args: Tuple[str, str, float, Optional[str]]) -> ReplayReport:
+    return replay_home(*args)
+
+
+def replay_many(
+    jobs: List[Tuple[str, str]],
+    tick_seconds: float = 1.0,
+    max_workers: Optional[int] = None,
+    record_dir: Optional[str] = None,
+) -> List[ReplayReport]:
+    """
+    Replay many (home_path, log_path) pairs in a process pool, one home per task.
+    """
+    tasks = []
+    for i, (home_path, log_path) in enumerate(jobs):
+        record_path = os.path.join(record_dir, f"replay_{i}.jsonl") if record_dir else None
+        tasks.append((home_path, log_path, tick_seconds, record_path))
+    if max_workers == 1 or len(tasks) <= 1:
+        return [_replay_job(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_replay_job, tasks))
+
+
+def write_synthetic_log(path: str, days: int = 1, start: datetime.date = datetime.date(2025, 11, 24)) -> int:
+    """
+    Write a synthetic CSV event log (see activity_inference.synthetic_day).
+    """
+    catalog = SensorCatalog.load()
+    tz = ActivityDetector.from_data_dir().tz
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "modality", "value", "time"])
+        for d in range(days):
+            for t, sensor_path, value in synthetic_day(catalog, start + datetime.timedelta(days=d), tz):
+                writer.writerow([sensor_path, catalog.resolve(sensor_path).modality, value, t.isoformat()])
+                count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay sensor event logs through HomeTriggerLists.")
+    parser.add_argument("--job", nargs=2, action="append", metavar=("HOME", "LOG"), default=[],
+                        help="home JSON/.htlp file and CSV/Parquet event log; repeat for more homes")
+    parser.add_argument("--tick", type=float, default=1.0, help="simulated seconds per tick")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size")
+    parser.add_argument("--record-dir", default=None, help="write fired/cancelled events as JSON lines here")
+    parser.add_argument("--synthetic-log", default=None, metavar="PATH",
+                        help="write a synthetic one-day CSV log to PATH and exit")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_log:
+        print(f"[REPLAY] wrote {write_synthetic_log(args.synthetic_log):,} events to {args.synthetic_log}")
+        return
+    if not args.job:
+        parser.error("at least one --job HOME LOG is required")
+
+    t0 = time.perf_counter()
+    reports = replay_many([tuple(j) for j in args.job], args.tick, args.workers, args.record_dir)
+    total_events = sum(r.events for r in reports)
+    for report in reports:
+        print(json.dumps(report.to_dict(), indent=2))
+    elapsed = time.perf_counter() - t0
+    print(f"[REPLAY] {len(reports)} homes, {total_events:,} events in {elapsed:.2f}s "
+          f"({total_events / elapsed:,.0f} events/s overall)")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,10 +17,11 @@ ChatAssistant = chat_assistant.ChatAssistant
 
 async def main() -> None:
     """
-    Simple REPL to manually test the ChatAssistant.
+    Simple REPL to manually test the ChatAssistant. Pass a session id to
+    resume that session where it left off.
     """
     assistant = ChatAssistant()
-    await assistant.run_chat()
+    await assistant.run_chat(session_id=sys.argv[1] if len(sys.argv) > 1 else None)
 
 
 if __name__ == "__main__":
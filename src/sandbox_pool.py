@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import datetime
+import mmap
+import multiprocessing
+import os
+import pickle
+import signal
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sensor_history import SensorHistory
+from trigger_runtime import CANCEL_FUNCTION_NAME, TRIGGER_FUNCTION_NAME, compile_generated_code
+
+
+# (key, call cancel?, call trigger?, blackboard as a plain dict)
+EvalItem = Tuple[str, bool, bool, Dict[str, Any]]
+# (cancel returned True, trigger returned True, new blackboard or None if unchanged, error or None,
+#  seconds spent in each call made, cancel first)
+EvalResult = Tuple[bool, bool, Optional[Dict[str, Any]], Optional[str], List[float]]
+
+# Snapshot header in the shared buffer: sequence number, payload length.
+_HEADER = struct.Struct("<QI")
+
+
+class _Deadline(BaseException):
+    # BaseException, so `except Exception` in generated code cannot swallow it.
+    pass
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise _Deadline()
+
+
+def _current_vm_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _worker_main(
+    conn: Any,
+    shared: Optional[mmap.mmap],
+    cpu_seconds: float,
+    memory_bytes: Optional[int],
+    call_timeout: float,
+) -> None:
+    """
+    Worker loop. Messages:
+      ("load", key, trigger_src, cancel_src) -> ("ok", None) | ("error", message)
+      ("unload", key)                        -> no reply
+      ("eval", home_id, seq, inline_snapshot, now, items) -> [EvalResult, ...]
+    """
+    import resource
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    if memory_bytes is not None:
+        base = _current_vm_bytes()
+        if base is not None:
+            limit = base + memory_bytes
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    functions: Dict[str, Tuple[Any, Any]] = {}
+    histories: Dict[str, SensorHistory] = {}
+    seen_seq: Dict[str, int] = {}
+    snapshot_seq = -1
+    snapshot: Tuple[Dict[str, Any], Optional[Dict[str, Any]]] = ({}, None)
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        op = msg[0]
+
+        if op == "load":
+            _, key, trigger_src, cancel_src = msg
+            home_id = key.split("/", 1)[0]
+            history = histories.setdefault(home_id, SensorHistory())
+            try:
+                extra = {"history": history}
+                trigger_fn = compile_generated_code(trigger_src, TRIGGER_FUNCTION_NAME, f"<{key}:trigger>", extra)
+                cancel_fn = (
+                    compile_generated_code(cancel_src, CANCEL_FUNCTION_NAME, f"<{key}:cancel>", extra)
+                    if cancel_src else None
+                )
+            except Exception as exc:
+                conn.send(("error", f"{type(exc).__name__}: {exc}"))
+                continue
+            functions[key] = (trigger_fn, cancel_fn)
+            conn.send(("ok", None))
+            continue
+
+        if op == "unload":
+            functions.pop(msg[1], None)
+            continue
+
+        _, home_id, seq, inline, now, items = msg
+        if inline is not None:
+            snapshot = pickle.loads(inline)
+            snapshot_seq = -1
+        elif seq != snapshot_seq:
+            _, length = _HEADER.unpack_from(shared, 0)
+            snapshot = pickle.loads(shared[_HEADER.size:_HEADER.size + length])
+            snapshot_seq = seq
+        sensor_data, activity_data = snapshot
+        history = histories.setdefault(home_id, SensorHistory())
+        if seen_seq.get(home_id) != seq or inline is not None:
+            history.observe(sensor_data, now)
+            seen_seq[home_id] = seq
+
+        # CPU budget is per batch: move the soft limit to "used so far + budget".
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = usage.ru_utime + usage.ru_stime
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(used + cpu_seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+        results: List[EvalResult] = []
+        for key, do_cancel, do_trigger, board in items:
+            fns = functions.get(key)
+            if fns is None:
+                results.append((False, False, None, "KeyError: trigger not loaded", []))
+                continue
+            trigger_fn, cancel_fn = fns
+            before = dict(board)
+            cancelled = fired = False
+            error = None
+            seconds: List[float] = []
+            calls = []
+            if do_cancel and cancel_fn is not None:
+                calls.append(("cancel", cancel_fn))
+            if do_trigger:
+                calls.append(("trigger", trigger_fn))
+            try:
+                for kind, fn in calls:
+                    # Armed per call, and re-fired every 50 ms should the code
+                    # swallow the first alarm with a bare `except:`.
+                    signal.setitimer(signal.ITIMER_REAL, call_timeout, 0.05)
+                    t0 = time.perf_counter()
+                    try:
+                        value = bool(fn(time=now, sensor_data=sensor_data,
+                                        activity_data=activity_data, blackboard=board))
+                    finally:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                        seconds.append(time.perf_counter() - t0)
+                    if seconds[-1] > call_timeout:
+                        raise _Deadline()  # the alarm was swallowed but the call ran over
+                    if kind == "cancel":
+                        cancelled = value
+                    else:
+                        fired = value
+            except _Deadline:
+                error = f"TimeoutError: exceeded {call_timeout}s"
+            except MemoryError:
+                error = "MemoryError: memory limit exceeded"
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            results.append((cancelled, fired, board if board != before else None, error, seconds))
+        try:
+            conn.send(results)
+        except Exception as exc:
+            # e.g. a blackboard value that does not pickle
+            conn.send([(False, False, None, f"{type(exc).__name__}: {exc}", [])] * len(items))
+
+
+class _Worker:
+    __slots__ = ("process", "conn", "restarts")
+
+    def __init__(self, process: Any, conn: Any) -> None:
+        self.process = process
+        self.conn = conn
+        self.restarts = 0
+
+
+class SandboxPool:
+    """
+    Pre-forked worker processes that run generated trigger/cancel code.
+
+    Each trigger is pinned to one worker (by a hash of its key) and compiled
+    there once. Workers run under RLIMIT_AS (`memory_bytes` on top of what the
+    worker already maps) and an RLIMIT_CPU budget of `cpu_seconds` per batch;
+    each call also has a `call_timeout` wall-clock deadline (SIGALRM inside
+    the worker). A worker that dies or misses the batch deadline is killed and
+    re-forked, and its triggers are reloaded.
+
+    evaluate() writes the tick's (sensor_data, activity_data) snapshot once
+    into a shared anonymous mmap, created before the workers are forked, and
+    sends each worker only its batch of (key, blackboard) items. Snapshots too
+    large for the buffer, or platforms without fork, fall back to sending the
+    pickled snapshot with the batch.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        cpu_seconds: float = 2.0,
+        memory_bytes: Optional[int] = 256 * 1024 * 1024,
+        call_timeout: float = 0.25,
+        snapshot_bytes: int = 1024 * 1024,
+    ) -> None:
+        self.size = max(1, size)
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.call_timeout = call_timeout
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self._shared = mmap.mmap(-1, snapshot_bytes) if "fork" in methods else None
+        self._seq = 0
+        self._sources: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.timeouts = 0
+        self._workers: List[_Worker] = [self._spawn() for _ in range(self.size)]
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self._shared, self.cpu_seconds, self.memory_bytes, self.call_timeout),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _index(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.size
+
+    def _load_timeout(self) -> float:
+        return max(1.0, self.call_timeout * 4)
+
+    def _restart(self, index: int) -> None:
+        """
+        Replace worker `index` and reload its triggers. A trigger whose load
+        hangs or kills the new worker (blocking top-level code) is dropped,
+        and the worker is started again without it.
+        """
+        while True:
+            old = self._workers[index]
+            try:
+                old.process.kill()
+                old.process.join(1.0)
+            except Exception:
+                pass
+            old.conn.close()
+            worker = self._spawn()
+            worker.restarts = old.restarts + 1
+            self._workers[index] = worker
+            print(f"[SANDBOX] restarted worker {index} (restart #{worker.restarts})")
+            failed = None
+            for key, (trigger_src, cancel_src) in self._sources.items():
+                if self._index(key) != index:
+                    continue
+                try:
+                    worker.conn.send(("load", key, trigger_src, cancel_src))
+                    if not worker.conn.poll(self._load_timeout()):
+                        raise TimeoutError
+                    worker.conn.recv()
+                except (EOFError, OSError, TimeoutError):
+                    failed = key
+                    break
+            if failed is None:
+                return
+            del self._sources[failed]
+            print(f"[SANDBOX] dropped {failed}: the worker hung or died reloading it")
+
+    @property
+    def restarts(self) -> int:
+        return sum(w.restarts for w in self._workers)
+
+    def load(self, key: str, trigger_src: str, cancel_src: Optional[str]) -> None:
+        """
+        Compile a trigger in its worker. Raises ValueError if the code does not compile.
+        """
+        index = self._index(key)
+        worker = self._workers[index]
+        try:
+            worker.conn.send(("load", key, trigger_src, cancel_src))
+            if not worker.conn.poll(self._load_timeout()):
+                raise TimeoutError
+            status, message = worker.conn.recv()
+        except (EOFError, OSError, TimeoutError):
+            self._restart(index)
+            raise ValueError(f"Worker failed while loading {key}")
+        if status != "ok":
+            raise ValueError(f"Generated code for {key} failed to load: {message}")
+        self._sources[key] = (trigger_src, cancel_src)
+
+    def unload(self, key: str) -> None:
+        if self._sources.pop(key, None) is not None:
+            try:
+                self._workers[self._index(key)].conn.send(("unload", key))
+            except (OSError, BrokenPipeError):
+                pass
+
+    def _publish(self, snapshot: Any) -> Optional[bytes]:
+        """
+        Write the snapshot to shared memory; returns the pickled snapshot
+        instead if it has to travel with each batch.
+        """
+        payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        shared = self._shared
+        if shared is None or _HEADER.size + len(payload) > len(shared):
+            return payload
+        self._seq += 1
+        shared[_HEADER.size:_HEADER.size + len(payload)] = payload
+        _HEADER.pack_into(shared, 0, self._seq, len(payload))
+        return None
+
+    def evaluate(
+        self,
+        home_id: str,
+        now: datetime.datetime,
+        sensor_data: Dict[str, Any],
+        activity_data: Optional[Dict[str, Any]],
+        items: List[EvalItem],
+    ) -> List[EvalResult]:
+        """
+        Evaluate a tick's items across the workers; results are in item order.
+        """
+        inline = self._publish((sensor_data, activity_data))
+        batches: Dict[int, List[int]] = {}
+        for i, item in enumerate(items):
+            batches.setdefault(self._index(item[0]), []).append(i)
+
+        results: List[Optional[EvalResult]] = [None] * len(items)
+        sent: List[int] = []
+        for index, positions in batches.items():
+            try:
+                self._workers[index].conn.send(
+                    ("eval", home_id, self._seq, inline, now, [items[i] for i in positions])
+                )
+                sent.append(index)
+            except (OSError, BrokenPipeError):
+                self._restart(index)
+
+        for index in sent:
+            positions = batches[index]
+            conn = self._workers[index].conn
+            # Each call has its own deadline in the worker.
+            n_calls = sum(items[i][1] + items[i][2] for i in positions)
+            deadline = self.call_timeout * n_calls + 1.0
+            try:
+                if not conn.poll(deadline):
+                    self.timeouts += 1
+                    raise TimeoutError
+                for i, result in zip(positions, conn.recv()):
+                    results[i] = result
+            except (EOFError, OSError, TimeoutError):
+                self._restart(index)
+
+        return [
+            r if r is not None else (False, False, None, "WorkerError: worker died or missed its deadline", [])
+            for r in results
+        ]
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.conn.close()
+        for worker in self._workers:
+            worker.process.join(1.0)
+            if worker.process.is_alive():
+                worker.process.kill()
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def __enter__(self) -> "SandboxPool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def benchmark_sandbox(n_triggers: int = 50, n_ticks: int = 500, size: int = 2) -> Dict[str, float]:
+    """
+    Per-tick latency of a synthetic home evaluated in-process and in the sandbox pool.
+    """
+    from trigger_pack import make_synthetic_home
+    from trigger_runtime import TriggerRuntime
+
+    home = make_synthetic_home(n_triggers)
+    start = datetime.datetime(2025, 11, 24, tzinfo=datetime.timezone.utc)
+
+    def _run(runtime: TriggerRuntime) -> float:
+        t0 = time.perf_counter()
+        for i in range(n_ticks):
+            door = 1 if (i // 20) % 2 else 0
+            runtime.tick(start + datetime.timedelta(seconds=i), {"contact": {"/home/kitchen/fridge_door": door}})
+        return (time.perf_counter() - t0) / n_ticks
+
+    in_process = _run(TriggerRuntime(home))
+    with SandboxPool(size=size) as pool:
+        sandboxed = _run(TriggerRuntime(home, sandbox=pool))
+    return {"in_process_ms_per_tick": in_process * 1000, "sandbox_ms_per_tick": sandboxed * 1000}
+
+
+if __name__ == "__main__":
+    print("[SANDBOX]", benchmark_sandbox())
+
+    hang = "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n    while True:\n        pass\n"
+    bomb = "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n    return len(b'x' * (2 ** 34)) > 0\n"
+    ok = "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n    return True\n"
+    with SandboxPool(size=1) as pool:
+        for name, src in (("hang", hang), ("bomb", bomb), ("ok", ok)):
+            pool.load(f"demo/{name}", src, None)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        t0 = time.perf_counter()
+        results = pool.evaluate("demo", now, {}, None, [
+            ("demo/hang", False, True, {}), ("demo/bomb", False, True, {}), ("demo/ok", False, True, {}),
+        ])
+        print(f"[SANDBOX] misbehaving triggers handled in {time.perf_counter() - t0:.2f}s:", results)
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Activity "rooms" that are not physical rooms in the home.
+_NON_ROOMS = {"outside", "unknown"}
+
+
+def load_data_json(name: str, data_dir: str = DATA_DIR) -> Any:
+    with open(os.path.join(data_dir, name)) as f:
+        return json.load(f)
+
+
+@dataclass(frozen=True)
+class SensorInfo:
+    sensor_id: str
+    modality: str  # "motion", "contact" or "power" (the `class` in sensors.json)
+    location: str
+    room: Optional[str]
+    path: str
+    aliases: Tuple[str, ...] = ()
+
+
+def _room_for(location: str, rooms: Set[str]) -> Optional[str]:
+    best = None
+    for room in rooms:
+        if location == room or location.startswith(room + "_"):
+            if best is None or len(room) > len(best):
+                best = room
+    return best
+
+
+def sensor_path(modality: str, location: str, room: Optional[str]) -> str:
+    """
+    Canonical `/home/...` path for a sensor: `/home/<room>/<device>` where the
+    device is the rest of the location (or the modality for room-level
+    sensors), and `/home/<location>` when the location is not inside a room.
+    """
+    if room is None:
+        return f"/home/{location}"
+    device = location[len(room) + 1:] or modality
+    return f"/home/{room}/{device}"
+
+
+class SensorCatalog:
+    """
+    Sensors from sensors.json, with the room each one belongs to and its
+    canonical path. Rooms are the physical rooms named in activities.json
+    plus every motion-sensor location.
+    """
+
+    def __init__(self, sensors: Dict[str, Any], activities: Dict[str, Any]) -> None:
+        rooms = {r for r in activities.get("activities", {}).values() if r not in _NON_ROOMS}
+        for info in sensors.get("sensors", {}).values():
+            if info.get("class") == "motion":
+                rooms.add(info["location"])
+        self.rooms: Set[str] = rooms
+
+        self.by_id: Dict[str, SensorInfo] = {}
+        self.by_path: Dict[str, SensorInfo] = {}
+        for sensor_id, info in sensors.get("sensors", {}).items():
+            modality = info["class"]
+            location = info["location"]
+            room = _room_for(location, rooms)
+            sensor = SensorInfo(
+                sensor_id=sensor_id,
+                modality=modality,
+                location=location,
+                room=room,
+                path=sensor_path(modality, location, room),
+                aliases=tuple(info.get("aliases", ())),
+            )
+            self.by_id[sensor_id] = sensor
+            self.by_path[sensor.path] = sensor
+
+    @classmethod
+    def load(cls, data_dir: str = DATA_DIR) -> "SensorCatalog":
+        return cls(load_data_json("sensors.json", data_dir), load_data_json("activities.json", data_dir))
+
+    def __iter__(self) -> Iterator[SensorInfo]:
+        return iter(self.by_id.values())
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def resolve(self, key: str) -> Optional[SensorInfo]:
+        """
+        Look a sensor up by id or by path.
+        """
+        return self.by_id.get(key) or self.by_path.get(key)
+
+    def in_room(self, room: str) -> List[SensorInfo]:
+        return [s for s in self.by_id.values() if s.room == room]
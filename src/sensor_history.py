@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import datetime
+from array import array
+from typing import Any, Dict, Optional, Tuple
+
+
+class _Ring:
+    """
+    Fixed-capacity ring of (timestamp, value) pairs in two float arrays,
+    oldest first, with timestamps non-decreasing.
+    """
+
+    __slots__ = ("times", "values", "capacity", "start", "size")
+
+    def __init__(self, capacity: int) -> None:
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+
+    def _pos(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def at(self, i: int) -> Tuple[float, float]:
+        p = self._pos(i)
+        return self.times[p], self.values[p]
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        return self.at(self.size - 1) if self.size else None
+
+    def set_last_value(self, value: float) -> None:
+        self.values[self._pos(self.size - 1)] = value
+
+    def append(self, ts: float, value: float) -> Optional[Tuple[float, float]]:
+        """
+        Append, returning the evicted oldest entry when the ring was full.
+        """
+        evicted = None
+        if self.size == self.capacity:
+            evicted = (self.times[self.start], self.values[self.start])
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+        p = self._pos(self.size)
+        self.times[p] = ts
+        self.values[p] = value
+        self.size += 1
+        return evicted
+
+    def floor(self, ts: float) -> Optional[int]:
+        """
+        Index of the last entry with time <= ts, or None.
+        """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._pos(mid)] <= ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1 if lo > 0 else None
+
+
+class _SensorSeries:
+    __slots__ = ("fine", "coarse", "bucket_seconds")
+
+    def __init__(self, fine_capacity: int, coarse_capacity: int, bucket_seconds: float) -> None:
+        self.fine = _Ring(fine_capacity)
+        self.coarse = _Ring(coarse_capacity)
+        self.bucket_seconds = bucket_seconds
+
+    def record(self, ts: float, value: float) -> bool:
+        last = self.fine.last()
+        if last is not None and last[1] == value:
+            return False
+        evicted = self.fine.append(ts, value)
+        if evicted is not None:
+            # Downsample: keep one (bucket_start, last value) entry per bucket.
+            bucket = evicted[0] - (evicted[0] % self.bucket_seconds)
+            head = self.coarse.last()
+            if head is not None and head[0] == bucket:
+                self.coarse.set_last_value(evicted[1])
+            else:
+                self.coarse.append(bucket, evicted[1])
+        return True
+
+    def value_at(self, ts: float) -> Optional[float]:
+        i = self.fine.floor(ts)
+        if i is not None:
+            return self.fine.at(i)[1]
+        j = self.coarse.floor(ts)
+        if j is not None:
+            return self.coarse.at(j)[1]
+        return None
+
+
+def _ts(t: datetime.datetime) -> float:
+    return t.timestamp()
+
+
+def _dt(ts: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc)
+
+
+class SensorHistory:
+    """
+    Bounded per-sensor history of value changes, keyed by sensor path.
+
+    Each sensor keeps its last `fine_capacity` changes exactly; older changes
+    are downsampled into `coarse_capacity` buckets of `bucket_seconds` (the
+    last value seen in each bucket). Memory per sensor is fixed at
+    16 * (fine_capacity + coarse_capacity) bytes of samples, however long the
+    home runs. Repeated readings of the same value are not stored.
+
+    Generated trigger code sees an instance as the global `history`:
+
+        history.duration_in_state('/home/kitchen/fridge_door', time) > datetime.timedelta(seconds=30)
+    """
+
+    def __init__(self, fine_capacity: int = 256, coarse_capacity: int = 256, bucket_seconds: float = 300.0) -> None:
+        self.fine_capacity = fine_capacity
+        self.coarse_capacity = coarse_capacity
+        self.bucket_seconds = bucket_seconds
+        self._series: Dict[str, _SensorSeries] = {}
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._series
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def record(self, path: str, value: Any, t: datetime.datetime) -> bool:
+        """
+        Record a reading; returns True if it was a change. Non-numeric values are ignored.
+        """
+        try:
+            numeric = float(value)
+        except (TypeError, ValueError):
+            return False
+        series = self._series.get(path)
+        if series is None:
+            series = _SensorSeries(self.fine_capacity, self.coarse_capacity, self.bucket_seconds)
+            self._series[path] = series
+        return series.record(_ts(t), numeric)
+
+    def observe(self, sensor_data: Dict[str, Any], t: datetime.datetime) -> None:
+        """
+        Record every reading in a runtime `sensor_data` snapshot
+        ({modality: {path: value}}).
+        """
+        ts = _ts(t)
+        all_series = self._series
+        for readings in sensor_data.values():
+            if not isinstance(readings, dict):
+                continue
+            for path, value in readings.items():
+                series = all_series.get(path)
+                if series is not None:
+                    # Fast path: most readings repeat the current value.
+                    fine = series.fine
+                    if fine.size and fine.values[(fine.start + fine.size - 1) % fine.capacity] == value:
+                        continue
+                    try:
+                        series.record(ts, float(value))
+                    except (TypeError, ValueError):
+                        pass
+                else:
+                    self.record(path, value, t)
+
+    def current(self, path: str) -> Optional[float]:
+        series = self._series.get(path)
+        last = series.fine.last() if series else None
+        return last[1] if last else None
+
+    def last_change_time(self, path: str) -> Optional[datetime.datetime]:
+        series = self._series.get(path)
+        last = series.fine.last() if series else None
+        return _dt(last[0]) if last else None
+
+    def duration_in_state(self, path: str, now: datetime.datetime) -> datetime.timedelta:
+        """
+        How long the sensor has held its current value; zero if never seen.
+        """
+        series = self._series.get(path)
+        last = series.fine.last() if series else None
+        if last is None:
+            return datetime.timedelta(0)
+        return datetime.timedelta(seconds=max(0.0, _ts(now) - last[0]))
+
+    def value_at(self, path: str, t: datetime.datetime) -> Optional[float]:
+        """
+        The sensor's value at time `t` (approximate once `t` falls in the
+        downsampled range), or None if `t` predates the stored history.
+        """
+        series = self._series.get(path)
+        return series.value_at(_ts(t)) if series else None
+
+    def memory_bytes(self) -> int:
+        per_sensor = 16 * (self.fine_capacity + self.coarse_capacity)
+        return per_sensor * len(self._series)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    history = SensorHistory()
+    start = datetime.datetime(2025, 11, 24, tzinfo=datetime.timezone.utc)
+    paths = [f"/home/room_{i}/sensor" for i in range(25)]
+    n = 500_000
+    readings = [
+        (random.choice(paths), random.randint(0, 1), start + datetime.timedelta(seconds=i))
+        for i in range(n)
+    ]
+
+    t0 = time.perf_counter()
+    for path, value, t in readings:
+        history.record(path, value, t)
+    elapsed = time.perf_counter() - t0
+    print(f"[HISTORY] {n:,} readings in {elapsed:.2f}s ({n/elapsed:,.0f}/s); "
+          f"{len(history)} sensors hold {history.memory_bytes():,} B of samples")
+
+    t0 = time.perf_counter()
+    for i in range(100_000):
+        history.value_at(paths[i % 25], readings[(i * 7919) % n][2])
+    print(f"[HISTORY] 100,000 value_at queries in {time.perf_counter()-t0:.2f}s")
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from conversation_db import ConversationDB, SessionState
+from state_backend import StateBackend, new_owner_id
+
+
+class SessionEntry:
+    """
+    One cached session: its latest state (a ConversationState dump), and the
+    turns so far as "role: content" lines. `history` is the "role: content" string the agents take,
+    joined once and reused until the next turn is added.
+    """
+
+    __slots__ = (
+        "session_id", "state", "chars", "last_used", "lock", "ended", "version", "dirty", "loaded",
+        "_lines", "_history",
+    )
+
+    def __init__(self, session_id: str, state: Optional[Dict[str, Any]] = None) -> None:
+        self.session_id = session_id
+        self.state = state
+        self.chars = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.ended = False
+        self.version = 0  # shared session version this entry reflects
+        self.dirty = False
+        self.loaded = False  # filled from the backing store (or created there)
+        self._lines: List[str] = []
+        self._history: Optional[str] = ""
+
+    def add(self, role: str, content: str) -> None:
+        line = f"{role}: {content}"
+        self._lines.append(line)
+        self._history = None
+        self.chars += len(line) + 1
+
+    @property
+    def history(self) -> str:
+        if self._history is None:
+            self._history = "\n".join(self._lines)
+        return self._history
+
+
+class SessionCache:
+    """
+    Server-side conversation sessions for the API, so a client only sends
+    its session id and the new user text.
+
+    Hot sessions live in an LRU capped at `max_sessions` entries and
+    `max_chars` characters of history in total; a session idle for
+    `ttl_seconds` expires. Every turn is written through to the
+    ConversationDB session tables, so an evicted or expired session is
+    reloaded from there on its next request (one resume() plus one range scan
+    of its turns), and nothing is lost on restart.
+
+    acquire() returns the entry with its lock held: turns of one session are
+    serialized, different sessions run concurrently. Reloads read SQLite in a
+    worker thread, so a cache miss does not block the event loop.
+
+    With a `shared` StateBackend, several processes can serve the same
+    sessions without affinity. acquire() also takes the session's lease in
+    the backend and compares the session's shared version with the one the
+    cached entry reflects; if another process has moved the session on, the
+    entry is refilled from the backing store. release() commits the turns,
+    bumps the version and gives the lease back. Backend calls run in worker
+    threads too, since a shared backend is a database.
+    """
+
+    def __init__(
+        self,
+        backing: ConversationDB,
+        max_sessions: int = 1024,
+        max_chars: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 1800.0,
+        shared: Optional[StateBackend] = None,
+        lease_seconds: float = 120.0,
+    ) -> None:
+        self.backing = backing
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.owner = new_owner_id()
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        # Dropped entries whose last turns may still be queued in the backing
+        # writer, keyed to the backing `submitted` count at drop time. A
+        # reload reuses them instead of reading a store that is behind.
+        self._retired: Dict[str, Tuple[int, SessionEntry]] = {}
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.refills = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _new_entry(self, session_id: str) -> SessionEntry:
+        # Filled by acquire() once it holds the entry's lock.
+        retired = self._retired.pop(session_id, None)
+        if retired is not None:
+            return retired[1]
+        return SessionEntry(session_id)
+
+    def _read(self, session_id: str) -> Tuple[Optional[SessionState], List[Dict[str, Any]]]:
+        # Runs in a worker thread.
+        stored = self.backing.resume(session_id)
+        return stored, (self.backing.turns(session_id) if stored is not None else [])
+
+    async def _fill(self, entry: SessionEntry) -> bool:
+        """
+        (Re)load `entry` from the backing store; False if the session is unknown.
+        """
+        stored, turns = await asyncio.to_thread(self._read, entry.session_id)
+        before = entry.chars
+        entry._lines = []
+        entry._history = ""
+        entry.chars = 0
+        if stored is not None:
+            entry.state = stored.state
+            entry.ended = stored.ended_at is not None
+            for turn in turns:
+                entry.add(turn["role"], turn["content"])
+        if self._entries.get(entry.session_id) is entry:
+            self._chars += entry.chars - before
+        entry.loaded = True
+        return stored is not None
+
+    def _get(self, session_id: str) -> SessionEntry:
+        now = time.monotonic()
+        entry = self._entries.get(session_id)
+        if entry is not None and now - entry.last_used > self.ttl_seconds and not entry.lock.locked():
+            self._drop(session_id)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            entry = self._new_entry(session_id)
+            self._entries[session_id] = entry
+            self._chars += entry.chars
+        else:
+            self.hits += 1
+            self._entries.move_to_end(session_id)
+        entry.last_used = now
+        return entry
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id)
+        self._chars -= entry.chars
+        if self.backing.processed < self.backing.submitted:
+            self._retired[session_id] = (self.backing.submitted, entry)
+
+    def _evict(self) -> None:
+        """
+        Drop expired sessions, then least recently used ones until under both
+        caps. Sessions with a turn in progress are skipped.
+        """
+        if self._retired:
+            processed = self.backing.processed
+            for session_id, (mark, _) in list(self._retired.items()):
+                if mark <= processed:
+                    del self._retired[session_id]
+        now = time.monotonic()
+        for session_id, entry in list(self._entries.items()):
+            if now - entry.last_used <= self.ttl_seconds:
+                break  # LRU order: the rest were used more recently
+            if not entry.lock.locked():
+                self._drop(session_id)
+                self.expirations += 1
+        if len(self._entries) <= self.max_sessions and self._chars <= self.max_chars:
+            return
+        for session_id, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_sessions and self._chars <= self.max_chars:
+                break
+            if not entry.lock.locked():
+                self._drop(session_id)
+                self.evictions += 1
+
+    async def acquire(self, session_id: str) -> SessionEntry:
+        """
+        The entry for `session_id` (created if unknown), locked; pair with release().
+        """
+        entry = self._get(session_id)
+        await entry.lock.acquire()
+        try:
+            if not entry.loaded and not await self._fill(entry):
+                self.backing.start_session(session_id)
+            if self.shared is not None:
+                await self._acquire_shared(entry)
+        except BaseException:
+            if self.shared is not None:
+                # Cancelled mid-call, the lease may be ours already; no-op otherwise.
+                self.shared.release_lease(f"session:{session_id}", self.owner)
+            entry.lock.release()
+            raise
+        if self._entries.get(session_id) is not entry:
+            # Evicted while we waited for the lock; put it back.
+            self._entries[session_id] = entry
+            self._chars += entry.chars
+        return entry
+
+    async def _acquire_shared(self, entry: SessionEntry) -> None:
+        lease = f"session:{entry.session_id}"
+        deadline = time.monotonic() + self.lease_seconds
+        delay = 0.002
+        while not await asyncio.to_thread(self.shared.acquire_lease, lease, self.owner, self.lease_seconds):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Session {entry.session_id} is busy in another worker")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        version = await asyncio.to_thread(self.shared.get, "session_version", entry.session_id) or 0
+        if version != entry.version:
+            await self._fill(entry)
+            entry.version = version
+            self.refills += 1
+
+    async def release(self, entry: SessionEntry) -> None:
+        try:
+            if self.shared is not None:
+                if entry.dirty:
+                    # Other workers reload from the backing store, so the
+                    # turns must be committed before the version moves.
+                    await asyncio.to_thread(self.backing.flush)
+                    entry.version = await asyncio.to_thread(self.shared.incr, "session_version", entry.session_id)
+                await asyncio.to_thread(self.shared.release_lease, f"session:{entry.session_id}", self.owner)
+        finally:
+            entry.dirty = False
+            entry.last_used = time.monotonic()
+            entry.lock.release()
+            self._evict()
+
+    def append(self, entry: SessionEntry, role: str, content: str, state: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Add a turn to the cached entry and queue it for the backing store.
+        """
+        before = entry.chars
+        entry.add(role, content)
+        if state is not None:
+            entry.state = state
+        self._chars += entry.chars - before
+        entry.dirty = True
+        self.backing.append_turn(entry.session_id, role, content, state)
+
+    def end(self, entry: SessionEntry) -> None:
+        """
+        Mark the session ended and store its transcript as the conversations
+        row of the same id (what search and the conversation list read).
+        """
+        entry.ended = True
+        entry.dirty = True
+        self.backing.end_session(entry.session_id)
+        self.backing.save(entry.history, entry.session_id)
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "retired": len(self._retired),
+            "history_chars": self._chars,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "refills": self.refills,
+        }
+
+
+if __name__ == "__main__":
+    import os
+    import random
+    import shutil
+    import tempfile
+
+    async def _bench(n_sessions: int = 5000, n_turns: int = 50_000) -> None:
+        directory = tempfile.mkdtemp(prefix="session_cache_bench_")
+        db = ConversationDB(os.path.join(directory, "sessions.db"))
+        cache = SessionCache(db, max_sessions=1000)
+        weights = [1.0 / (k + 1) for k in range(n_sessions)]
+        picks = random.choices(range(n_sessions), weights, k=n_turns)
+        state = {"state": "NEED_WHEN", "slots": {"what": "close the fridge"}, "feasibility": {}}
+        t0 = time.perf_counter()
+        for k in picks:  # Zipf popularity: a few hot sessions, a long tail
+            session_id = f"session_{k}"
+            entry = await cache.acquire(session_id)
+            try:
+                cache.append(entry, "user", "remind me to close the fridge")
+                cache.append(entry, "assistant", "When should I remind you?", state)
+            finally:
+                await cache.release(entry)
+        elapsed = time.perf_counter() - t0
+        db.flush()
+        print(f"[SESSIONS] {n_turns:,} turns in {elapsed:.2f}s "
+              f"({elapsed / n_turns * 1e6:.1f} us each)", cache.metrics())
+        db.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    asyncio.run(_bench())
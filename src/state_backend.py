@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from conversation_db import connect
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS state_by_expiry ON state (expires_at) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_GET = "SELECT value, expires_at FROM state WHERE ns = ? AND key = ?"
+_PUT = (
+    "INSERT INTO state (ns, key, value, expires_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+)
+_PUT_IF_ABSENT = (
+    "INSERT INTO state (ns, key, value, expires_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+    "WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?"
+)
+_DELETE = "DELETE FROM state WHERE ns = ? AND key = ?"
+_PURGE = "DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?"
+_LEASE = (
+    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+    "WHERE leases.expires_at <= ? OR leases.owner = excluded.owner"
+)
+_RELEASE = "DELETE FROM leases WHERE name = ? AND owner = ?"
+
+
+class StateBackend:
+    """
+    Key/value state shared by everything serving the API: sessions, code
+    generation jobs and caches. Keys live in namespaces; values are anything
+    JSON-serializable and may carry a TTL.
+
+    Besides get/put/delete there are the two primitives that make several
+    worker processes safe without session affinity:
+      - incr(): an atomic counter (per-session version numbers);
+      - acquire_lease()/release_lease(): a named lock with an expiry, so a
+        crashed holder cannot wedge a session.
+
+    Implementations: InProcessBackend (one process) and SqliteStateBackend
+    (any number of processes on one host). A networked store for multiple
+    hosts plugs in by implementing the same methods.
+    """
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def put(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def put_if_absent(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        Store `value` only if `key` is missing (or expired); True if stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, ns: str, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, ns: str, key: str, amount: int = 1) -> int:
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Take (or renew) the lease `name` for `owner`; False if someone else holds it.
+        """
+        raise NotImplementedError
+
+    def release_lease(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessBackend(StateBackend):
+    """
+    Dict-backed state for a single process (the default; no I/O at all).
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        item = self._data.get((ns, key))
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            with self._lock:
+                self._data.pop((ns, key), None)
+            return None
+        return value
+
+    def put(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[(ns, key)] = (value, time.time() + ttl if ttl is not None else None)
+
+    def put_if_absent(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            item = self._data.get((ns, key))
+            if item is not None and (item[1] is None or item[1] > time.time()):
+                return False
+            self._data[(ns, key)] = (value, time.time() + ttl if ttl is not None else None)
+            return True
+
+    def delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((ns, key), None)
+
+    def incr(self, ns: str, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int((self._data.get((ns, key)) or (0, None))[0]) + amount
+            self._data[(ns, key)] = (value, None)
+            return value
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            held = self._leases.get(name)
+            if held is not None and held[0] != owner and held[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self._lock:
+            held = self._leases.get(name)
+            if held is not None and held[0] == owner:
+                del self._leases[name]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+
+class SqliteStateBackend(StateBackend):
+    """
+    State in a local SQLite file (WAL), shared by every process that opens
+    the same path, e.g. `uvicorn --workers N`. Each thread of each process
+    gets its own connection; connections are reopened after a fork.
+
+    Calls are synchronous single-statement transactions (tens of
+    microseconds); incr() and leases are atomic across processes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = connect(self.path, cache_kib=4 * 1024)
+            conn.isolation_level = None  # autocommit; multi-statement ops use explicit BEGIN
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, ns: str, key: str) -> Optional[Any]:
+        row = self._conn().execute(_GET, (ns, key)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def put(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._conn().execute(_PUT, (ns, key, json.dumps(value, default=str), expires_at))
+
+    def put_if_absent(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        cur = self._conn().execute(_PUT_IF_ABSENT, (ns, key, json.dumps(value, default=str), expires_at, now))
+        return cur.rowcount == 1
+
+    def delete(self, ns: str, key: str) -> None:
+        self._conn().execute(_DELETE, (ns, key))
+
+    def incr(self, ns: str, key: str, amount: int = 1) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(_GET, (ns, key)).fetchone()
+            value = (int(json.loads(row[0])) if row else 0) + amount
+            conn.execute(_PUT, (ns, key, json.dumps(value), None))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(_LEASE, (name, owner, now + ttl, now))
+        return cur.rowcount == 1
+
+    def release_lease(self, name: str, owner: str) -> None:
+        self._conn().execute(_RELEASE, (name, owner))
+
+    def purge_expired(self) -> int:
+        return self._conn().execute(_PURGE, (time.time(),)).rowcount
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_backend(url: Optional[str] = None) -> StateBackend:
+    """
+    "memory://" (default) or "sqlite:///path/to/state.db"; falls back to the
+    STATE_BACKEND environment variable.
+    """
+    url = url or os.environ.get("STATE_BACKEND", "memory://")
+    if url.startswith("memory://"):
+        return InProcessBackend()
+    if url.startswith("sqlite://"):
+        return SqliteStateBackend(url[len("sqlite://"):])
+    raise ValueError(f"Unknown state backend: {url}")
+
+
+def new_owner_id() -> str:
+    """
+    Lease owner id for this process.
+    """
+    return f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _bench_worker(args: Tuple[str, int, int, int, float, float, Any]) -> Tuple[int, float]:
+    """
+    One simulated API worker: `concurrency` clients, each running turns on
+    random sessions (no affinity) through a SessionCache shared via SQLite.
+    """
+    import asyncio
+    import random
+
+    from conversation_db import ConversationDB
+    from session_cache import SessionCache
+
+    directory, turns, n_sessions, concurrency, cpu_ms, io_ms, start_at = args
+    db = ConversationDB(os.path.join(directory, "conversations.db"))
+    shared = SqliteStateBackend(os.path.join(directory, "state.db"))
+    cache = SessionCache(db, shared=shared)
+    state = {"state": "NEED_WHEN", "slots": {"what": "close the fridge"}, "feasibility": {}}
+
+    async def client(n: int) -> None:
+        for _ in range(n):
+            entry = await cache.acquire(f"session_{random.randrange(n_sessions)}")
+            try:
+                cache.append(entry, "user", "remind me to close the fridge")
+                # Stand-in for handle_turn: some CPU (prompting, parsing) and
+                # a wait on the model.
+                spin_until = time.perf_counter() + cpu_ms / 1000
+                while time.perf_counter() < spin_until:
+                    pass
+                await asyncio.sleep(io_ms / 1000)
+                cache.append(entry, "assistant", "When should I remind you?", state)
+            finally:
+                await cache.release(entry)
+
+    async def main() -> None:
+        per_client = turns // concurrency
+        await asyncio.gather(*(client(per_client) for _ in range(concurrency)))
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    t0 = time.perf_counter()
+    asyncio.run(main())
+    db.flush()
+    elapsed = time.perf_counter() - t0
+    db.close()
+    shared.close()
+    return (turns // concurrency) * concurrency, elapsed
+
+
+def benchmark_state_backend(
+    worker_counts: Tuple[int, ...] = (1, 2, 4),
+    turns: int = 2000,
+    n_sessions: int = 200,
+    concurrency: int = 16,
+    cpu_ms: float = 2.0,
+    io_ms: float = 20.0,
+) -> Dict[str, Any]:
+    """
+    Throughput of /chat-like turns as the number of worker processes grows,
+    with every worker sharing sessions through SqliteStateBackend and one
+    conversations.db. The same total number of turns is split across the
+    workers. Also checks that no turn was lost or duplicated.
+    """
+    import multiprocessing
+    import shutil
+    import sqlite3
+    import tempfile
+
+    results: Dict[str, Any] = {"cpus": os.cpu_count()}
+    for workers in worker_counts:
+        directory = tempfile.mkdtemp(prefix="state_backend_bench_")
+        try:
+            start_at = time.time() + 0.5
+            jobs = [(directory, turns // workers, n_sessions, concurrency, cpu_ms, io_ms, start_at)] * workers
+            SqliteStateBackend(os.path.join(directory, "state.db")).close()
+            t0 = time.perf_counter()
+            with multiprocessing.get_context("spawn").Pool(workers) as pool:
+                done = pool.map(_bench_worker, jobs)
+            wall = time.perf_counter() - t0 - max(0.0, start_at - time.time())
+            total = sum(n for n, _ in done)
+            slowest = max(elapsed for _, elapsed in done)
+            conn = sqlite3.connect(os.path.join(directory, "conversations.db"))
+            stored, = conn.execute("SELECT COUNT(*) FROM turns").fetchone()
+            counted, = conn.execute("SELECT COALESCE(SUM(turn_count), 0) FROM sessions").fetchone()
+            conn.close()
+            results[f"workers_{workers}"] = {
+                "turns": total,
+                "turns_per_s": total / slowest,
+                "wall_s": round(wall, 2),
+                "consistent": stored == counted == 2 * total,
+            }
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Worker-scaling benchmark for the shared state backend.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--cpu-ms", type=float, default=2.0)
+    parser.add_argument("--io-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    for name, value in benchmark_state_backend(tuple(args.workers), args.turns, cpu_ms=args.cpu_ms, io_ms=args.io_ms).items():
+        print(f"[STATE] {name}: {value}")
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import datetime
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sensor_catalog import DATA_DIR, load_data_json
+
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+_WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def parse_hhmm(value: str) -> int:
+    """
+    "7:30" / "07:30" -> seconds after midnight.
+    """
+    hour, minute = value.strip().split(":")
+    return int(hour) * 3600 + int(minute) * 60
+
+
+class TimeWindowIndex:
+    """
+    The named time windows of user_prefs.json, compiled once into a weekly
+    timeline in the user's timezone.
+
+    Windows are the anchors (breakfast, lunch, dinner, bedtime), the dayparts
+    (morning, ...) and "work_hours" (per weekday). A window's end is inclusive
+    to the minute ("06:00"-"11:59" covers 11:59:59), and an end before the
+    start wraps past midnight ("22:30"-"6:00" runs into the next day).
+
+    Every window occurrence becomes an interval in seconds-of-week; the
+    boundaries of all intervals split the week into elementary segments, each
+    storing the tuple of windows active in it. windows_at() and contains()
+    are one bisect over the boundaries, next_start() one bisect over the
+    window's own start times: O(log n) either way.
+
+    Aware datetimes are converted to the index timezone; naive ones are taken
+    to be local time already.
+    """
+
+    def __init__(self, user_prefs: Dict[str, Any], tz: Optional[str] = None) -> None:
+        windows = user_prefs.get("windows", {})
+        work = windows.get("work_hours", {}) or {}
+        self.tz = ZoneInfo(tz or work.get("timezone") or "America/New_York")
+        self.spans: Dict[str, List[Tuple[int, int]]] = {}  # name -> [(start, end)) in seconds of week
+
+        for group in ("anchors", "dayparts"):
+            for name, span in (windows.get(group) or {}).items():
+                if span:
+                    start, end = self._daily(span)
+                    self._add(name, [(d * DAY + start, d * DAY + end) for d in range(7)])
+        weekly = work.get("weekly") or {}
+        occurrences = []
+        for d, day in enumerate(_WEEKDAYS):
+            span = weekly.get(day)
+            if span:
+                start, end = self._daily(span)
+                occurrences.append((d * DAY + start, d * DAY + end))
+        if occurrences:
+            self._add("work_hours", occurrences)
+
+        self._compile()
+
+    @classmethod
+    def from_data_dir(cls, data_dir: str = DATA_DIR) -> "TimeWindowIndex":
+        return cls(load_data_json("user_prefs.json", data_dir))
+
+    @staticmethod
+    def _daily(span: List[str]) -> Tuple[int, int]:
+        start = parse_hhmm(span[0])
+        end = parse_hhmm(span[1]) + 60  # inclusive to the minute
+        if end <= start:
+            end += DAY
+        return start, end
+
+    def _add(self, name: str, occurrences: List[Tuple[int, int]]) -> None:
+        spans = self.spans.setdefault(name, [])
+        for start, end in occurrences:
+            length = min(end - start, WEEK)
+            start %= WEEK
+            end = start + length
+            if end > WEEK:  # wraps past the end of the week
+                spans.append((start, WEEK))
+                spans.append((0, end - WEEK))
+            else:
+                spans.append((start, end))
+        spans.sort()
+
+    def _compile(self) -> None:
+        cuts = {0, WEEK}
+        for spans in self.spans.values():
+            for start, end in spans:
+                cuts.add(start)
+                cuts.add(end)
+        self._bounds = sorted(cuts)
+        self._active: List[Tuple[str, ...]] = []
+        for i, seg_start in enumerate(self._bounds[:-1]):
+            active = tuple(
+                name for name, spans in self.spans.items()
+                if any(start <= seg_start < end for start, end in spans)
+            )
+            self._active.append(active)
+        # Start times per window, excluding starts that merely continue a
+        # span split at the week boundary.
+        self._starts: Dict[str, List[int]] = {}
+        for name, spans in self.spans.items():
+            ends = {end % WEEK for _, end in spans}
+            starts = sorted(s for s, _ in spans if not (s == 0 and 0 in ends))
+            self._starts[name] = starts or [s for s, _ in spans]
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.spans)
+
+    def _local(self, t: datetime.datetime) -> datetime.datetime:
+        return t.astimezone(self.tz) if t.tzinfo is not None else t.replace(tzinfo=self.tz)
+
+    @staticmethod
+    def _week_second(local: datetime.datetime) -> float:
+        return local.weekday() * DAY + local.hour * 3600 + local.minute * 60 + local.second + local.microsecond / 1e6
+
+    def windows_at(self, t: datetime.datetime) -> Tuple[str, ...]:
+        """
+        Names of the windows that contain `t`.
+        """
+        s = self._week_second(self._local(t))
+        return self._active[bisect_right(self._bounds, s) - 1]
+
+    def contains(self, name: str, t: datetime.datetime) -> bool:
+        if name not in self.spans:
+            raise KeyError(f"Unknown time window: {name}")
+        return name in self.windows_at(t)
+
+    def next_start(self, name: str, t: datetime.datetime) -> datetime.datetime:
+        """
+        The first start of window `name` strictly after `t`, in the index timezone.
+        """
+        starts = self._starts.get(name)
+        if not starts:
+            raise KeyError(f"Unknown time window: {name}")
+        local = self._local(t)
+        s = self._week_second(local)
+        i = bisect_right(starts, s)
+        target = starts[i] if i < len(starts) else starts[0] + WEEK
+        week_start = datetime.datetime.combine(
+            local.date() - datetime.timedelta(days=local.weekday()), datetime.time(0), tzinfo=self.tz
+        )
+        # Build the result from the wall-clock date and time so DST shifts
+        # between now and then do not move it.
+        day, second = divmod(int(target), DAY)
+        date = week_start.date() + datetime.timedelta(days=day)
+        return datetime.datetime.combine(date, datetime.time(second // 3600, second // 60 % 60), tzinfo=self.tz)
+
+    def seconds_until(self, name: str, t: datetime.datetime) -> float:
+        """
+        0 if `t` is inside window `name`, else seconds until it next starts.
+        """
+        if self.contains(name, t):
+            return 0.0
+        return (self.next_start(name, t) - self._local(t)).total_seconds()
+
+    def segment_count(self) -> int:
+        return len(self._active)
+
+
+@lru_cache(maxsize=1)
+def default_windows() -> TimeWindowIndex:
+    """
+    The index for src/data/user_prefs.json, compiled once per process.
+    """
+    return TimeWindowIndex.from_data_dir()
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    index = default_windows()
+    print(f"[WINDOWS] {len(index.names)} windows -> {index.segment_count()} segments ({index.tz.key})")
+    start = datetime.datetime(2025, 11, 24, tzinfo=index.tz)
+    samples = [start + datetime.timedelta(seconds=random.randrange(WEEK)) for _ in range(200_000)]
+    t0 = time.perf_counter()
+    for t in samples:
+        index.windows_at(t)
+    elapsed = time.perf_counter() - t0
+    print(f"[WINDOWS] {len(samples):,} windows_at() in {elapsed:.2f}s ({elapsed / len(samples) * 1e6:.2f} us each)")
+    t = datetime.datetime(2025, 11, 28, 23, 0, tzinfo=index.tz)  # Friday night
+    print(f"[WINDOWS] {t.isoformat()}: {index.windows_at(t)}; next work_hours {index.next_start('work_hours', t)}")
@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import multiprocessing
+import random
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from model_def import CancelCondition, OccurrenceFrequency, Recurrence, TriggerCondition, TriggerMachine
+from sensor_catalog import SensorCatalog, load_data_json
+from sensor_history import SensorHistory
+from trigger_inputs import MODALITIES, referenced_inputs
+from trigger_runtime import CANCEL_FUNCTION_NAME, TRIGGER_FUNCTION_NAME, compile_generated_code
+
+
+# Samples kept per run for cost percentiles.
+_MAX_COST_SAMPLES = 2000
+
+
+class _CallTimeout(BaseException):
+    # BaseException, so `except Exception` in generated code cannot swallow it.
+    pass
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise _CallTimeout()
+
+
+@dataclass
+class FuzzRunResult:
+    steps: int = 0
+    fires: int = 0
+    cancels: int = 0
+    contradictions: int = 0
+    timeouts: int = 0
+    compile_error: Optional[str] = None
+    exceptions: Dict[str, int] = field(default_factory=dict)
+    trigger_costs: List[float] = field(default_factory=list)
+    cancel_costs: List[float] = field(default_factory=list)
+
+
+@dataclass
+class FuzzReport:
+    trigger_id: str
+    steps: int
+    fires: int
+    cancels: int
+    contradictions: int
+    timeouts: int
+    exceptions: Dict[str, int]
+    has_cancel: bool
+    trigger_cost_us: Dict[str, float]
+    cancel_cost_us: Dict[str, float]
+    problems: List[str]
+    elapsed_seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+def _random_value(rng: random.Random, modality: str) -> Any:
+    if modality == "power":
+        return rng.choice([0.0, 0.0, 3.0, 850.0, 1200.0])
+    return rng.choice([0, 1, 1, 0, -1]) if rng.random() < 0.05 else rng.choice([0, 1])
+
+
+@dataclass
+class _RunSpec:
+    trigger_code: str
+    cancel_code: Optional[str]
+    cancel_delay: float  # seconds after a fire before the cancel code is checked
+    frequency: str  # OccurrenceFrequency value
+    recurrence_delay: float  # cooldown for OccurrenceFrequency.delay
+    steps: int
+    seed: int
+    max_step_seconds: float
+    call_timeout: float
+
+
+def _fuzz_run(spec: _RunSpec) -> FuzzRunResult:
+    """
+    One random sequence, with the runtime's rules: the cancel code is only
+    checked once `cancel_delay` has passed since the fire, and fires respect
+    the recurrence. A call running past `call_timeout` (SIGALRM, so only when
+    this runs in a main thread, as in the pool workers) ends the run and is
+    counted in `timeouts`. Code that does not compile (or load) ends it
+    before the first step, with `compile_error` set.
+    """
+    trigger_code, cancel_code, steps, seed = spec.trigger_code, spec.cancel_code, spec.steps, spec.seed
+    max_step_seconds = spec.max_step_seconds
+    guard = threading.current_thread() is threading.main_thread()
+    previous_handler = signal.signal(signal.SIGALRM, _on_alarm) if guard else None
+    catalog = SensorCatalog.load()
+    activity_names = set(load_data_json("activities.json").get("activities", {}))
+    history = SensorHistory()
+    extra = {"history": history}
+    result = FuzzRunResult()
+    try:
+        # Loading runs the code's top level, so it gets the same deadline.
+        if guard:
+            signal.setitimer(signal.ITIMER_REAL, spec.call_timeout)
+        try:
+            trigger_fn = compile_generated_code(trigger_code, TRIGGER_FUNCTION_NAME, "<fuzz:trigger>", extra)
+            cancel_fn = (
+                compile_generated_code(cancel_code, CANCEL_FUNCTION_NAME, "<fuzz:cancel>", extra)
+                if cancel_code else None
+            )
+        finally:
+            if guard:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except _CallTimeout:
+        result.compile_error = f"TimeoutError: loading took over {spec.call_timeout:.2f}s"
+    except Exception as exc:
+        result.compile_error = f"{type(exc).__name__}: {exc}"
+    if result.compile_error is not None:
+        if guard:
+            signal.signal(signal.SIGALRM, previous_handler)
+        return result
+    inputs = referenced_inputs([trigger_code, cancel_code or ""], catalog, activity_names)
+
+    rng = random.Random(seed)
+    # Every catalog sensor, plus whatever the code reads, in both the nested
+    # ({modality: {path: value}}) and flat ({sensor_id: value}) shapes seen in
+    # generated code.
+    keys: Dict[str, str] = {}
+    for sensor in catalog:
+        keys[sensor.path] = sensor.modality
+        keys[sensor.sensor_id] = sensor.modality
+    keys.update(inputs.sensors)
+    hot_keys = list(inputs.sensors) or list(keys)
+    values = {key: (0.0 if modality == "power" else 0) for key, modality in keys.items()}
+
+    activities = sorted(activity_names)
+    hot_activities = sorted(inputs.activities) or activities
+    current_activity = rng.choice(activities)
+    previous_activity = rng.choice(activities)
+
+    now = datetime.datetime(2025, 1, 6, tzinfo=datetime.timezone.utc) + datetime.timedelta(
+        seconds=rng.randrange(7 * 24 * 3600)
+    )
+    blackboard: Dict[str, Any] = {}
+    active = False
+
+    def _call(fn: Any, board: Dict[str, Any], sensor_data: Dict[str, Any], activity_data: Dict[str, Any], costs: List[float]) -> bool:
+        if guard:
+            signal.setitimer(signal.ITIMER_REAL, spec.call_timeout)
+        t0 = time.perf_counter()
+        try:
+            return bool(fn(time=now, sensor_data=sensor_data, activity_data=activity_data, blackboard=board))
+        except _CallTimeout:
+            raise
+        except Exception as exc:
+            name = type(exc).__name__
+            result.exceptions[name] = result.exceptions.get(name, 0) + 1
+            return False
+        finally:
+            if guard:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            if len(costs) < _MAX_COST_SAMPLES:
+                costs.append(time.perf_counter() - t0)
+
+    cancel_delay = datetime.timedelta(seconds=spec.cancel_delay)
+    fired_at: Optional[datetime.datetime] = None
+
+    def _may_fire() -> bool:
+        # Mirrors TriggerRuntime._may_fire.
+        if active:
+            return False
+        if fired_at is None or spec.frequency == OccurrenceFrequency.always.value:
+            return True
+        if spec.frequency == OccurrenceFrequency.once.value:
+            return False
+        if spec.frequency == OccurrenceFrequency.once_per_day.value:
+            return fired_at.date() != now.date()
+        return now - fired_at >= datetime.timedelta(seconds=spec.recurrence_delay)
+
+    try:
+        for _ in range(steps):
+            now += datetime.timedelta(seconds=rng.uniform(1.0, max_step_seconds))
+            # Mostly hold values (so "open for N seconds" can happen), flipping the
+            # sensors the code reads far more often than the rest.
+            for _ in range(rng.choice((0, 0, 1, 1, 2))):
+                key = rng.choice(hot_keys) if rng.random() < 0.8 else rng.choice(list(keys))
+                values[key] = _random_value(rng, keys[key])
+            if rng.random() < 0.05:
+                previous_activity = current_activity
+                current_activity = rng.choice(hot_activities) if rng.random() < 0.6 else rng.choice(activities)
+
+            sensor_data: Dict[str, Any] = {m: {} for m in MODALITIES}
+            for key, value in values.items():
+                sensor_data[keys[key]][key] = value
+                if not key.startswith("/"):
+                    sensor_data[key] = value
+            activity_data = {"current": current_activity, "previous": previous_activity}
+            history.observe({m: sensor_data[m] for m in MODALITIES}, now)
+
+            result.steps += 1
+            # Same order as TriggerRuntime._apply: cancel (once the delay is
+            # up), then fire.
+            if active and now - fired_at >= cancel_delay and _call(
+                cancel_fn, blackboard, sensor_data, activity_data, result.cancel_costs
+            ):
+                result.cancels += 1
+                active = False
+            if spec.frequency == OccurrenceFrequency.once.value and fired_at is not None:
+                continue
+            fired = _call(trigger_fn, blackboard, sensor_data, activity_data, result.trigger_costs)
+            if not (fired and _may_fire()):
+                continue
+            result.fires += 1
+            fired_at = now
+            if cancel_fn is None:
+                continue
+            active = True
+            # With no delay the cancel is checked straight away: if it already
+            # holds on the inputs that fired, the trigger undoes itself.
+            if not cancel_delay and _call(cancel_fn, dict(blackboard), sensor_data, activity_data, result.cancel_costs):
+                result.contradictions += 1
+    except _CallTimeout:
+        result.timeouts += 1
+    finally:
+        if guard:
+            signal.signal(signal.SIGALRM, previous_handler)
+    return result
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def _q(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+
+    return {"p50": _q(0.50), "p95": _q(0.95), "p99": _q(0.99), "max": ordered[-1] * 1e6}
+
+
+def fuzz_trigger(
+    machine: TriggerMachine,
+    steps: int = 5000,
+    runs: int = 8,
+    max_workers: Optional[int] = None,
+    seed: int = 0,
+    max_step_seconds: float = 120.0,
+    budget_us: float = 200.0,
+    call_timeout: float = 0.5,
+    run_timeout: float = 60.0,
+) -> FuzzReport:
+    """
+    Drive a TriggerMachine's generated code with `runs` independent random
+    sensor/activity/time sequences of `steps` steps each, in a process pool,
+    and report whether it ever fires and cancels, how often it would be
+    cancelled the moment it fires, what it raises, and per-call cost.
+
+    Every call runs under `call_timeout`, and the pooled runs together under
+    `run_timeout` (the pool is then terminated); going over either is
+    reported as a problem, so code that hangs is rejected.
+    """
+    t0 = time.perf_counter()
+    trigger_code = machine.trigger_condition.generated_trigger_code
+    recurrence = machine.trigger_condition.recurrence
+    cancel = machine.cancel_condition
+    cancel_code = cancel.generated_cancel_code if cancel else None
+    specs = [
+        _RunSpec(
+            trigger_code=trigger_code,
+            cancel_code=cancel_code,
+            cancel_delay=float(cancel.delay if cancel else 0),
+            frequency=OccurrenceFrequency(recurrence.occurrence_frequency).value,
+            recurrence_delay=float((recurrence.details.delay if recurrence.details else None) or 0),
+            steps=steps,
+            seed=seed + i,
+            max_step_seconds=max_step_seconds,
+            call_timeout=call_timeout,
+        )
+        for i in range(runs)
+    ]
+
+    results: List[FuzzRunResult] = []
+    runs_timed_out = 0
+    if max_workers == 1 or runs <= 1:
+        results = [_fuzz_run(spec) for spec in specs]
+    else:
+        pool = multiprocessing.Pool(processes=max_workers)
+        try:
+            pending = [pool.apply_async(_fuzz_run, (spec,)) for spec in specs]
+            deadline = time.monotonic() + run_timeout
+            for async_result in pending:
+                try:
+                    results.append(async_result.get(timeout=max(0.0, deadline - time.monotonic())))
+                except multiprocessing.TimeoutError:
+                    runs_timed_out += 1
+        finally:
+            pool.terminate()
+            pool.join()
+
+    total = FuzzRunResult()
+    for r in results:
+        total.steps += r.steps
+        total.fires += r.fires
+        total.cancels += r.cancels
+        total.contradictions += r.contradictions
+        total.timeouts += r.timeouts
+        for name, count in r.exceptions.items():
+            total.exceptions[name] = total.exceptions.get(name, 0) + count
+        total.trigger_costs.extend(r.trigger_costs)
+        total.cancel_costs.extend(r.cancel_costs)
+
+    trigger_cost = _percentiles(total.trigger_costs)
+    cancel_cost = _percentiles(total.cancel_costs)
+    problems: List[str] = []
+    compile_errors = sorted({r.compile_error for r in results if r.compile_error is not None})
+    if compile_errors:
+        # Nothing ran, so the other checks have nothing to say.
+        problems.append("does not compile: " + "; ".join(compile_errors))
+    elif total.timeouts:
+        problems.append(f"a call ran past {call_timeout:.2f}s ({total.timeouts} runs)")
+    if runs_timed_out:
+        problems.append(f"{runs_timed_out}/{runs} runs did not finish within {run_timeout:.0f}s")
+    if not compile_errors:
+        if total.fires == 0:
+            problems.append(f"never fired in {total.steps} steps")
+        if cancel_code and total.fires and total.cancels == 0:
+            problems.append("fired but never cancelled")
+        if total.contradictions:
+            problems.append(f"cancel condition already true when firing ({total.contradictions}/{total.fires} fires)")
+        if total.exceptions:
+            problems.append("raised " + ", ".join(f"{k} x{v}" for k, v in sorted(total.exceptions.items())))
+        if trigger_cost["p99"] > budget_us or cancel_cost["p99"] > budget_us:
+            problems.append(f"p99 cost over budget of {budget_us:.0f}us")
+
+    return FuzzReport(
+        trigger_id=machine.TriggerId,
+        steps=total.steps,
+        fires=total.fires,
+        cancels=total.cancels,
+        contradictions=total.contradictions,
+        timeouts=total.timeouts + runs_timed_out,
+        exceptions=total.exceptions,
+        has_cancel=cancel_code is not None,
+        trigger_cost_us=trigger_cost,
+        cancel_cost_us=cancel_cost,
+        problems=problems,
+        elapsed_seconds=time.perf_counter() - t0,
+    )
+
+
+def fuzz_generated_code(code_obj: Dict[str, Any], **kwargs: Any) -> FuzzReport:
+    """
+    Fuzz the raw output of CodeGeneration.generate_code before it becomes a
+    TriggerMachine.
+    """
+    machine = TriggerMachine(
+        TriggerId="generated",
+        trigger_condition=TriggerCondition(
+            generated_trigger_code=code_obj.get("generated_trigger_code") or "",
+            recurrence=Recurrence(repeat=True, occurrence_frequency="always"),
+        ),
+        cancel_condition=CancelCondition(delay=0, generated_cancel_code=code_obj.get("generated_cancel_code")),
+        actions=[],
+    )
+    return fuzz_trigger(machine, **kwargs)
+
+
+if __name__ == "__main__":
+    import json
+
+    from replay import load_home
+
+    parser = argparse.ArgumentParser(description="Fuzz every trigger of a HomeTriggerList.")
+    parser.add_argument("home", help="home JSON or .htlp file")
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--budget-us", type=float, default=200.0)
+    args = parser.parse_args()
+
+    for machine in load_home(args.home).TriggerMachines:
+        report = fuzz_trigger(machine, args.steps, args.runs, args.workers, budget_us=args.budget_us)
+        status = "OK" if report.ok else "REJECT"
+        print(f"[FUZZ] {status} {report.trigger_id}: fires={report.fires} cancels={report.cancels} "
+              f"p99={report.trigger_cost_us['p99']:.1f}us ({report.elapsed_seconds:.2f}s)")
+        for problem in report.problems:
+            print(f"        - {problem}")
+        if not report.ok:
+            print(json.dumps(report.__dict__, indent=2, default=str))
@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from model_def import BroadcastAction, HomeTriggerList, ReminderAction, TriggerMachine
+from sensor_catalog import SensorCatalog, load_data_json
+from trigger_inputs import referenced_inputs
+
+
+_ALL_HOURS: FrozenSet[int] = frozenset(range(24))
+
+_STOP_WORDS = {
+    "a", "an", "the", "to", "is", "are", "was", "be", "been", "it", "its", "of", "in", "on", "at",
+    "for", "and", "or", "please", "remind", "reminder", "me", "my", "you", "your", "if", "when",
+    "has", "have", "left", "still", "been", "again", "dont", "forget",
+}
+_SYNONYMS = {
+    "refrigerator": "fridge", "shut": "close", "closed": "close", "closing": "close",
+    "opened": "open", "opening": "open", "ajar": "open", "meds": "medication",
+    "medicine": "medication", "pills": "medication", "pill": "medication",
+}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Weights of sensor and text similarity; both are scaled by time-window overlap.
+_SENSOR_WEIGHT = 0.7
+_TEXT_WEIGHT = 0.3
+DUPLICATE_THRESHOLD = 0.75
+OVERLAP_THRESHOLD = 0.4
+
+
+def normalize_text(text: str) -> Set[str]:
+    """
+    Lowercased, de-punctuated terms with stop words dropped, synonyms folded
+    and a crude plural strip ("doors" -> "door").
+    """
+    terms = set()
+    for word in _WORD_RE.findall(text.lower().replace("'", "")):
+        word = _SYNONYMS.get(word, word)
+        if word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.add(word)
+    return terms
+
+
+def action_terms(machine: TriggerMachine) -> Set[str]:
+    terms: Set[str] = set()
+    for action in machine.actions:
+        if isinstance(action, ReminderAction):
+            terms |= normalize_text(f"{action.title} {action.content}")
+        elif isinstance(action, BroadcastAction):
+            terms |= normalize_text(f"{action.eventName.replace('_', ' ')} {action.location}")
+    if machine.TriggerName:
+        terms |= normalize_text(machine.TriggerName.replace("_", " "))
+    return terms
+
+
+_COMPARE = {
+    ast.Eq: lambda h, c: h == c, ast.NotEq: lambda h, c: h != c,
+    ast.Lt: lambda h, c: h < c, ast.LtE: lambda h, c: h <= c,
+    ast.Gt: lambda h, c: h > c, ast.GtE: lambda h, c: h >= c,
+}
+
+
+def _is_hour(node: ast.AST, aliases: FrozenSet[str] = frozenset()) -> bool:
+    return (isinstance(node, ast.Attribute) and node.attr == "hour") or (
+        isinstance(node, ast.Name) and node.id in aliases
+    )
+
+
+def _int_constant(node: ast.AST) -> Optional[int]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, int) and not isinstance(node.value, bool):
+        return node.value
+    return None
+
+
+def _hour_values(node: ast.AST) -> Optional[Set[int]]:
+    # (1, 2, 3) / [..] / {..} / range(a, b)
+    if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+        values = {_int_constant(e) for e in node.elts}
+        return None if None in values else values
+    if (
+        isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "range"
+        and not node.keywords and 1 <= len(node.args) <= 3
+    ):
+        bounds = [_int_constant(a) for a in node.args]
+        return None if None in bounds else set(range(*bounds))
+    return None
+
+
+def _compare_hours(node: ast.Compare, aliases: FrozenSet[str] = frozenset()) -> Optional[Set[int]]:
+    """
+    Hours for which the comparison holds; None if it does not compare the
+    hour, or compares it in a way this cannot evaluate.
+    """
+    operands = [node.left, *node.comparators]
+    if not any(_is_hour(o, aliases) for o in operands):
+        return None
+    hours = set(range(24))
+    for left, op, right in zip(operands, node.ops, operands[1:]):
+        if isinstance(op, (ast.In, ast.NotIn)) and _is_hour(left, aliases):
+            values = _hour_values(right)
+            if values is None:
+                return None
+            hours &= values if isinstance(op, ast.In) else _ALL_HOURS - values
+            continue
+        fn = _COMPARE.get(type(op))
+        if fn is None:
+            return None
+        if _is_hour(left, aliases) and _int_constant(right) is not None:
+            c = _int_constant(right)
+            hours &= {h for h in range(24) if fn(h, c)}
+        elif _is_hour(right, aliases) and _int_constant(left) is not None:
+            c = _int_constant(left)
+            hours &= {h for h in range(24) if fn(c, h)}
+        elif _is_hour(left, aliases) or _is_hour(right, aliases):
+            return None
+    return hours
+
+
+class _Unknown(Exception):
+    pass
+
+
+def _test_hours(node: ast.AST, aliases: FrozenSet[str]) -> Tuple[Set[int], Set[int]]:
+    """
+    (possible, certain): hours in which `node` may be true, and in which it
+    is true whatever the rest of the inputs. Raises _Unknown if the hour is
+    used in a way that cannot be evaluated.
+    """
+    if isinstance(node, ast.Compare):
+        hours = _compare_hours(node, aliases)
+        if hours is not None:
+            return hours, hours
+    elif isinstance(node, ast.BoolOp):
+        parts = [_test_hours(v, aliases) for v in node.values]
+        if isinstance(node.op, ast.And):
+            return set.intersection(*(p for p, _ in parts)), set.intersection(*(c for _, c in parts))
+        return set.union(*(p for p, _ in parts)), set.union(*(c for _, c in parts))
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        possible, certain = _test_hours(node.operand, aliases)
+        return set(_ALL_HOURS - certain), set(_ALL_HOURS - possible)
+    if _mentions_hour(node, aliases):
+        raise _Unknown()
+    return set(_ALL_HOURS), set()
+
+
+def _mentions_hour(node: ast.AST, aliases: FrozenSet[str]) -> bool:
+    return any(_is_hour(n, aliases) for n in ast.walk(node))
+
+
+def _exits_falsy(body: List[ast.stmt]) -> bool:
+    # `return`, `return False`, `return None`, `return 0` as the block's last statement.
+    if not body or not isinstance(body[-1], ast.Return):
+        return False
+    value = body[-1].value
+    return value is None or (isinstance(value, ast.Constant) and not value.value)
+
+
+def _may_return_truthy(node: ast.AST) -> bool:
+    return any(isinstance(n, ast.Return) and not _exits_falsy([n]) for n in ast.walk(node))
+
+
+def _trigger_function(tree: ast.Module) -> Optional[ast.FunctionDef]:
+    functions = [n for n in tree.body if isinstance(n, ast.FunctionDef)]
+    for fn in functions:
+        if fn.name == "reminder_trigger":
+            return fn
+    return functions[0] if functions else None
+
+
+def hour_window(source: str) -> FrozenSet[int]:
+    """
+    Hours of the day in which the code can possibly fire, from comparisons on
+    `<something>.hour` (or a local assigned from one) in the trigger
+    function's top-level statements:
+
+      if <hour test>: return False     -> fires only where the test is not
+                                          certainly true (guard clause)
+      if <hour test>: ... else/then return False
+                                       -> fires only where the test may hold
+      return <hour test> and ...       -> fires only where the test may hold
+
+    Any other use of the hour (nested, assigned to a flag, passed to a
+    call) makes the window unknown, and code without hour checks may fire at
+    any hour; both give all 24 hours, so the index never prunes a trigger
+    on a window it misread.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return _ALL_HOURS
+    fn = _trigger_function(tree)
+    if fn is None:
+        return _ALL_HOURS
+    aliases: Set[str] = set()
+    window = set(_ALL_HOURS)
+    body = fn.body
+    may_have_fired = False  # a restriction only covers the returns after it
+    try:
+        for i, stmt in enumerate(body):
+            frozen = frozenset(aliases)
+            if may_have_fired and _mentions_hour(stmt, frozen):
+                raise _Unknown()
+            if (
+                isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                and isinstance(stmt.targets[0], ast.Name) and _is_hour(stmt.value)
+            ):
+                aliases.add(stmt.targets[0].id)
+            elif isinstance(stmt, ast.If) and _mentions_hour(stmt.test, frozen):
+                if any(_mentions_hour(s, frozen) for s in stmt.body + stmt.orelse):
+                    raise _Unknown()
+                possible, certain = _test_hours(stmt.test, frozen)
+                if _exits_falsy(stmt.body) and not stmt.orelse and not any(map(_may_return_truthy, stmt.body)):
+                    window -= certain
+                elif _exits_falsy(stmt.orelse) or (not stmt.orelse and _exits_falsy(body[i + 1:i + 2])
+                                                   and i + 2 == len(body)):
+                    window &= possible
+                else:
+                    raise _Unknown()
+            elif isinstance(stmt, ast.Return) and stmt.value is not None and _mentions_hour(stmt.value, frozen):
+                possible, _ = _test_hours(stmt.value, frozen)
+                window &= possible
+            elif _mentions_hour(stmt, frozen):
+                raise _Unknown()
+            may_have_fired = may_have_fired or _may_return_truthy(stmt)
+    except _Unknown:
+        return _ALL_HOURS
+    return frozenset(window) if window else _ALL_HOURS
+
+
+def _code_fingerprint(machine: TriggerMachine) -> str:
+    cancel = machine.cancel_condition
+    parts = [machine.trigger_condition.generated_trigger_code, cancel.generated_cancel_code if cancel else ""]
+    normalized = []
+    for source in parts:
+        try:
+            normalized.append(ast.dump(ast.parse(source or "")))
+        except SyntaxError:
+            normalized.append(source or "")
+    return hashlib.sha1("\0".join(normalized).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class TriggerFeatures:
+    trigger_id: str
+    sensors: FrozenSet[str]
+    hours: FrozenSet[int]
+    terms: FrozenSet[str]
+    fingerprint: str
+
+
+@dataclass
+class TriggerMatch:
+    trigger_id: str
+    kind: str  # "duplicate" or "overlap"
+    score: float
+    shared_sensors: List[str] = field(default_factory=list)
+    shared_terms: List[str] = field(default_factory=list)
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TriggerIndex:
+    """
+    Inverted index over one home's TriggerMachines for spotting duplicate and
+    overlapping reminders.
+
+    Each trigger is indexed under the canonical paths of the sensors its code
+    reads, the hours it is restricted to (triggers that may fire at any hour
+    are not posted per hour) and the normalized terms of its actions. A lookup
+    only scores the triggers that share at least one sensor or term with the
+    candidate, so the cost grows with the size of those postings rather than
+    with the number of triggers in the home. Terms whose postings exceed
+    `max_posting` are too common to discriminate and are skipped when
+    gathering candidates.
+    """
+
+    def __init__(self, catalog: Optional[SensorCatalog] = None, max_posting: int = 256) -> None:
+        self.catalog = catalog or SensorCatalog.load()
+        self.activity_names = set(load_data_json("activities.json").get("activities", {}))
+        self.max_posting = max_posting
+        self._features: Dict[str, TriggerFeatures] = {}
+        self._by_sensor: Dict[str, Set[str]] = {}
+        self._by_term: Dict[str, Set[str]] = {}
+        self._by_hour: Dict[int, Set[str]] = {}
+        self._by_fingerprint: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def from_home(cls, home: HomeTriggerList, catalog: Optional[SensorCatalog] = None) -> "TriggerIndex":
+        index = cls(catalog)
+        for machine in home.TriggerMachines:
+            index.add(machine)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def __contains__(self, trigger_id: str) -> bool:
+        return trigger_id in self._features
+
+    def features(self, machine: TriggerMachine) -> TriggerFeatures:
+        cancel = machine.cancel_condition
+        trigger_code = machine.trigger_condition.generated_trigger_code
+        inputs = referenced_inputs(
+            [trigger_code, cancel.generated_cancel_code if cancel else ""],
+            self.catalog,
+            self.activity_names,
+        )
+        sensors = set()
+        for key in inputs.sensors:
+            sensor = self.catalog.resolve(key)
+            sensors.add(sensor.path if sensor is not None else key)
+        return TriggerFeatures(
+            trigger_id=machine.TriggerId,
+            sensors=frozenset(sensors),
+            hours=hour_window(trigger_code),
+            terms=frozenset(action_terms(machine)),
+            fingerprint=_code_fingerprint(machine),
+        )
+
+    def add(self, machine: TriggerMachine) -> TriggerFeatures:
+        self.remove(machine.TriggerId)
+        f = self.features(machine)
+        self._features[f.trigger_id] = f
+        for sensor in f.sensors:
+            self._by_sensor.setdefault(sensor, set()).add(f.trigger_id)
+        for term in f.terms:
+            self._by_term.setdefault(term, set()).add(f.trigger_id)
+        if f.hours != _ALL_HOURS:
+            for hour in f.hours:
+                self._by_hour.setdefault(hour, set()).add(f.trigger_id)
+        self._by_fingerprint.setdefault(f.fingerprint, set()).add(f.trigger_id)
+        return f
+
+    def remove(self, trigger_id: str) -> None:
+        f = self._features.pop(trigger_id, None)
+        if f is None:
+            return
+        for table, keys in (
+            (self._by_sensor, f.sensors),
+            (self._by_term, f.terms),
+            (self._by_hour, f.hours if f.hours != _ALL_HOURS else ()),
+            (self._by_fingerprint, (f.fingerprint,)),
+        ):
+            for key in keys:
+                ids = table.get(key)
+                if ids is not None:
+                    ids.discard(trigger_id)
+                    if not ids:
+                        del table[key]
+
+    def _score(self, a: TriggerFeatures, b: TriggerFeatures) -> float:
+        if a.fingerprint == b.fingerprint:
+            return 1.0
+        time_overlap = len(a.hours & b.hours) / min(len(a.hours), len(b.hours))
+        return time_overlap * (_SENSOR_WEIGHT * _jaccard(a.sensors, b.sensors) + _TEXT_WEIGHT * _jaccard(a.terms, b.terms))
+
+    def find_matches(
+        self,
+        machine: TriggerMachine,
+        min_score: float = OVERLAP_THRESHOLD,
+        limit: int = 5,
+    ) -> List[TriggerMatch]:
+        """
+        Indexed triggers that duplicate or overlap `machine`, best first.
+        The trigger itself (same TriggerId) is never reported.
+        """
+        f = self.features(machine)
+        candidates: Set[str] = set(self._by_fingerprint.get(f.fingerprint, ()))
+        for table, keys in ((self._by_sensor, f.sensors), (self._by_term, f.terms)):
+            for key in keys:
+                ids = table.get(key)
+                if ids and len(ids) <= self.max_posting:
+                    candidates |= ids
+        candidates.discard(f.trigger_id)
+        if f.hours != _ALL_HOURS:
+            # Triggers restricted to hours this one never fires in cannot overlap it.
+            same_hours: Set[str] = set()
+            for hour in f.hours:
+                same_hours |= self._by_hour.get(hour, set())
+            candidates = {c for c in candidates if c in same_hours or self._features[c].hours == _ALL_HOURS}
+
+        matches = []
+        for trigger_id in candidates:
+            other = self._features[trigger_id]
+            score = self._score(f, other)
+            if score < min_score:
+                continue
+            matches.append(TriggerMatch(
+                trigger_id=trigger_id,
+                kind="duplicate" if score >= DUPLICATE_THRESHOLD else "overlap",
+                score=round(score, 3),
+                shared_sensors=sorted(f.sensors & other.sensors),
+                shared_terms=sorted(f.terms & other.terms),
+            ))
+        matches.sort(key=lambda m: m.score, reverse=True)
+        return matches[:limit]
+
+    def find_duplicate(self, machine: TriggerMachine) -> Optional[TriggerMatch]:
+        matches = self.find_matches(machine, min_score=DUPLICATE_THRESHOLD, limit=1)
+        return matches[0] if matches else None
+
+
+if __name__ == "__main__":
+    import time
+
+    from trigger_pack import make_synthetic_home
+
+    base = make_synthetic_home(1).TriggerMachines[0]
+
+    # A guard clause and a positive check for the same window are duplicates.
+    header = "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n"
+    door = "sensor_data['contact'].get('/home/kitchen/fridge_door', 0) == 1"
+    guard = f"{header}    if time.hour < 8:\n        return False\n    return {door}\n"
+    positive = f"{header}    if time.hour >= 8:\n        return {door}\n    return False\n"
+    assert hour_window(guard) == hour_window(positive) == frozenset(range(8, 24))
+    check = TriggerIndex()
+    for trigger_id, code in (("guard", guard), ("positive", positive)):
+        check.add(base.model_copy(update={
+            "TriggerId": trigger_id,
+            "trigger_condition": base.trigger_condition.model_copy(update={"generated_trigger_code": code}),
+        }))
+    matches = check.find_matches(base.model_copy(update={
+        "TriggerId": "guard_again",
+        "trigger_condition": base.trigger_condition.model_copy(update={"generated_trigger_code": guard}),
+    }))
+    assert {m.trigger_id for m in matches if m.kind == "duplicate"} == {"guard", "positive"}, matches
+    print("[INDEX] guard-clause duplicates:", matches)
+
+    rooms = ["kitchen", "bedroom", "living_room", "bathroom", "dining_room"]
+    machines = []
+    for i in range(5000):
+        code = base.trigger_condition.generated_trigger_code.replace(
+            "/home/kitchen/fridge_door", f"/home/{rooms[i % 5]}/sensor_{i}"
+        )
+        machines.append(base.model_copy(update={
+            "TriggerId": f"trigger_{i}",
+            "trigger_condition": base.trigger_condition.model_copy(update={"generated_trigger_code": code}),
+            "cancel_condition": None,
+            "actions": [ReminderAction(title=f"task {i}", content=f"check device {i} in the {rooms[i % 5]}", priority=3)],
+        }))
+    index = TriggerIndex()
+    t0 = time.perf_counter()
+    for m in machines:
+        index.add(m)
+    print(f"[INDEX] indexed {len(index)} triggers in {time.perf_counter() - t0:.2f}s")
+
+    new = base.model_copy(update={
+        "TriggerId": "new",
+        "TriggerName": "fridge door left open",
+        "actions": [ReminderAction(title="Fridge door left open", content="Close the refrigerator", priority=4)],
+    })
+    index.add(base)
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        matches = index.find_matches(new)
+    print(f"[INDEX] lookup over {len(index)} triggers: {(time.perf_counter() - t0):.3f} ms avg ->", matches)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import ast
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from sensor_catalog import SensorCatalog
+
+
+MODALITIES = ("contact", "motion", "power")
+
+
+@dataclass
+class TriggerInputs:
+    """
+    What a trigger's code reads: sensor keys (by modality) and activity names.
+    """
+
+    sensors: Dict[str, str] = field(default_factory=dict)  # key -> modality
+    activities: Set[str] = field(default_factory=set)
+
+
+def referenced_inputs(sources: List[str], catalog: SensorCatalog, activity_names: Set[str]) -> TriggerInputs:
+    """
+    Collect the sensor ids/paths and activity names that appear as string
+    literals in the generated code. Unknown `/home/...` paths are kept; their
+    modality is taken from the `sensor_data['<modality>']` lookup they sit in.
+    """
+    inputs = TriggerInputs()
+    for source in sources:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                value = node.value
+                sensor = catalog.resolve(value)
+                if sensor is not None:
+                    inputs.sensors[value] = sensor.modality
+                elif value in activity_names:
+                    inputs.activities.add(value)
+            # sensor_data['contact'].get('/home/x', ...) or sensor_data['contact']['/home/x']
+            if isinstance(node, (ast.Call, ast.Subscript)):
+                inner = node.func.value if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) else (
+                    node.value if isinstance(node, ast.Subscript) else None
+                )
+                if isinstance(inner, ast.Subscript) and isinstance(inner.slice, ast.Constant):
+                    modality = inner.slice.value
+                    key_node = node.args[0] if isinstance(node, ast.Call) and node.args else (
+                        node.slice if isinstance(node, ast.Subscript) else None
+                    )
+                    if modality in MODALITIES and isinstance(key_node, ast.Constant) and isinstance(key_node.value, str):
+                        inputs.sensors.setdefault(key_node.value, modality)
+    return inputs
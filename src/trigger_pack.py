@@ -0,0 +1,274 @@
+"""
+Binary container for a HomeTriggerList.
+
+Layout (little-endian):
+
+    preamble   magic b"HTLP", u16 version, u16 flags, u32 header_len, u32 trigger_count
+    header     UTF-8 JSON of the HomeTriggerList fields except TriggerMachines
+    index      trigger_count x (u64 offset, u32 length, u16 id_len, id bytes)
+    body       each TriggerMachine as compact JSON, at `offset` from the body start
+
+The index lets a reader mmap the file and validate a single TriggerMachine
+without touching the others. Round-tripping through the pack is lossless.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from model_def import HomeTriggerList, TriggerMachine
+
+
+PACK_MAGIC = b"HTLP"
+PACK_VERSION = 1
+
+_PREAMBLE = struct.Struct("<4sHHII")
+_INDEX_ENTRY = struct.Struct("<QIH")
+
+
+def dumps_trigger_pack(home: HomeTriggerList) -> bytes:
+    header = home.model_dump_json(exclude={"TriggerMachines"}).encode("utf-8")
+
+    index_parts: List[bytes] = []
+    body_parts: List[bytes] = []
+    offset = 0
+    seen = set()
+    for machine in home.TriggerMachines:
+        if machine.TriggerId in seen:
+            raise ValueError(f"Duplicate TriggerId in pack: {machine.TriggerId}")
+        seen.add(machine.TriggerId)
+        trigger_id = machine.TriggerId.encode("utf-8")
+        blob = machine.model_dump_json().encode("utf-8")
+        index_parts.append(_INDEX_ENTRY.pack(offset, len(blob), len(trigger_id)) + trigger_id)
+        body_parts.append(blob)
+        offset += len(blob)
+
+    preamble = _PREAMBLE.pack(PACK_MAGIC, PACK_VERSION, 0, len(header), len(body_parts))
+    return b"".join([preamble, header, *index_parts, *body_parts])
+
+
+def write_trigger_pack(home: HomeTriggerList, path: str) -> None:
+    """
+    Write `home` to `path` atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps_trigger_pack(home))
+    os.replace(tmp_path, path)
+
+
+class TriggerPack:
+    """
+    Read-only view over a trigger pack, backed by mmap when opened from a file.
+
+    Only the preamble, header and index are parsed up front; each
+    TriggerMachine is validated the first time it is requested and cached.
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap], _file: Any = None) -> None:
+        self._buffer = buffer
+        self._file = _file
+        self._view = memoryview(buffer)
+        self._cache: Dict[str, TriggerMachine] = {}
+
+        if len(buffer) < _PREAMBLE.size:
+            raise ValueError("Not a trigger pack: file is truncated")
+        magic, version, _flags, header_len, count = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != PACK_MAGIC:
+            raise ValueError("Not a trigger pack: bad magic")
+        if version > PACK_VERSION:
+            raise ValueError(f"Unsupported trigger pack version {version} (max {PACK_VERSION})")
+        self.version = version
+
+        pos = _PREAMBLE.size
+        self.home_info: Dict[str, Any] = json.loads(bytes(self._view[pos:pos + header_len]))
+        pos += header_len
+
+        entries: List[Tuple[str, int, int]] = []
+        for _ in range(count):
+            offset, length, id_len = _INDEX_ENTRY.unpack_from(buffer, pos)
+            pos += _INDEX_ENTRY.size
+            trigger_id = bytes(self._view[pos:pos + id_len]).decode("utf-8")
+            pos += id_len
+            entries.append((trigger_id, offset, length))
+
+        self._index: Dict[str, Tuple[int, int]] = {
+            trigger_id: (pos + offset, length) for trigger_id, offset, length in entries
+        }
+
+    @classmethod
+    def open(cls, path: str) -> "TriggerPack":
+        f = open(path, "rb")
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files; let the constructor report it.
+            f.close()
+            return cls(b"")
+        return cls(buffer, _file=f)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TriggerPack":
+        return cls(data)
+
+    def close(self) -> None:
+        self._view.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "TriggerPack":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, trigger_id: str) -> bool:
+        return trigger_id in self._index
+
+    def __iter__(self) -> Iterator[TriggerMachine]:
+        for trigger_id in self._index:
+            yield self.get(trigger_id)
+
+    @property
+    def trigger_ids(self) -> List[str]:
+        return list(self._index)
+
+    def raw(self, trigger_id: str) -> bytes:
+        """
+        The stored JSON of one TriggerMachine, without validating it.
+        """
+        start, length = self._index[trigger_id]
+        return bytes(self._view[start:start + length])
+
+    def get(self, trigger_id: str) -> TriggerMachine:
+        machine = self._cache.get(trigger_id)
+        if machine is None:
+            machine = TriggerMachine.model_validate_json(self.raw(trigger_id))
+            self._cache[trigger_id] = machine
+        return machine
+
+    def to_home_trigger_list(self, trigger_ids: Optional[List[str]] = None) -> HomeTriggerList:
+        """
+        Materialize the full HomeTriggerList, or only the given triggers.
+        """
+        ids = self.trigger_ids if trigger_ids is None else trigger_ids
+        return HomeTriggerList(**self.home_info, TriggerMachines=[self.get(t) for t in ids])
+
+
+def json_to_pack(json_path: str, pack_path: str) -> None:
+    with open(json_path, "rb") as f:
+        home = HomeTriggerList.model_validate_json(f.read())
+    write_trigger_pack(home, pack_path)
+
+
+def pack_to_json(pack_path: str, json_path: str, indent: Optional[int] = 2) -> None:
+    with TriggerPack.open(pack_path) as pack:
+        json_str = pack.to_home_trigger_list().model_dump_json(indent=indent)
+    with open(json_path, "w") as f:
+        f.write(json_str)
+
+
+def make_synthetic_home(n_triggers: int) -> HomeTriggerList:
+    code = (
+        "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n"
+        "    contact_state = sensor_data['contact'].get('/home/kitchen/fridge_door', -1)\n"
+        "    state = blackboard.get('state', 0)\n"
+        "    if state == 0:\n"
+        "        if contact_state == 1:\n"
+        "            blackboard['state'] = 1\n"
+        "            blackboard['time'] = time\n"
+        "    elif state == 1:\n"
+        "        if time - blackboard['time'] > datetime.timedelta(seconds=5):\n"
+        "            return True\n"
+        "        if contact_state == 0:\n"
+        "            blackboard['state'] = 0\n"
+        "    return False\n"
+    )
+    cancel_code = (
+        "def reminder_cancel(time, sensor_data, activity_data, blackboard):\n"
+        "    return sensor_data['contact'].get('/home/kitchen/fridge_door', -1) != 1\n"
+    )
+    machines = [
+        {
+            "TriggerId": f"fridge_door_trigger_{i}",
+            "TriggerName": "fridge_door not closed",
+            "trigger_condition": {
+                "generated_trigger_code": code,
+                "recurrence": {"repeat": True, "details": None, "occurrence_frequency": "always"},
+            },
+            "cancel_condition": {"delay": 0, "generated_cancel_code": cancel_code},
+            "actions": [
+                {"type": "reminder", "title": "fridge door open", "content": "close the fridge door", "priority": 4},
+                {"type": "broadcast", "location": "kitchen", "eventName": "fridge_open",
+                 "topicName": "home/alerts", "payload": {"door": "fridge"}},
+            ],
+        }
+        for i in range(n_triggers)
+    ]
+    return HomeTriggerList.model_validate({
+        "home_id": "bench_home",
+        "new_day_start_time": "04:00:00",
+        "time_between_triggers": 60,
+        "TriggerMachines": machines,
+    })
+
+
+def benchmark_load(n_triggers: int = 500, repeat: int = 5) -> Dict[str, float]:
+    """
+    Compare cold-load cost of model_validate_json against the pack, in milliseconds.
+    """
+    import tempfile
+    import time
+
+    home = make_synthetic_home(n_triggers)
+    json_bytes = home.model_dump_json().encode("utf-8")
+
+    def _best(fn: Any) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "home.htlp")
+        write_trigger_pack(home, path)
+        one_id = home.TriggerMachines[n_triggers // 2].TriggerId
+
+        def _pack_open() -> None:
+            with TriggerPack.open(path):
+                pass
+
+        def _pack_one() -> None:
+            with TriggerPack.open(path) as pack:
+                pack.get(one_id)
+
+        def _pack_all() -> None:
+            with TriggerPack.open(path) as pack:
+                pack.to_home_trigger_list()
+
+        with TriggerPack.open(path) as pack:
+            assert pack.to_home_trigger_list() == home, "pack round-trip is not lossless"
+
+        return {
+            "model_validate_json_ms": _best(lambda: HomeTriggerList.model_validate_json(json_bytes)),
+            "pack_open_ms": _best(_pack_open),
+            "pack_open_and_get_one_ms": _best(_pack_one),
+            "pack_load_all_ms": _best(_pack_all),
+        }
+
+
+if __name__ == "__main__":
+    for n in (100, 500, 2000):
+        print(f"[PACK] {n} triggers:", benchmark_load(n))
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Set
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+class _TriggerStats:
+    __slots__ = ("calls", "sampled", "sampled_seconds", "samples", "exceptions", "fires", "cancels", "first_seen")
+
+    def __init__(self, window: int, now: float) -> None:
+        self.calls = 0
+        self.sampled = 0
+        self.sampled_seconds = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.exceptions: Dict[str, int] = {}
+        self.fires = 0
+        self.cancels = 0
+        self.first_seen = now
+
+
+@dataclass
+class TriggerProfile:
+    trigger_id: str
+    calls: int
+    sampled: int
+    est_total_ms: float
+    mean_us: float
+    p99_us: float
+    max_us: float
+    exceptions: Dict[str, int]
+    fires: int
+    cancels: int
+    fires_per_hour: float
+    status: str  # "ok", "flagged" or "quarantined"
+
+
+class TriggerProfiler:
+    """
+    Opt-in, sampling profiler for TriggerRuntime.
+
+    Every call is counted, but only one in `sample_every` calls per trigger is
+    timed, so the cost on the hot path is a counter increment for most calls.
+    The last `window` timings per trigger give the p99; cumulative time is
+    extrapolated from the sampled mean. Exceptions, fires and cancels are
+    always counted. Fire rates are per hour of simulated/runtime clock.
+    With a SandboxPool the workers time every call and the runtime passes
+    the timings on through record_calls().
+
+    Once a trigger has at least `min_samples` timings and its p99 is over
+    `budget_us`, it is flagged; with `quarantine=True` the runtime also stops
+    evaluating it until release() is called.
+    """
+
+    def __init__(
+        self,
+        sample_every: int = 16,
+        window: int = 1024,
+        budget_us: float = 500.0,
+        min_samples: int = 32,
+        quarantine: bool = False,
+    ) -> None:
+        self.sample_every = max(1, sample_every)
+        self.window = window
+        self.budget_us = budget_us
+        self.min_samples = min_samples
+        self.quarantine = quarantine
+        self.flagged: Set[str] = set()
+        self.quarantined: Set[str] = set()
+        self._stats: Dict[str, _TriggerStats] = {}
+        self._clock_start: Optional[float] = None
+        self._clock_now: Optional[float] = None
+
+    def _get(self, trigger_id: str) -> _TriggerStats:
+        stats = self._stats.get(trigger_id)
+        if stats is None:
+            stats = _TriggerStats(self.window, self._clock_now or 0.0)
+            self._stats[trigger_id] = stats
+        return stats
+
+    def tick(self, now_ts: float) -> None:
+        if self._clock_start is None:
+            self._clock_start = now_ts
+        self._clock_now = now_ts
+
+    def call(
+        self,
+        trigger_id: str,
+        fn: Any,
+        time_: Any,
+        sensor_data: Dict[str, Any],
+        activity_data: Optional[Dict[str, Any]],
+        blackboard: Any,
+    ) -> Any:
+        """
+        Call a generated function for `trigger_id`, timing it if this call is
+        sampled. Exceptions are counted and re-raised.
+        """
+        stats = self._stats.get(trigger_id) or self._get(trigger_id)
+        stats.calls += 1
+        sampled = not stats.calls % self.sample_every
+        t0 = time.perf_counter() if sampled else 0.0
+        try:
+            return fn(time=time_, sensor_data=sensor_data, activity_data=activity_data, blackboard=blackboard)
+        except Exception as exc:
+            name = type(exc).__name__
+            stats.exceptions[name] = stats.exceptions.get(name, 0) + 1
+            raise
+        finally:
+            if sampled:
+                elapsed = time.perf_counter() - t0
+                stats.sampled += 1
+                stats.sampled_seconds += elapsed
+                stats.samples.append(elapsed)
+                if stats.sampled % self.min_samples == 0:
+                    self._check_budget(trigger_id, stats)
+
+    def record_calls(self, trigger_id: str, seconds: List[float], error: Optional[str] = None) -> None:
+        """
+        Account for calls timed elsewhere (in a SandboxPool worker), one
+        duration per call. Timing cost nothing here, so every one is kept.
+        `error` is the "Name: message" of a call that failed.
+        """
+        stats = self._stats.get(trigger_id) or self._get(trigger_id)
+        stats.calls += len(seconds)
+        for elapsed in seconds:
+            stats.sampled += 1
+            stats.sampled_seconds += elapsed
+            stats.samples.append(elapsed)
+            if stats.sampled % self.min_samples == 0:
+                self._check_budget(trigger_id, stats)
+        if error is not None:
+            name = error.split(":", 1)[0]
+            stats.exceptions[name] = stats.exceptions.get(name, 0) + 1
+
+    def _check_budget(self, trigger_id: str, stats: _TriggerStats) -> None:
+        p99_us = _percentile(sorted(stats.samples), 0.99) * 1e6
+        if p99_us <= self.budget_us or trigger_id in self.flagged:
+            return
+        self.flagged.add(trigger_id)
+        if self.quarantine:
+            self.quarantined.add(trigger_id)
+        print(f"[PROFILER] {trigger_id} p99 {p99_us:.0f}us over budget {self.budget_us:.0f}us"
+              + (" - quarantined" if self.quarantine else ""))
+
+    def record_fire(self, trigger_id: str) -> None:
+        self._get(trigger_id).fires += 1
+
+    def record_cancel(self, trigger_id: str) -> None:
+        self._get(trigger_id).cancels += 1
+
+    def is_quarantined(self, trigger_id: str) -> bool:
+        return trigger_id in self.quarantined
+
+    def release(self, trigger_id: str) -> None:
+        """
+        Lift a quarantine and start measuring the trigger afresh.
+        """
+        self.quarantined.discard(trigger_id)
+        self.flagged.discard(trigger_id)
+        self._stats.pop(trigger_id, None)
+
+    def profile(self, trigger_id: str) -> Optional[TriggerProfile]:
+        stats = self._stats.get(trigger_id)
+        if stats is None:
+            return None
+        samples = sorted(stats.samples)
+        mean = stats.sampled_seconds / stats.sampled if stats.sampled else 0.0
+        hours = ((self._clock_now or 0.0) - stats.first_seen) / 3600.0
+        if trigger_id in self.quarantined:
+            status = "quarantined"
+        elif trigger_id in self.flagged:
+            status = "flagged"
+        else:
+            status = "ok"
+        return TriggerProfile(
+            trigger_id=trigger_id,
+            calls=stats.calls,
+            sampled=stats.sampled,
+            est_total_ms=mean * stats.calls * 1000,
+            mean_us=mean * 1e6,
+            p99_us=_percentile(samples, 0.99) * 1e6,
+            max_us=(samples[-1] if samples else 0.0) * 1e6,
+            exceptions=dict(stats.exceptions),
+            fires=stats.fires,
+            cancels=stats.cancels,
+            fires_per_hour=stats.fires / hours if hours > 0 else 0.0,
+            status=status,
+        )
+
+    def report(self, top: Optional[int] = None) -> List[TriggerProfile]:
+        """
+        Profiles of every trigger seen, most expensive (estimated total time) first.
+        """
+        profiles = [p for p in (self.profile(t) for t in self._stats) if p is not None]
+        profiles.sort(key=lambda p: p.est_total_ms, reverse=True)
+        return profiles[:top] if top else profiles
+
+    def format_report(self, top: int = 20) -> str:
+        lines = [f"{'trigger':<32} {'calls':>9} {'total ms':>10} {'p99 us':>9} {'exc':>5} {'fires/h':>8}  status"]
+        for p in self.report(top):
+            lines.append(
+                f"{p.trigger_id[:32]:<32} {p.calls:>9} {p.est_total_ms:>10.1f} {p.p99_us:>9.1f} "
+                f"{sum(p.exceptions.values()):>5} {p.fires_per_hour:>8.1f}  {p.status}"
+            )
+        return "\n".join(lines)
+
+    def metrics(self) -> Dict[str, float]:
+        profiles = self.report()
+        return {
+            "triggers": len(profiles),
+            "calls": sum(p.calls for p in profiles),
+            "exceptions": sum(sum(p.exceptions.values()) for p in profiles),
+            "est_total_ms": sum(p.est_total_ms for p in profiles),
+            "worst_p99_us": max((p.p99_us for p in profiles), default=0.0),
+            "flagged": len(self.flagged),
+            "quarantined": len(self.quarantined),
+        }
+
+
+if __name__ == "__main__":
+    import datetime
+
+    from model_def import HomeTriggerList
+    from trigger_pack import make_synthetic_home
+    from trigger_runtime import TriggerRuntime
+
+    start = datetime.datetime(2025, 11, 24, tzinfo=datetime.timezone.utc)
+
+    def _run(home: HomeTriggerList, profiler: Optional[TriggerProfiler], n_ticks: int = 2000) -> float:
+        runtime = TriggerRuntime(home, profiler=profiler)
+        t0 = time.perf_counter()
+        for i in range(n_ticks):
+            door = 1 if (i // 20) % 2 else 0
+            runtime.tick(start + datetime.timedelta(seconds=i), {"contact": {"/home/kitchen/fridge_door": door}})
+        return time.perf_counter() - t0
+
+    home = make_synthetic_home(50)
+    off = min(_run(home, None) for _ in range(3))
+    on = min(_run(home, TriggerProfiler()) for _ in range(3))
+    print(f"[PROFILER] 2000 ticks x 50 triggers: off {off:.3f}s, on {on:.3f}s "
+          f"(~{(on - off) / (2000 * 50) * 1e9:.0f} ns per trigger evaluation)")
+
+    data = home.model_dump()
+    data["TriggerMachines"][0]["TriggerId"] = "slow_trigger"
+    data["TriggerMachines"][0]["trigger_condition"]["generated_trigger_code"] = (
+        "def reminder_trigger(time, sensor_data, activity_data, blackboard):\n"
+        "    return sum(i * i for i in range(20000)) < 0\n"
+    )
+    profiler = TriggerProfiler(quarantine=True)
+    _run(HomeTriggerList.model_validate(data), profiler)
+    print(profiler.format_report(5))
+    print("[PROFILER]", profiler.metrics())
@@ -0,0 +1,406 @@
+from __future__ import annotations
+
+import datetime
+import types
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from blackboard_store import Blackboard, BlackboardStore
+from model_def import HomeTriggerList, OccurrenceFrequency, TriggerMachine
+from sensor_history import SensorHistory
+from time_windows import default_windows
+from trigger_profiler import TriggerProfiler
+
+if TYPE_CHECKING:
+    from audit_log import AuditLog
+    from sandbox_pool import SandboxPool
+    from trigger_index import TriggerIndex, TriggerMatch
+
+
+GeneratedFunction = Callable[..., Any]
+
+# Names the code-generation prompt asks for; other names are accepted as a fallback.
+TRIGGER_FUNCTION_NAME = "reminder_trigger"
+CANCEL_FUNCTION_NAME = "reminder_cancel"
+
+# Runtime bookkeeping is persisted next to the trigger's own blackboard so an
+# active reminder (and its recurrence cooldown) survives a restart too.
+_RUNTIME_KEY_SUFFIX = "#runtime"
+# Runtime key holding actions merged in from duplicate triggers, re-applied
+# when the trigger is added again after a restart.
+_MERGED_ACTIONS_KEY = "merged_actions"
+
+
+def compile_generated_code(
+    source: str,
+    preferred_name: Optional[str] = None,
+    filename: str = "<generated>",
+    extra_globals: Optional[Dict[str, Any]] = None,
+) -> GeneratedFunction:
+    """
+    Compile LLM-generated source that defines a single function and return it.
+    The function runs with `datetime` available, as the generated code expects,
+    and `windows`, the user's compiled time windows (overridable through
+    extra_globals).
+    """
+    namespace: Dict[str, Any] = {"datetime": datetime, "windows": default_windows()}
+    if extra_globals:
+        namespace.update(extra_globals)
+    exec(compile(source, filename, "exec"), namespace)
+
+    if preferred_name and isinstance(namespace.get(preferred_name), types.FunctionType):
+        return namespace[preferred_name]
+    for value in namespace.values():
+        if isinstance(value, types.FunctionType) and value.__globals__ is namespace:
+            return value
+    raise ValueError(f"No function definition found in generated code ({filename})")
+
+
+class DuplicateTriggerError(ValueError):
+    """
+    Raised by TriggerRuntime.add_trigger when a new trigger duplicates an
+    existing one and the duplicate policy is "reject".
+    """
+
+    def __init__(self, trigger_id: str, match: "TriggerMatch") -> None:
+        super().__init__(f"{trigger_id} duplicates {match.trigger_id} (score {match.score})")
+        self.trigger_id = trigger_id
+        self.match = match
+
+
+@dataclass
+class TriggerEvent:
+    """
+    A trigger transition observed during a tick.
+    """
+
+    kind: str  # "fire" or "cancel"
+    trigger_id: str
+    time: datetime.datetime
+    actions: List[Any] = field(default_factory=list)
+
+
+class _TriggerSlot:
+    __slots__ = (
+        "machine", "trigger_fn", "cancel_fn", "has_cancel", "blackboard", "runtime", "errors",
+        "frequency", "cancel_delay",
+    )
+
+    def __init__(
+        self,
+        machine: TriggerMachine,
+        trigger_fn: Optional[GeneratedFunction],
+        cancel_fn: Optional[GeneratedFunction],
+        blackboard: Blackboard,
+        runtime: Blackboard,
+    ) -> None:
+        self.machine = machine
+        # Both None when the code runs in a SandboxPool instead.
+        self.trigger_fn = trigger_fn
+        self.cancel_fn = cancel_fn
+        cancel = machine.cancel_condition
+        self.has_cancel = bool(cancel is not None and cancel.generated_cancel_code)
+        self.blackboard = blackboard
+        # runtime['state'] = 1 while a fired reminder awaits cancellation,
+        # runtime['time'] = when it fired; extras hold last fire time / count.
+        self.runtime = runtime
+        self.errors = 0
+        self.frequency = machine.trigger_condition.recurrence.occurrence_frequency
+        self.cancel_delay = datetime.timedelta(seconds=cancel.delay if cancel else 0)
+
+
+class TriggerRuntime:
+    """
+    Evaluates the TriggerMachines of one home on every tick.
+
+    Each tick calls the generated trigger code with
+    (time, sensor_data, activity_data, blackboard) and applies the machine's
+    recurrence rules; once fired, the cancel code is polled after
+    cancel_condition.delay seconds until it returns True. Blackboards come from
+    a BlackboardStore, so restoring the store restores in-flight state machines.
+
+    Every tick's sensor_data is also recorded into a SensorHistory, which the
+    generated code can query through the global `history`.
+
+    With a TriggerProfiler, calls go through it for sampled per-trigger timing
+    and counts, and triggers it quarantines are skipped.
+
+    With a SandboxPool, the generated code is never executed in this process:
+    each tick's calls are batched out to the pool's worker processes and the
+    blackboards they return are applied here.
+
+    With a TriggerIndex, add_trigger() checks new triggers for duplicates of
+    ones already running: "merge" folds the new trigger's actions into the
+    existing trigger (re-indexed, and kept in its persisted runtime state so
+    the merge survives a restart), "reject" raises DuplicateTriggerError.
+
+    With an AuditLog, every fire and cancel is recorded there.
+    """
+
+    def __init__(
+        self,
+        home: HomeTriggerList,
+        blackboards: Optional[BlackboardStore] = None,
+        extra_globals: Optional[Dict[str, Any]] = None,
+        history: Optional[SensorHistory] = None,
+        profiler: Optional[TriggerProfiler] = None,
+        sandbox: Optional["SandboxPool"] = None,
+        duplicates: Optional["TriggerIndex"] = None,
+        duplicate_policy: str = "merge",
+        audit: Optional["AuditLog"] = None,
+    ) -> None:
+        if duplicate_policy not in ("merge", "reject"):
+            raise ValueError(f"Unknown duplicate policy: {duplicate_policy}")
+        self.home = home
+        self.profiler = profiler
+        self.sandbox = sandbox
+        self.duplicates = duplicates
+        self.duplicate_policy = duplicate_policy
+        self.audit = audit
+        self.blackboards = (
+            blackboards if blackboards is not None
+            else BlackboardStore(db_path=None, home_id=home.home_id)
+        )
+        self.history = history if history is not None else SensorHistory()
+        self.extra_globals = {"history": self.history, **(extra_globals or {})}
+        start = home.new_day_start_time
+        self._day_offset = datetime.timedelta(
+            hours=start.hour, minutes=start.minute, seconds=start.second
+        )
+        self._slots: Dict[str, _TriggerSlot] = {}
+        for machine in home.TriggerMachines:
+            self.add_trigger(machine)
+
+    @property
+    def trigger_ids(self) -> List[str]:
+        return list(self._slots)
+
+    def _sandbox_key(self, trigger_id: str) -> str:
+        return f"{self.home.home_id}/{trigger_id}"
+
+    def _merge_into(self, trigger_id: str, machine: TriggerMachine) -> None:
+        slot = self._slots[trigger_id]
+        added = [a for a in machine.actions if a not in slot.machine.actions]
+        if added:
+            slot.machine = slot.machine.model_copy(update={"actions": list(slot.machine.actions) + added})
+            slot.runtime[_MERGED_ACTIONS_KEY] = (
+                list(slot.runtime.get(_MERGED_ACTIONS_KEY) or []) + [a.model_dump(mode="json") for a in added]
+            )
+            if self.duplicates is not None:
+                self.duplicates.add(slot.machine)
+        if self.home.print_debug_info:
+            print(f"[RUNTIME] merged {machine.TriggerId} into {trigger_id}")
+
+    def add_trigger(self, machine: TriggerMachine) -> str:
+        """
+        Compile and start evaluating a trigger. Returns the id it runs under,
+        which is the existing trigger's id when a duplicate was merged.
+        """
+        trigger_id = machine.TriggerId
+        if self.duplicates is not None and trigger_id not in self._slots:
+            match = self.duplicates.find_duplicate(machine)
+            if match is not None and match.trigger_id in self._slots:
+                if self.duplicate_policy == "reject":
+                    raise DuplicateTriggerError(trigger_id, match)
+                self._merge_into(match.trigger_id, machine)
+                return match.trigger_id
+        runtime = self.blackboards.get(trigger_id + _RUNTIME_KEY_SUFFIX)
+        merged = runtime.get(_MERGED_ACTIONS_KEY)
+        if merged:
+            restored = TriggerMachine.model_validate({**machine.model_dump(), "actions": merged})
+            actions = list(machine.actions)
+            actions.extend(a for a in restored.actions if a not in actions)
+            machine = machine.model_copy(update={"actions": actions})
+        cancel = machine.cancel_condition
+        cancel_src = cancel.generated_cancel_code if cancel is not None else None
+        trigger_fn = cancel_fn = None
+        if self.sandbox is not None:
+            self.sandbox.load(
+                self._sandbox_key(trigger_id),
+                machine.trigger_condition.generated_trigger_code,
+                cancel_src or None,
+            )
+        else:
+            trigger_fn = compile_generated_code(
+                machine.trigger_condition.generated_trigger_code,
+                TRIGGER_FUNCTION_NAME,
+                filename=f"<{trigger_id}:trigger>",
+                extra_globals=self.extra_globals,
+            )
+            if cancel_src:
+                cancel_fn = compile_generated_code(
+                    cancel_src,
+                    CANCEL_FUNCTION_NAME,
+                    filename=f"<{trigger_id}:cancel>",
+                    extra_globals=self.extra_globals,
+                )
+        self._slots[trigger_id] = _TriggerSlot(
+            machine,
+            trigger_fn,
+            cancel_fn,
+            self.blackboards.get(trigger_id),
+            runtime,
+        )
+        if self.duplicates is not None:
+            self.duplicates.add(machine)
+        return trigger_id
+
+    def remove_trigger(self, trigger_id: str) -> None:
+        if self._slots.pop(trigger_id, None) is not None:
+            self.blackboards.discard(trigger_id)
+            self.blackboards.discard(trigger_id + _RUNTIME_KEY_SUFFIX)
+            if self.sandbox is not None:
+                self.sandbox.unload(self._sandbox_key(trigger_id))
+            if self.duplicates is not None:
+                self.duplicates.remove(trigger_id)
+
+    def _day_key(self, t: datetime.datetime) -> datetime.date:
+        return (t - self._day_offset).date()
+
+    def _may_fire(self, slot: _TriggerSlot, now: datetime.datetime) -> bool:
+        runtime = slot.runtime
+        if runtime.get("state", 0):
+            return False
+        last = runtime.get("last_fired_at")
+        if last is None:
+            return True
+
+        freq = slot.frequency
+        if freq == OccurrenceFrequency.once:
+            return False
+        if freq == OccurrenceFrequency.once_per_day:
+            return self._day_key(last) != self._day_key(now)
+        if freq == OccurrenceFrequency.delay:
+            recurrence = slot.machine.trigger_condition.recurrence
+            delay = (recurrence.details.delay if recurrence.details else None) or 0
+            return now - last >= datetime.timedelta(seconds=delay)
+        return True
+
+    def _call(
+        self,
+        slot: _TriggerSlot,
+        fn: GeneratedFunction,
+        now: datetime.datetime,
+        sensor_data: Dict[str, Any],
+        activity_data: Optional[Dict[str, Any]],
+    ) -> bool:
+        try:
+            if self.profiler is not None:
+                return bool(self.profiler.call(
+                    slot.machine.TriggerId, fn, now, sensor_data, activity_data, slot.blackboard
+                ))
+            return bool(fn(
+                time=now,
+                sensor_data=sensor_data,
+                activity_data=activity_data,
+                blackboard=slot.blackboard,
+            ))
+        except Exception as exc:
+            self._error(slot, f"{type(exc).__name__}: {exc}")
+            return False
+
+    def _error(self, slot: _TriggerSlot, message: str) -> None:
+        slot.errors += 1
+        if self.home.print_debug_info:
+            print(f"[RUNTIME] {slot.machine.TriggerId} raised {message}")
+
+    def _wants_cancel(self, slot: _TriggerSlot, now: datetime.datetime) -> bool:
+        runtime = slot.runtime
+        return bool(runtime.get("state", 0)) and now - runtime["time"] >= slot.cancel_delay
+
+    def _wants_trigger(self, slot: _TriggerSlot) -> bool:
+        return not (slot.frequency == OccurrenceFrequency.once and "last_fired_at" in slot.runtime)
+
+    def _apply(
+        self,
+        trigger_id: str,
+        slot: _TriggerSlot,
+        now: datetime.datetime,
+        cancelled: bool,
+        fired: bool,
+        events: List[TriggerEvent],
+    ) -> None:
+        runtime = slot.runtime
+        profiler = self.profiler
+        if cancelled:
+            runtime["state"] = 0
+            events.append(TriggerEvent("cancel", trigger_id, now))
+            if profiler is not None:
+                profiler.record_cancel(trigger_id)
+        if fired and self._may_fire(slot, now):
+            # Without cancel code a fire is a one-shot notification.
+            runtime["state"] = 1 if slot.has_cancel else 0
+            runtime["time"] = now
+            runtime["last_fired_at"] = now
+            runtime["fire_count"] = runtime.get("fire_count", 0) + 1
+            events.append(TriggerEvent("fire", trigger_id, now, list(slot.machine.actions)))
+            if profiler is not None:
+                profiler.record_fire(trigger_id)
+
+    def _tick_sandboxed(
+        self,
+        now: datetime.datetime,
+        sensor_data: Dict[str, Any],
+        activity_data: Optional[Dict[str, Any]],
+        events: List[TriggerEvent],
+    ) -> None:
+        pending = []
+        items = []
+        for trigger_id, slot in self._slots.items():
+            if self.profiler is not None and trigger_id in self.profiler.quarantined:
+                continue
+            do_cancel = self._wants_cancel(slot, now)
+            do_trigger = self._wants_trigger(slot)
+            if not (do_cancel or do_trigger):
+                continue
+            pending.append((trigger_id, slot))
+            items.append((self._sandbox_key(trigger_id), do_cancel, do_trigger, slot.blackboard.to_dict()))
+        if not items:
+            return
+        results = self.sandbox.evaluate(self.home.home_id, now, sensor_data, activity_data, items)
+        profiler = self.profiler
+        for (trigger_id, slot), (cancelled, fired, board, error, seconds) in zip(pending, results):
+            if board is not None:
+                slot.blackboard.clear()
+                slot.blackboard.update(board)
+            if profiler is not None:
+                profiler.record_calls(trigger_id, seconds, error)
+            if error is not None:
+                self._error(slot, error)
+            self._apply(trigger_id, slot, now, cancelled, fired, events)
+
+    def tick(
+        self,
+        now: datetime.datetime,
+        sensor_data: Dict[str, Any],
+        activity_data: Optional[Dict[str, Any]] = None,
+    ) -> List[TriggerEvent]:
+        """
+        Evaluate every trigger once at time `now` and return the fires and cancels.
+        """
+        self.history.observe(sensor_data, now)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.tick(now.timestamp())
+        events: List[TriggerEvent] = []
+        if self.sandbox is not None:
+            self._tick_sandboxed(now, sensor_data, activity_data, events)
+        else:
+            for trigger_id, slot in self._slots.items():
+                if profiler is not None and trigger_id in profiler.quarantined:
+                    continue
+                cancelled = self._wants_cancel(slot, now) and self._call(
+                    slot, slot.cancel_fn, now, sensor_data, activity_data
+                )
+                fired = self._wants_trigger(slot) and self._call(
+                    slot, slot.trigger_fn, now, sensor_data, activity_data
+                )
+                self._apply(trigger_id, slot, now, cancelled, fired, events)
+
+        if self.audit is not None:
+            for event in events:
+                self.audit.log_event(self.home.home_id, event)
+        if self.home.print_debug_info:
+            for event in events:
+                print(f"[RUNTIME] {event.time.isoformat()} {event.kind} {event.trigger_id}")
+        return events